@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+"""Runs the transfer log report for many projects in a single process,
+sharing one authenticated Flywheel client between a pool of workers
+"""
+import argparse
+import concurrent.futures
+import csv
+import logging
+import os
+import re
+
+import flywheel
+import yaml
+
+import transfer_log
+import utils
+
+log = logging.getLogger('grp-5_transfer_log_report')
+
+MANIFEST_KEYS = [
+    'project',
+    'transfer_log',
+    'template'
+]
+
+SUMMARY_HEADERS = [
+    'project',
+    'transfer_log',
+    'template',
+    'status',
+    'error_count',
+    'report',
+    'message'
+]
+
+
+def load_batch_manifest(manifest_path):
+    """Loads the list of projects to validate from a yaml or csv manifest
+
+    Each entry names the resolver path of the project, the transfer log and
+    the template. Relative file paths are resolved against the directory of
+    the manifest.
+
+    Args:
+        manifest_path (str): Path to the manifest file
+
+    Returns:
+        list: list of dicts with the keys in MANIFEST_KEYS
+    """
+    extension = os.path.splitext(manifest_path)[1]
+    if extension in ['.yml', '.yaml']:
+        with open(manifest_path, 'r') as fp:
+            entries = yaml.load(fp, Loader=yaml.SafeLoader) or []
+    elif extension == '.csv':
+        with open(manifest_path, 'r') as fp:
+            entries = list(csv.DictReader(fp))
+    else:
+        raise ValueError('Manifest filetype "{}" not supported'.format(extension))
+
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    for index, entry in enumerate(entries):
+        missing_keys = [key for key in MANIFEST_KEYS if not entry.get(key)]
+        if missing_keys:
+            raise ValueError('Manifest entry {} is missing {}'.format(
+                index + 1, ', '.join(missing_keys)
+            ))
+        # Path may be fw://<group_id>/<project_label>
+        entry['project'] = entry['project'].split('//')[-1]
+        for key in ['transfer_log', 'template']:
+            entry[key] = os.path.join(manifest_dir, entry[key])
+    return entries
+
+
+def get_report_filename(project_path, suffix):
+    """Builds a filesystem-safe report name for a project resolver path"""
+    project_slug = re.sub(r'[^A-Za-z0-9._-]+', '_', project_path)
+    return '{}-{}'.format(project_slug, suffix)
+
+
+def run_batch_entry(fw_client, entry, output_dir, log_level='INFO',
+                    case_insensitive=False, match_containers_once=False,
+                    entry_index=0):
+    """Validates the transfer log of a single manifest entry and writes its
+        report to output_dir
+
+    Args:
+        fw_client (flywheel.Client): an instance of the flywheel client
+        entry (dict): a manifest entry as returned by load_batch_manifest
+        output_dir (str): directory in which to write the report
+        log_level (str|int): A logging level (DEBUG, INFO) or int (10, 50)
+        case_insensitive (bool): default for entries that do not set it
+        match_containers_once (bool): default for entries that do not set it
+        entry_index (int): position of the entry in the manifest, which keeps
+            the checkpoints of entries of the same project apart
+
+    Returns:
+        dict: a summary row with the keys in SUMMARY_HEADERS
+    """
+    summary = {key: entry.get(key) for key in MANIFEST_KEYS}
+    gear_context_dict = {
+        'client': fw_client,
+        'template': entry['template'],
+        'transfer_log': entry['transfer_log'],
+        'case_insensitive': entry.get('case_insensitive', case_insensitive),
+        'match_containers_once': entry.get(
+            'match_containers_once', match_containers_once
+        )
+    }
+    report_path = os.path.join(
+        output_dir,
+        get_report_filename(entry['project'], 'transfer-log-error-report.csv')
+    )
+    # Rerunning the batch resumes interrupted fetches
+    gear_context_dict['checkpoint'] = os.path.join(
+        output_dir,
+        get_report_filename(
+            entry['project'], '{}-fetch-checkpoint.jsonl'.format(entry_index)
+        )
+    )
+    try:
+        _, error_count = transfer_log.main(
+            gear_context_dict, log_level, entry['project'],
+            output_path=report_path
+        )
+    except transfer_log.TransferLogException as exc:
+        report_path = os.path.join(
+            output_dir,
+            get_report_filename(entry['project'], 'error-transfer-log.csv')
+        )
+        transfer_log.create_output_file(exc.errors, report_path,
+                                        validate_transfer_log=True)
+        summary.update(status='malformed', report=report_path, message=str(exc))
+        return summary
+    except Exception as exc:
+        log.exception('Transfer log report failed for %s', entry['project'])
+        summary.update(status='failed', message=str(exc))
+        return summary
+
+    summary.update(status='complete', error_count=error_count,
+                   report=report_path)
+    return summary
+
+
+def run_batch(fw_client, entries, output_dir, workers=4, log_level='INFO',
+              case_insensitive=False, match_containers_once=False):
+    """Runs every manifest entry across a pool of worker threads and writes
+        batch-summary.csv to output_dir
+
+    The workers share fw_client, so authentication and imports are paid once
+    and requests are served from one connection pool sized to the workers.
+
+    Args:
+        fw_client (flywheel.Client): an instance of the flywheel client
+        entries (list): manifest entries as returned by load_batch_manifest
+        output_dir (str): directory in which to write the reports
+        workers (int): number of projects to validate concurrently
+        log_level (str|int): A logging level (DEBUG, INFO) or int (10, 50)
+        case_insensitive (bool): default for entries that do not set it
+        match_containers_once (bool): default for entries that do not set it
+
+    Returns:
+        list: list of summary dicts, in manifest order
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    utils.configure_connection_pool(fw_client, workers)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                run_batch_entry, fw_client, entry, output_dir, log_level,
+                case_insensitive, match_containers_once, index
+            ) for index, entry in enumerate(entries)
+        ]
+        summaries = [future.result() for future in futures]
+
+    summary_path = os.path.join(output_dir, 'batch-summary.csv')
+    transfer_log.create_output_file(summaries, summary_path,
+                                    headers=SUMMARY_HEADERS)
+    log.info('Wrote batch summary with filename %s', summary_path)
+    return summaries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('manifest',
+                        help='YAML or csv file listing project, transfer_log and template')
+    parser.add_argument('--output-dir', '-o', default='.',
+                        help='Directory for the per-project reports and summary')
+    parser.add_argument('--workers', '-j', type=int, default=4,
+                        help='Number of projects to validate concurrently')
+    parser.add_argument('--case_insensitive', action='store_true')
+    parser.add_argument('--match-once', action='store_true',
+                        help='Do not log errors for multiple container files matching fw row')
+    parser.add_argument('--verbose', '-v', action='store_true')
+    parser.add_argument('--api-key', help='Use if not logged in via cli')
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    if args.api_key:
+        fw = flywheel.Client(args.api_key)
+    else:
+        fw = flywheel.Client()
+
+    batch_entries = load_batch_manifest(args.manifest)
+    batch_summaries = run_batch(
+        fw, batch_entries, args.output_dir, workers=args.workers,
+        log_level='DEBUG' if args.verbose else 'INFO',
+        case_insensitive=args.case_insensitive,
+        match_containers_once=args.match_once
+    )
+    failed = [row for row in batch_summaries if row['status'] != 'complete']
+    if failed:
+        raise SystemExit('{} of {} projects did not complete'.format(
+            len(failed), len(batch_summaries)
+        ))
@@ -0,0 +1,242 @@
+"""Keeps the errors of every transfer log run in a sqlite database, so each
+run can report which errors are new, still open or resolved since the last run
+"""
+import datetime
+import json
+import logging
+import sqlite3
+
+import utils
+
+pd = utils.lazy_import('pandas')
+
+log = logging.getLogger('grp-5_transfer_log_report')
+
+NEW_STATUS = 'new'
+OPEN_STATUS = 'open'
+RESOLVED_STATUS = 'resolved'
+
+# Keys looked up per query, below sqlite's limit on query parameters
+LOOKUP_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS errors (
+    error_key TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    first_seen_run INTEGER NOT NULL,
+    opened_run INTEGER NOT NULL,
+    last_seen_run INTEGER NOT NULL,
+    resolved_run INTEGER,
+    error_code INTEGER,
+    report_row TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS errors_by_status ON errors (status, last_seen_run);
+"""
+
+
+def get_error_key(row_values, key_columns):
+    """
+    Identifies an error across runs by its match values and Flywheel id
+
+    Args:
+        row_values (dict): the values of an error report row
+        key_columns (list): the columns of the key
+
+    Returns:
+        str: the json list of the key column values
+    """
+    return json.dumps([format_json_value(row_values.get(column)) for column in key_columns])
+
+
+def format_json_value(value):
+    """Converts missing values to None and numpy scalars to python values"""
+    if isinstance(value, list):
+        return [format_json_value(item) for item in value]
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+class ErrorStateStore(object):
+    """
+    sqlite database of the errors of previous runs, indexed by error key
+
+    Args:
+        path (str): path of the sqlite database, created if missing
+        key_columns (list): the report columns identifying an error, the
+            match columns and flywheel_id (and source_log for several logs)
+        untracked_error_codes (iterable): error codes of report rows that are
+            not errors, such as subjects a partial run did not reach. They are
+            passed through without being recorded
+
+    Attributes:
+        path (str): path of the sqlite database
+        key_columns (list): the report columns identifying an error
+        untracked_error_codes (frozenset): error codes that are not recorded
+        run_id (int): id of the current run, set by open
+        status_counts (dict): number of new, open and resolved errors of the
+            current run
+    """
+
+    def __init__(self, path, key_columns, untracked_error_codes=()):
+        self.path = path
+        self.key_columns = key_columns
+        self.untracked_error_codes = frozenset(untracked_error_codes)
+        self.run_id = None
+        self.status_counts = {NEW_STATUS: 0, OPEN_STATUS: 0, RESOLVED_STATUS: 0}
+        self._connection = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(commit=exc_type is None)
+
+    def open(self):
+        """Opens the database and starts a run"""
+        self._connection = sqlite3.connect(self.path)
+        self._connection.executescript(SCHEMA)
+        cursor = self._connection.execute(
+            'INSERT INTO runs (started) VALUES (?)',
+            (datetime.datetime.utcnow().isoformat(),)
+        )
+        self.run_id = cursor.lastrowid
+
+    def close(self, commit=True):
+        """Closes the database, keeping the run's changes if commit"""
+        if self._connection is None:
+            return
+        if commit:
+            self._connection.commit()
+        self._connection.close()
+        self._connection = None
+
+    def get_open_keys(self, error_keys):
+        """Returns the error keys among error_keys that were already open
+        before this run"""
+        open_keys = set()
+        for start in range(0, len(error_keys), LOOKUP_BATCH_SIZE):
+            batch = error_keys[start:start + LOOKUP_BATCH_SIZE]
+            open_keys.update(key for key, in self._connection.execute(
+                'SELECT error_key FROM errors WHERE status = ? AND opened_run < ? '
+                'AND error_key IN ({})'.format(','.join('?' * len(batch))),
+                [OPEN_STATUS, self.run_id] + batch
+            ))
+        return open_keys
+
+    def record_errors(self, error_df):
+        """
+        Records the errors of a report chunk and labels each as new or open.
+            Rows with an untracked error code are not recorded and have no
+            status
+
+        Args:
+            error_df (pandas.DataFrame): a chunk of the error report
+
+        Returns:
+            pandas.DataFrame: error_df with status and resolved columns
+        """
+        all_rows = [
+            {column: format_json_value(value) for column, value in row_values.items()}
+            for row_values in error_df.to_dict(orient='records')
+        ]
+        tracked = [
+            row_values.get('error_code') not in self.untracked_error_codes
+            for row_values in all_rows
+        ]
+        rows = [row_values for row_values, is_tracked in zip(all_rows, tracked) if is_tracked]
+        error_keys = [get_error_key(row_values, self.key_columns) for row_values in rows]
+        open_keys = self.get_open_keys(error_keys)
+        # UPSERT needs SQLite 3.24, older than the gear image's, so known
+        # errors are updated first and only the new ones are inserted
+        self._connection.executemany(
+            'UPDATE errors SET opened_run = CASE WHEN status = ? THEN opened_run ELSE ? END, '
+            'status = ?, last_seen_run = ?, resolved_run = NULL, error_code = ?, '
+            'report_row = ? WHERE error_key = ?',
+            [
+                (OPEN_STATUS, self.run_id, OPEN_STATUS, self.run_id,
+                 row_values.get('error_code'), json.dumps(row_values), error_key)
+                for error_key, row_values in zip(error_keys, rows)
+            ]
+        )
+        self._connection.executemany(
+            'INSERT OR IGNORE INTO errors (error_key, status, first_seen_run, opened_run, '
+            'last_seen_run, error_code, report_row) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [
+                (error_key, OPEN_STATUS, self.run_id, self.run_id, self.run_id,
+                 row_values.get('error_code'), json.dumps(row_values))
+                for error_key, row_values in zip(error_keys, rows)
+            ]
+        )
+        tracked_statuses = iter([
+            OPEN_STATUS if error_key in open_keys else NEW_STATUS for error_key in error_keys
+        ])
+        statuses = [next(tracked_statuses) if is_tracked else None for is_tracked in tracked]
+        for status in statuses:
+            if status is not None:
+                self.status_counts[status] += 1
+        error_df = error_df.copy()
+        error_df['status'] = statuses
+        error_df['resolved'] = False
+        return error_df
+
+    def resolve_errors(self, columns):
+        """
+        Marks the errors that were open before this run and were not seen by
+            it as resolved
+
+        Args:
+            columns (list): the columns of the report
+
+        Returns:
+            pandas.DataFrame: a report row per resolved error, as reported by
+                the run that last saw it
+        """
+        resolved_rows = [
+            json.loads(report_row) for report_row, in self._connection.execute(
+                'SELECT report_row FROM errors WHERE status = ? AND last_seen_run < ?',
+                (OPEN_STATUS, self.run_id)
+            )
+        ]
+        self._connection.execute(
+            'UPDATE errors SET status = ?, resolved_run = ? '
+            'WHERE status = ? AND last_seen_run < ?',
+            (RESOLVED_STATUS, self.run_id, OPEN_STATUS, self.run_id)
+        )
+        self.status_counts[RESOLVED_STATUS] += len(resolved_rows)
+        resolved_df = pd.DataFrame(resolved_rows, columns=columns)
+        resolved_df['status'] = RESOLVED_STATUS
+        resolved_df['resolved'] = True
+        return resolved_df
+
+    def iter_error_diff(self, error_dfs, resolve=True):
+        """
+        Passes error report chunks through, recording them and adding status
+            (new, open or resolved) and resolved columns
+
+        Args:
+            error_dfs (iterable): error dataframes, as yielded by
+                TransferLog.iter_error_dfs
+            resolve (bool): if True, the errors of earlier runs that this run
+                did not report are yielded last as resolved. Runs that only
+                cover part of the project should not resolve errors
+
+        Yields:
+            pandas.DataFrame: the chunks with their status
+        """
+        columns = None
+        for error_df in error_dfs:
+            columns = list(error_df.columns)
+            yield self.record_errors(error_df)
+        if resolve and columns is not None:
+            yield self.resolve_errors(columns)
+        log.info('Errors since the last run: %s new, %s still open, %s resolved',
+                 self.status_counts[NEW_STATUS], self.status_counts[OPEN_STATUS],
+                 self.status_counts[RESOLVED_STATUS])
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+"""Merges the reports written by sharded transfer log runs into the final
+report and error count
+"""
+import argparse
+import ast
+import logging
+
+import flywheel
+import pandas as pd
+
+import report
+import transfer_log
+import utils
+
+log = logging.getLogger('grp-5_transfer_log_report')
+
+
+def parse_list_value(value):
+    """Parses a list that was written to csv by DataFrame.to_csv"""
+    if isinstance(value, str) and value.startswith('['):
+        return ast.literal_eval(value)
+    return value
+
+
+def parse_array_value(value):
+    """Converts a list that was read back from parquet as an array"""
+    if value is None:
+        return None
+    return list(value)
+
+
+def load_shard_report(report_path):
+    """
+    Loads a shard's error report in any of the report formats, restoring the
+        list and flag columns
+
+    Args:
+        report_path (str): path to an error report csv, jsonl or parquet
+            file, as written by report.open_report_writer
+
+    Returns:
+        pandas.DataFrame: the error dataframe of the shard
+    """
+    report_format = report.get_report_format(str(report_path))[0]
+    if report_format == report.PARQUET_FORMAT:
+        error_df = pd.read_parquet(report_path)
+        for column in report.LIST_COLUMNS:
+            if column in error_df.columns:
+                error_df[column] = error_df[column].map(parse_array_value)
+        return error_df
+    if report_format == report.JSON_LINES_FORMAT:
+        # Keep ids and labels as written, and gzip is inferred from the name
+        return pd.read_json(report_path, orient='records', lines=True, dtype=False,
+                            convert_dates=False)
+    # Keep every value a str so ids and labels are not coerced to numbers
+    error_df = pd.read_csv(report_path, dtype=str, keep_default_na=False,
+                           na_values=[''])
+    for column in report.LIST_COLUMNS:
+        if column in error_df.columns:
+            error_df[column] = error_df[column].map(parse_list_value)
+    for column in report.BOOLEAN_COLUMNS:
+        if column in error_df.columns:
+            error_df[column] = error_df[column].map({'True': True, 'False': False})
+    return error_df
+
+
+def get_unreconciled_rows(error_df):
+    """Returns a boolean Series marking the subject not reconciled rows of a
+        merged report, whose error codes were read back as strings"""
+    if 'error_code' not in error_df.columns:
+        return pd.Series(False, index=error_df.index)
+    error_codes = pd.to_numeric(error_df['error_code'], errors='coerce')
+    return error_codes == transfer_log.ErrorCode.SUBJECT_NOT_RECONCILED
+
+
+def merge_shard_reports(report_paths):
+    """
+    Combines the error reports of every shard of a run
+
+    Shards partition the subjects, so each Flywheel container and each
+    transfer log row is reported by at most one shard and the merged count
+    equals the count of an unsharded run. Subjects a shard did not reconcile
+    before its time budget ran out are not counted.
+
+    Args:
+        report_paths (list): paths to the shard error reports, in any of
+            the report formats
+
+    Returns:
+        tuple: the merged error dataframe and its error count
+    """
+    error_df = pd.concat(
+        [load_shard_report(report_path) for report_path in report_paths],
+        ignore_index=True
+    )
+    error_count = transfer_log.TransferLog.count_df_errors(
+        error_df[~get_unreconciled_rows(error_df)]
+    )
+    return error_df, error_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('reports', nargs='+', help='Error reports written by each shard')
+    parser.add_argument('--output', '-o', help='Output file csv')
+    parser.add_argument('--analysis-id',
+                        help='Set the error count label on this analysis')
+    parser.add_argument('--api-key', help='Use if not logged in via cli')
+    args = parser.parse_args()
+
+    merged_error_df, merged_error_count = merge_shard_reports(args.reports)
+    if args.output:
+        # The format of the merged report is selected by its extension
+        with report.open_report_writer(args.output) as writer:
+            writer.write(merged_error_df)
+    else:
+        print(merged_error_df)
+
+    # A shard that ran out of time makes the merged report partial
+    analysis_label = utils.get_analysis_label(
+        merged_error_count, partial=get_unreconciled_rows(merged_error_df).any()
+    )
+    print(analysis_label)
+    if args.analysis_id:
+        if args.api_key:
+            fw = flywheel.Client(args.api_key)
+        else:
+            fw = flywheel.Client()
+        fw.get_analysis(args.analysis_id).update({'label': analysis_label})
@@ -0,0 +1,222 @@
+"""Writers that stream the error report to disk one chunk of rows at a time.
+The output format is selected by the extension of the report filename
+"""
+from abc import ABCMeta, abstractmethod
+import gzip
+import os
+
+import utils
+
+pd = utils.lazy_import('pandas')
+
+CSV_FORMAT = 'csv'
+JSON_LINES_FORMAT = 'jsonl'
+PARQUET_FORMAT = 'parquet'
+
+# Columns holding lists of transfer log rows and Flywheel ids
+LIST_COLUMNS = [
+    'transfer_log_rows',
+    'matching_fw_ids',
+    'suggested_matches'
+]
+
+# Columns holding error codes and record counts, stored as small integers
+INTEGER_COLUMNS = {
+    'error_code': 'uint8',
+    'count_difference': 'uint32',
+    'child_count': 'uint32'
+}
+
+# Columns holding flags, such as the resolved column of error_state
+BOOLEAN_COLUMNS = [
+    'resolved'
+]
+
+
+def split_report_extension(filename):
+    """Splits filename into its root and extension, keeping .gz with the
+        extension it compresses"""
+    root, extension = os.path.splitext(filename)
+    if extension.lower() == '.gz':
+        root, inner_extension = os.path.splitext(root)
+        extension = inner_extension + extension
+    return root, extension
+
+
+def get_report_format(filename):
+    """
+    Determines the report format and compression from a report filename
+
+    Args:
+        filename (str): name of the report file
+
+    Returns:
+        tuple: the format (csv, jsonl or parquet) and whether to gzip the
+            output. Unrecognized extensions are written as plain csv.
+    """
+    extension = split_report_extension(filename.lower())[1]
+    compressed = extension.endswith('.gz')
+    if extension in ['.jsonl', '.ndjson', '.jsonl.gz', '.ndjson.gz']:
+        return JSON_LINES_FORMAT, compressed
+    if extension == '.parquet':
+        return PARQUET_FORMAT, False
+    return CSV_FORMAT, compressed
+
+
+class ReportWriter(object):
+    """
+    Abstract class for writing an error report one DataFrame chunk at a time
+
+    Args:
+        path (str): path of the report file
+        compressed (bool): if True, the output is gzip compressed
+
+    Attributes:
+        path (str): path of the report file
+        compressed (bool): if True, the output is gzip compressed
+        row_count (int): number of rows written so far
+    """
+    __metaclass__ = ABCMeta
+
+    def __init__(self, path, compressed=False):
+        self.path = path
+        self.compressed = compressed
+        self.row_count = 0
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open_text(self):
+        """Opens the report file for writing text"""
+        if self.compressed:
+            return gzip.open(self.path, 'wt', newline='', encoding='utf-8')
+        return open(self.path, 'w', newline='', encoding='utf-8')
+
+    def write(self, df):
+        """Appends the rows of df to the report"""
+        self.write_df(df)
+        self.row_count += len(df)
+
+    @abstractmethod
+    def write_df(self, df):
+        """
+        Writes the rows of df in the report's format
+        """
+        pass
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CsvReportWriter(ReportWriter):
+    """Writes the report as csv, the header is taken from the first chunk"""
+
+    def write_df(self, df):
+        header = self._file is None
+        if header:
+            self._file = self.open_text()
+        df.to_csv(self._file, header=header, index=False)
+
+    def close(self):
+        # Always leave a file behind, even for an empty report
+        if self._file is None:
+            self._file = self.open_text()
+        super(CsvReportWriter, self).close()
+
+
+class JsonLinesReportWriter(ReportWriter):
+    """Writes the report as one json object per line"""
+
+    def write_df(self, df):
+        if self._file is None:
+            self._file = self.open_text()
+        if not df.empty:
+            # Older pandas versions omit the final line break
+            json_lines = df.to_json(orient='records', lines=True).rstrip('\n')
+            self._file.write(json_lines + '\n')
+
+    def close(self):
+        if self._file is None:
+            self._file = self.open_text()
+        super(JsonLinesReportWriter, self).close()
+
+
+class ParquetReportWriter(ReportWriter):
+    """
+    Writes the report as parquet, one row group per chunk. List columns are
+        stored as lists, error codes and counts as integers, flags as booleans
+        and every other value as a string
+    """
+
+    def __init__(self, path, compressed=False):
+        super(ParquetReportWriter, self).__init__(path, compressed)
+        self.schema = None
+
+    def get_schema(self, df):
+        import pyarrow as pa
+
+        fields = list()
+        for column in df.columns:
+            if column == 'transfer_log_rows':
+                fields.append(pa.field(column, pa.list_(pa.int64())))
+            elif column in LIST_COLUMNS:
+                fields.append(pa.field(column, pa.list_(pa.string())))
+            elif column in INTEGER_COLUMNS:
+                fields.append(pa.field(column, pa.type_for_alias(INTEGER_COLUMNS[column])))
+            elif column in BOOLEAN_COLUMNS:
+                fields.append(pa.field(column, pa.bool_()))
+            else:
+                fields.append(pa.field(column, pa.string()))
+        return pa.schema(fields)
+
+    @staticmethod
+    def format_column(series):
+        if series.name == 'transfer_log_rows':
+            return series.map(lambda value: value if isinstance(value, list) else None)
+        if series.name in LIST_COLUMNS:
+            return series.map(
+                lambda value: [str(item) for item in value] if isinstance(value, list) else None
+            )
+        if series.name in INTEGER_COLUMNS:
+            return series.map(lambda value: None if pd.isna(value) else int(value))
+        if series.name in BOOLEAN_COLUMNS:
+            return series.map(lambda value: None if pd.isna(value) else bool(value))
+        return series.map(lambda value: None if pd.isna(value) else str(value))
+
+    def write_df(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._file is None:
+            self.schema = self.get_schema(df)
+            self._file = pq.ParquetWriter(self.path, self.schema)
+        if df.empty:
+            return
+        df = df.apply(self.format_column)
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        self._file.write_table(table)
+
+
+def open_report_writer(path):
+    """
+    Creates the ReportWriter for the format given by the extension of path
+
+    Args:
+        path (str): path of the report file, ending with .csv, .csv.gz,
+            .jsonl, .jsonl.gz or .parquet
+
+    Returns:
+        ReportWriter: the writer, to be used as a context manager
+    """
+    report_format, compressed = get_report_format(path)
+    if report_format == JSON_LINES_FORMAT:
+        return JsonLinesReportWriter(path, compressed)
+    if report_format == PARQUET_FORMAT:
+        return ParquetReportWriter(path)
+    return CsvReportWriter(path, compressed)
@@ -1,7 +1,5 @@
 #!/usr/bin/python3
 import csv
-import datetime
-import flywheel
 import json
 import logging
 import os
@@ -9,9 +7,13 @@ import os
 import transfer_log
 import utils
 
+flywheel = utils.lazy_import('flywheel')
 
 log = logging.getLogger('grp-5_transfer_log_report')
 
+GEAR_CONFIG_PATH = '/flywheel/v0/config.json'
+GEAR_OUTPUT_DIR = '/flywheel/v0/output'
+
 
 def create_missing_session_error(session_key):
     return {
@@ -59,7 +61,13 @@ def create_output_file(error_containers, file_type, gear_context, headers=None,
         headers = transfer_log.TRANSFER_LOG_ERROR_HEADERS if validate_transfer_log else transfer_log.CSV_HEADERS
     with gear_context.open_output(output_filename, 'w') as output_file:
         if file_type == 'json':
-            json.dump(error_containers, output_file)
+            # Write the list one container at a time instead of in one dump
+            output_file.write('[')
+            for index, container in enumerate(error_containers):
+                if index:
+                    output_file.write(', ')
+                json.dump(container, output_file)
+            output_file.write(']')
         elif file_type == 'csv':
             csv_dict_writer = csv.DictWriter(output_file, fieldnames=headers)
             csv_dict_writer.writeheader()
@@ -108,7 +116,40 @@ def update_analysis_label(parent_type, parent_id, analysis_id, analysis_label,
     return raw_response.json()
 
 
+def check_inputs(config_path=GEAR_CONFIG_PATH, output_dir=GEAR_OUTPUT_DIR):
+    """Validates the template and transfer log named in the gear config before
+    the Flywheel SDK is imported, so that malformed inputs fail fast
+
+    Args:
+        config_path (str): path to the gear's config.json
+        output_dir (str): directory to write error-transfer-log.csv to
+
+    Returns:
+        list: the transfer log rows, as returned by load_transfer_log, to be
+            reconciled without reading the transfer log again
+
+    Raises:
+        TransferLogException: if the transfer log does not match the template
+    """
+    with open(config_path, 'r') as fp:
+        inputs = json.load(fp).get('inputs', {})
+    template_path = inputs['template']['location']['path']
+    transfer_log_path = inputs['transfer_log']['location']['path']
+    config = transfer_log.load_config_file(template_path)
+    try:
+        return transfer_log.load_transfer_log(transfer_log_path, config)
+    except transfer_log.TransferLogException as e:
+        transfer_log.create_output_file(
+            e.errors, os.path.join(output_dir, 'error-transfer-log.csv'),
+            validate_transfer_log=True
+        )
+        raise e
+
+
 def main():
+    transfer_log_rows = None
+    if os.path.exists(GEAR_CONFIG_PATH):
+        transfer_log_rows = check_inputs()
     with flywheel.GearContext() as gear_context:
         gear_context.init_logging()
         log.info(gear_context.config)
@@ -117,28 +158,49 @@ def main():
         analysis = gear_context.client.get_analysis(
            analysis_id
         )
-        parent = gear_context.client.get_container(analysis.parent['id'])
-        parent_path = utils.get_resolver_path(gear_context.client, parent)
+        # Validating the transfer log alone does not need the project
+        if gear_context.config.get('validate_only'):
+            parent_path = None
+        else:
+            parent = gear_context.client.get_container(analysis.parent['id'])
+            parent_path = utils.get_resolver_path(gear_context.client, parent)
 
-        # Run the metadata script
+        # The report format is selected by the extension of the filename
+        fname = gear_context.config.get('filename')
+        error_report_path = os.path.join(gear_context.output_dir, fname)
+
+        # Run the metadata script, streaming the error report as it goes
+        uncovered_subjects = list()
+        incomplete_scans = list()
+        sample_estimate = dict()
         try:
-            error_df, error_count = transfer_log.main(
-                gear_context, 'INFO', parent_path
+            _, error_count = transfer_log.main(
+                gear_context, 'INFO', parent_path,
+                output_path=error_report_path,
+                uncovered_subjects=uncovered_subjects,
+                sample_estimate=sample_estimate,
+                transfer_log_rows=transfer_log_rows,
+                incomplete_scans=incomplete_scans
             )
         except transfer_log.TransferLogException as e:
             create_output_file(e.errors, 'csv', gear_context,
-                               'error-transfer-log.csv', True)
+                               output_filename='error-transfer-log.csv',
+                               validate_transfer_log=True)
             raise e
-
-        log.info('Writing error report')
-        fname = gear_context.config.get('filename')
-        error_report_path = os.path.join(gear_context.output_dir, fname)
-        error_df.to_csv(error_report_path, index=False)
         log.info('Wrote error report with filename %s', error_report_path)
+        if sample_estimate:
+            estimate_path = os.path.join(
+                gear_context.output_dir, 'transfer-log-sample-estimate.json'
+            )
+            with open(estimate_path, 'w') as fp:
+                json.dump(sample_estimate, fp, indent=2)
+            log.info('Wrote error rate estimate to %s', estimate_path)
 
         # Update analysis label
-        timestamp = datetime.datetime.utcnow()
-        analysis_label = 'TRANSFER_ERROR_COUNT_{}_AT_{}'.format(error_count, timestamp)
+        analysis_label = utils.get_analysis_label(
+            error_count, partial=bool(uncovered_subjects or incomplete_scans),
+            sampled=bool(sample_estimate)
+        )
         log.info(
             'Updating label of analysis=%s to %s', analysis.id, analysis_label
         )
@@ -0,0 +1,141 @@
+"""Stratified samples of subjects for quick checks of a project, and the
+error rate estimates computed from the sampled subjects
+"""
+import math
+import random
+
+# z score of the two-sided 95% confidence intervals of the estimates
+CONFIDENCE_Z = 1.96
+
+# Sampled subjects per stratum needed to estimate its variance
+MIN_STRATUM_SAMPLE = 2
+
+
+def allocate_sample(stratum_sizes, sample_size):
+    """
+    Splits a sample between strata in proportion to their sizes
+
+    Args:
+        stratum_sizes (dict): stratum: number of subjects pairs
+        sample_size (int): total number of subjects to sample
+
+    Returns:
+        dict: stratum: number of subjects to sample pairs. Each stratum gets
+            at least MIN_STRATUM_SAMPLE subjects (or all of them if fewer),
+            which may exceed sample_size for tiny samples
+    """
+    total = sum(stratum_sizes.values())
+    if not total:
+        return {stratum: 0 for stratum in stratum_sizes}
+    allocation = dict()
+    for stratum, size in stratum_sizes.items():
+        share = int(round(sample_size * size / total))
+        allocation[stratum] = min(size, max(share, MIN_STRATUM_SAMPLE))
+    return allocation
+
+
+def sample_strata(strata, sample_size, seed=None):
+    """
+    Draws a stratified random sample
+
+    Args:
+        strata (dict): stratum: list of subject keys pairs
+        sample_size (int): total number of subjects to sample
+        seed (int): seed of the random generator, for repeatable samples
+
+    Returns:
+        dict: stratum: list of sampled subject keys pairs
+    """
+    rng = random.Random(seed)
+    allocation = allocate_sample(
+        {stratum: len(keys) for stratum, keys in strata.items()}, sample_size
+    )
+    # Sort first so a seed gives the same sample whatever the listing order
+    return {
+        stratum: rng.sample(sorted(keys), allocation[stratum])
+        for stratum, keys in strata.items()
+    }
+
+
+def get_stratified_mean(stratum_sizes, stratum_values):
+    """
+    Estimates the mean of a value over every subject from a stratified sample
+
+    Args:
+        stratum_sizes (dict): stratum: number of subjects pairs
+        stratum_values (dict): stratum: list of the values of the sampled
+            subjects pairs
+
+    Returns:
+        tuple: the estimated mean and its standard error
+    """
+    total = sum(stratum_sizes.values())
+    mean = 0.0
+    variance = 0.0
+    for stratum, size in stratum_sizes.items():
+        values = stratum_values.get(stratum) or []
+        if not size or not values:
+            continue
+        weight = size / total
+        stratum_mean = sum(values) / len(values)
+        mean += weight * stratum_mean
+        if len(values) > 1:
+            sample_variance = sum(
+                (value - stratum_mean) ** 2 for value in values
+            ) / (len(values) - 1)
+            # Finite population correction, a fully sampled stratum adds nothing
+            correction = 1 - len(values) / size
+            variance += weight ** 2 * correction * sample_variance / len(values)
+    return mean, math.sqrt(variance)
+
+
+def estimate_error_rate(stratum_sizes, stratum_error_counts, z=CONFIDENCE_Z):
+    """
+    Estimates the error rate of a project from the errors of a stratified
+        sample of its subjects
+
+    Args:
+        stratum_sizes (dict): stratum: number of subjects pairs
+        stratum_error_counts (dict): stratum: list of the error counts of the
+            sampled subjects pairs
+        z (float): z score of the confidence intervals
+
+    Returns:
+        dict: the number of subjects and sampled subjects, the estimated share
+            of subjects with errors (error_rate) and number of errors
+            (estimated_error_count) with their confidence intervals, and the
+            error rate of each stratum's sample
+    """
+    total = sum(stratum_sizes.values())
+    error_rate, error_rate_se = get_stratified_mean(stratum_sizes, {
+        stratum: [int(count > 0) for count in counts]
+        for stratum, counts in stratum_error_counts.items()
+    })
+    errors_per_subject, errors_per_subject_se = get_stratified_mean(
+        stratum_sizes, stratum_error_counts
+    )
+    strata = dict()
+    for stratum, size in stratum_sizes.items():
+        counts = stratum_error_counts.get(stratum) or []
+        strata[stratum] = {
+            'subjects': size,
+            'sampled_subjects': len(counts),
+            'error_rate': (
+                sum(1 for count in counts if count) / len(counts) if counts else None
+            )
+        }
+    return {
+        'subjects': total,
+        'sampled_subjects': sum(len(counts) for counts in stratum_error_counts.values()),
+        'error_rate': error_rate,
+        'error_rate_ci': [
+            max(0.0, error_rate - z * error_rate_se),
+            min(1.0, error_rate + z * error_rate_se)
+        ],
+        'estimated_error_count': total * errors_per_subject,
+        'estimated_error_count_ci': [
+            max(0.0, total * (errors_per_subject - z * errors_per_subject_se)),
+            total * (errors_per_subject + z * errors_per_subject_se)
+        ],
+        'strata': strata
+    }
@@ -0,0 +1,111 @@
+"""Saves the Flywheel side of a transfer log run to a Parquet file and loads
+it back, so a transfer log can be reconciled again without any API calls
+"""
+import json
+
+# Key of the schema metadata holding everything but the records
+SNAPSHOT_METADATA_KEY = b'transfer_log_snapshot'
+
+
+def get_column_type(values):
+    """
+    Chooses the Parquet type of a column of formatted Flywheel values
+
+    Args:
+        values (list): the values of the column, None where missing
+
+    Returns:
+        pyarrow.DataType: bool, int64 or float64 if every value has that type,
+            otherwise string
+    """
+    import pyarrow as pa
+
+    value_types = set(type(value) for value in values if value is not None)
+    if value_types == {bool}:
+        return pa.bool_()
+    if value_types == {int}:
+        return pa.int64()
+    if value_types and value_types <= {int, float}:
+        return pa.float64()
+    return pa.string()
+
+
+def format_column_values(values, column_type):
+    """Converts values to python types that fit column_type"""
+    import pyarrow as pa
+
+    if column_type == pa.string():
+        return [None if value is None else str(value) for value in values]
+    if column_type == pa.float64():
+        return [None if value is None else float(value) for value in values]
+    return values
+
+
+def save_snapshot(path, records, resolver_path_dict, empty_containers, project_id=None):
+    """
+    Writes the Flywheel records of a project and the lookups built with them
+        to a Parquet file
+
+    The records are stored as a table with a column per record key. The
+    resolver paths, empty container ids and project id are stored as json in
+    the schema metadata.
+
+    Args:
+        path (str): path of the Parquet file
+        records (list): formatted Flywheel records, as returned by
+            transfer_log.get_flywheel_records
+        resolver_path_dict (dict): container id: resolver path pairs
+        empty_containers (list): ids of the containers without files
+        project_id (str): id of the project the records were fetched from
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = list()
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+    arrays = list()
+    fields = list()
+    for column in columns:
+        # numpy scalars are converted to their python equivalent
+        values = [
+            value.item() if hasattr(value, 'item') else value
+            for value in (record.get(column) for record in records)
+        ]
+        column_type = get_column_type(values)
+        arrays.append(pa.array(format_column_values(values, column_type), type=column_type))
+        fields.append(pa.field(column, column_type))
+    metadata = json.dumps({
+        'project_id': project_id,
+        'resolver_path_dict': resolver_path_dict,
+        'empty_containers': list(empty_containers)
+    })
+    schema = pa.schema(fields, metadata={SNAPSHOT_METADATA_KEY: metadata.encode()})
+    pq.write_table(pa.Table.from_arrays(arrays, schema=schema), path)
+
+
+def load_snapshot(path):
+    """
+    Reads a snapshot written by save_snapshot
+
+    Args:
+        path (str): path of the Parquet file
+
+    Returns:
+        dict: the records (list of dicts), resolver_path_dict, empty_containers
+            and project_id of the snapshot
+    """
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or dict()
+    if SNAPSHOT_METADATA_KEY not in metadata:
+        raise ValueError('{} is not a transfer log snapshot'.format(path))
+    snapshot = json.loads(metadata[SNAPSHOT_METADATA_KEY].decode())
+    column_values = table.to_pydict()
+    snapshot['records'] = [
+        dict(zip(column_values, row_values)) for row_values in zip(*column_values.values())
+    ]
+    return snapshot
@@ -0,0 +1,196 @@
+"""Indexes used to suggest the nearest records for transfer log rows and
+Flywheel containers that did not match anything
+"""
+
+# Default maximum total edit distance between a record and a suggestion
+MAX_SUGGESTION_DISTANCE = 2
+
+# Default maximum number of suggestions per record
+SUGGESTION_LIMIT = 3
+
+
+def get_edit_distance(value, other, max_distance=None):
+    """
+    Computes the Levenshtein distance between two strings
+
+    Args:
+        value (str): a string
+        other (str): another string
+        max_distance (int): if provided, stop as soon as the distance is known
+            to exceed max_distance and return max_distance + 1
+
+    Returns:
+        int: the number of single character edits from value to other
+    """
+    if value == other:
+        return 0
+    if len(value) < len(other):
+        value, other = other, value
+    if max_distance is not None and len(value) - len(other) > max_distance:
+        return max_distance + 1
+    previous_row = list(range(len(other) + 1))
+    for i, char in enumerate(value, 1):
+        current_row = [i]
+        for j, other_char in enumerate(other, 1):
+            current_row.append(min(
+                previous_row[j] + 1,
+                current_row[j - 1] + 1,
+                previous_row[j - 1] + (char != other_char)
+            ))
+        if max_distance is not None and min(current_row) > max_distance:
+            return max_distance + 1
+        previous_row = current_row
+    return previous_row[-1]
+
+
+class BKTree(object):
+    """
+    Burkhard-Keller tree of strings for finding all the values within an edit
+        distance of a query without comparing it to every value
+
+    Args:
+        values (iterable): the strings to index
+    """
+
+    def __init__(self, values=()):
+        self.root = None
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        """Adds value to the tree"""
+        if self.root is None:
+            self.root = (value, dict())
+            return
+        node_value, children = self.root
+        while True:
+            distance = get_edit_distance(value, node_value)
+            if distance == 0:
+                return
+            if distance not in children:
+                children[distance] = (value, dict())
+                return
+            node_value, children = children[distance]
+
+    def search(self, value, max_distance):
+        """
+        Finds the indexed values within max_distance of value
+
+        Args:
+            value (str): the query string
+            max_distance (int): the maximum edit distance
+
+        Returns:
+            list: (distance, indexed value) tuples
+        """
+        results = list()
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node_value, children = nodes.pop()
+            distance = get_edit_distance(value, node_value)
+            if distance <= max_distance:
+                results.append((distance, node_value))
+            # Only subtrees in this band can hold values within max_distance
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+        return results
+
+
+class MatchKeyIndex(object):
+    """
+    Index of match keys (tuples of match column values) for finding the keys
+        within a total edit distance of a key that did not match
+
+    A BKTree over the distinct values of each column finds the keys that are
+    close on that column; only the keys found for the most selective column
+    are compared on every column.
+
+    Args:
+        match_cols (list): names of the match columns, in key order
+        keys (list): the match keys to index
+        payloads (list): a value to return with each key, such as the ids of
+            the records with that key
+        max_distance (int): maximum total edit distance of a suggestion
+
+    Attributes:
+        match_cols (list): names of the match columns, in key order
+        keys (list): the indexed match keys, with None values as ''
+        payloads (list): the value returned with each key
+        max_distance (int): maximum total edit distance of a suggestion
+        trees (list): a BKTree of the distinct values of each column
+        postings (list): a dict of value: key positions for each column
+    """
+
+    def __init__(self, match_cols, keys, payloads, max_distance=MAX_SUGGESTION_DISTANCE):
+        self.match_cols = match_cols
+        self.keys = [self.format_key(key) for key in keys]
+        self.payloads = list(payloads)
+        self.max_distance = max_distance
+        self.postings = [dict() for _ in match_cols]
+        for position, key in enumerate(self.keys):
+            for column_index, value in enumerate(key):
+                self.postings[column_index].setdefault(value, []).append(position)
+        self.trees = [BKTree(postings.keys()) for postings in self.postings]
+
+    @staticmethod
+    def format_key(key):
+        return tuple('' if value is None or value != value else str(value) for value in key)
+
+    def get_candidates(self, key):
+        """Returns the positions of keys within max_distance of key on the
+            most selective column"""
+        candidates = None
+        for column_index, value in enumerate(key):
+            near_values = self.trees[column_index].search(value, self.max_distance)
+            positions = [
+                position for _, near_value in near_values
+                for position in self.postings[column_index][near_value]
+            ]
+            if candidates is None or len(positions) < len(candidates):
+                candidates = positions
+            if not candidates:
+                break
+        return candidates or []
+
+    def suggest(self, key, limit=SUGGESTION_LIMIT):
+        """
+        Finds the nearest indexed keys to key
+
+        Args:
+            key (tuple): a match key that is not in the index
+            limit (int): maximum number of suggestions
+
+        Returns:
+            list: (distance, payload, differences) tuples, nearest first, where
+                differences lists (column, value, suggested value) tuples
+        """
+        key = self.format_key(key)
+        suggestions = list()
+        for position in self.get_candidates(key):
+            candidate = self.keys[position]
+            distance = 0
+            differences = list()
+            for column, value, candidate_value in zip(self.match_cols, key, candidate):
+                if value != candidate_value:
+                    distance += get_edit_distance(
+                        value, candidate_value, self.max_distance - distance
+                    )
+                    differences.append((column, value, candidate_value))
+                if distance > self.max_distance:
+                    break
+            if 0 < distance <= self.max_distance:
+                suggestions.append((distance, position, differences))
+        suggestions.sort(key=lambda suggestion: suggestion[:2])
+        return [
+            (distance, self.payloads[position], differences)
+            for distance, position, differences in suggestions[:limit]
+        ]
+
+
+def format_differences(differences):
+    """Formats the differences of a suggestion for the report"""
+    return ', '.join(
+        "{} '{}' -> '{}'".format(column, value, suggested_value)
+        for column, value, suggested_value in differences
+    )
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Times how long the gear takes to reject a malformed transfer log, and how
+long the imports it avoids would take, each in a fresh interpreter
+
+Usage:
+    python tests/bin/startup_benchmark.py [RUNS]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+TEMPLATE_PATH = os.path.join(REPO_ROOT, 'tests', 'unit_tests', 'data',
+                             'test-transfer-log-template.yml')
+
+CHECK_INPUTS = '''
+import run, transfer_log
+try:
+    run.check_inputs({config_path!r}, {output_dir!r})
+except transfer_log.TransferLogException:
+    pass
+else:
+    raise SystemExit('transfer log was not rejected')
+'''
+
+BENCHMARKS = [
+    ('import transfer_log', 'import transfer_log'),
+    ('import run', 'import run'),
+    ('reject malformed transfer log', None),
+    ('import pandas, flywheel', 'import pandas, flywheel'),
+]
+
+
+def time_command(code, runs):
+    """Returns the median wall time in seconds of running code in a new
+        interpreter"""
+    timings = list()
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(runs=5):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        transfer_log_path = os.path.join(tmp_dir, 'transfer-log.csv')
+        with open(transfer_log_path, 'w') as fp:
+            fp.write('Subject,Modality - Exam Date,Timepoint\n')
+            fp.write('10651,MR - 2005-08-23,Week 4\n')
+        config_path = os.path.join(tmp_dir, 'config.json')
+        with open(config_path, 'w') as fp:
+            json.dump({'inputs': {
+                'template': {'location': {'path': TEMPLATE_PATH}},
+                'transfer_log': {'location': {'path': transfer_log_path}}
+            }}, fp)
+        check_inputs = CHECK_INPUTS.format(config_path=config_path, output_dir=tmp_dir)
+
+        baseline = time_command('pass', runs)
+        print('{:<32}{:>10}'.format('interpreter startup', '{:.3f}s'.format(baseline)))
+        for name, code in BENCHMARKS:
+            timing = time_command(code or check_inputs, runs)
+            print('{:<32}{:>10}'.format(name, '{:.3f}s'.format(timing)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,74 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+
+import batch
+import transfer_log
+
+
+def test_load_batch_manifest_resolves_paths(tmp_path):
+    manifest_path = tmp_path / 'manifest.yml'
+    manifest_path.write_text(
+        '- project: fw://group/Project A\n'
+        '  transfer_log: logs/a.csv\n'
+        '  template: template.yml\n'
+    )
+    entries = batch.load_batch_manifest(str(manifest_path))
+    assert entries == [{
+        'project': 'group/Project A',
+        'transfer_log': os.path.join(str(tmp_path), 'logs/a.csv'),
+        'template': os.path.join(str(tmp_path), 'template.yml')
+    }]
+
+
+def test_load_batch_manifest_missing_key(tmp_path):
+    manifest_path = tmp_path / 'manifest.csv'
+    manifest_path.write_text('project,transfer_log,template\ngroup/a,a.csv,\n')
+    with pytest.raises(ValueError, match='missing template'):
+        batch.load_batch_manifest(str(manifest_path))
+
+
+def test_run_batch_writes_reports_and_summary(tmp_path):
+    entries = [
+        {'project': 'group/a', 'transfer_log': 'a.csv', 'template': 't.yml'},
+        {'project': 'group/b', 'transfer_log': 'b.csv', 'template': 't.yml'}
+    ]
+
+    def mock_main(gear_context, log_level, project_path, output_path=None):
+        if project_path == 'group/b':
+            raise transfer_log.TransferLogException(
+                'Malformed Transfer Log',
+                errors=[{'row': 2, 'column': 'Label', 'error': 'bad'}]
+            )
+        pd.DataFrame({'error': ['x']}).to_csv(output_path, index=False)
+        return None, 1
+
+    client = MagicMock()
+    with patch('transfer_log.main', side_effect=mock_main):
+        summaries = batch.run_batch(client, entries, str(tmp_path), workers=2)
+
+    assert [row['status'] for row in summaries] == ['complete', 'malformed']
+    assert summaries[0]['error_count'] == 1
+    assert (tmp_path / 'group_a-transfer-log-error-report.csv').exists()
+    assert (tmp_path / 'group_b-error-transfer-log.csv').exists()
+    summary_df = pd.read_csv(tmp_path / 'batch-summary.csv')
+    assert list(summary_df['project']) == ['group/a', 'group/b']
+
+
+def test_run_batch_checkpoints_entries_of_a_project_apart(tmp_path):
+    entries = [
+        {'project': 'group/a', 'transfer_log': 'a.csv', 'template': 't.yml'},
+        {'project': 'group/a', 'transfer_log': 'a2.csv', 'template': 't.yml'}
+    ]
+    checkpoint_paths = list()
+
+    def mock_main(gear_context, log_level, project_path, output_path=None):
+        checkpoint_paths.append(gear_context['checkpoint'])
+        return None, 0
+
+    with patch('transfer_log.main', side_effect=mock_main):
+        batch.run_batch(MagicMock(), entries, str(tmp_path), workers=2)
+
+    assert len(set(checkpoint_paths)) == 2
@@ -1,3 +1,6 @@
+from pathlib import Path
+
+import pandas as pd
 import pytest
 import transfer_log
 
@@ -40,3 +43,111 @@ def test_transfer_log_invalid_value():
     assert errors[0]['column'] == 'Label'
 
 
+def test_transfer_log_errors_ordered_by_row_then_query():
+    config = transfer_log.Config({
+        'query': [
+            {'subject.label': 'Subject', 'validate': '^[0-9]+$'},
+            {'session.timestamp': 'Date', 'timeformat': '%m/%d/%Y'}
+        ],
+        'join': 'session'
+    })
+    rows = [
+        {'Subject': '001', 'Date': '8/1/2014'},
+        {'Subject': 'sub-2', 'Date': '2014-08-01'},
+        {'Subject': '003', 'Date': '2014-08-01'}
+    ]
+    errors = transfer_log.check_config_and_log_match(config, rows)
+    assert [(error['row'], error['column']) for error in errors] == [
+        (3, 'Subject'), (3, 'Date'), (4, 'Date')
+    ]
+    assert errors[1]['error'] == 'Timeformat 2014-08-01 does not match %m/%d/%Y'
+
+
+def test_transfer_log_parallel_validation_matches_serial(monkeypatch):
+    config = transfer_log.Config({
+        'query': [
+            {'subject.label': 'Subject', 'validate': '^[0-9]+$'},
+            {'session.timestamp': 'Date', 'timeformat': '%m/%d/%Y'}
+        ],
+        'join': 'session'
+    })
+    rows = [
+        {'Subject': str(index) if index % 7 else 'x', 'Date': '8/1/2014' if index % 5 else 'bad'}
+        for index in range(200)
+    ]
+    serial_errors = transfer_log.check_config_and_log_match(config, rows, workers=1)
+    monkeypatch.setattr(transfer_log, 'PARALLEL_VALIDATION_ROWS', 50)
+    parallel_errors = transfer_log.check_config_and_log_match(config, rows, workers=3)
+    assert parallel_errors == serial_errors
+    assert len(serial_errors) == 29 + 40
+
+
+def test_validate_only_reports_duplicate_keys(tmp_path):
+    config = transfer_log.Config({
+        'query': [{'subject.label': 'Subject'}, {'session.label': 'Visit'}],
+        'join': 'session',
+        'mappings': {'Week 4': ['wk4']}
+    })
+    transfer_log_path = tmp_path / 'transfer-log.csv'
+    transfer_log_path.write_text(
+        'Subject,Visit\n1001,Week 4\n1002,Week 4\n1001,wk4\n'
+    )
+    errors = transfer_log.validate_transfer_log(config, str(transfer_log_path))
+    assert errors == [{
+        'row': 4, 'column': 'Subject, Visit', 'error': 'Duplicate key of row 2',
+        'severity': 'warning'
+    }]
+
+
+def test_main_validate_only_does_not_use_client(tmp_path):
+    data_root = Path(__file__).parent / 'data'
+    gear_context = {
+        'client': None,
+        'template': data_root / 'test-transfer-log-template.yml',
+        'transfer_log': str(data_root / 'test-transfer-log.xlsx'),
+        'case_insensitive': True,
+        'validate_only': True
+    }
+    output_path = tmp_path / 'validation.csv'
+    error_df, error_count = transfer_log.main(gear_context, 'INFO', None,
+                                              output_path=str(output_path))
+    assert error_df is None
+    validation_df = pd.read_csv(output_path)
+    assert list(validation_df.columns) == \
+        transfer_log.TRANSFER_LOG_ERROR_HEADERS + ['severity']
+    assert error_count == \
+        validation_df.loc[validation_df['severity'] == 'error', 'row'].nunique()
+
+
+def test_main_validate_only_does_not_count_duplicate_keys(tmp_path):
+    template_path = tmp_path / 'template.yml'
+    template_path.write_text(
+        'query:\n  - subject.label: Subject\n  - session.label: Visit\njoin: session\n'
+    )
+    transfer_log_path = tmp_path / 'transfer-log.csv'
+    transfer_log_path.write_text('Subject,Visit\n1001,Week 4\n1001,Week 4\n')
+    gear_context = {
+        'client': None,
+        'template': str(template_path),
+        'transfer_log': str(transfer_log_path),
+        'validate_only': True
+    }
+    validation_df, error_count = transfer_log.main(gear_context, 'INFO', None)
+    assert list(validation_df['severity']) == ['warning']
+    assert error_count == 0
+
+
+def test_load_transfer_log_keeps_template_columns(tmp_path):
+    config = transfer_log.Config({
+        'query': [{'subject.label': 'Subject'}, {'session.label': 'Visit'}],
+        'join': 'session'
+    })
+    transfer_log_path = tmp_path / 'transfer-log.csv'
+    transfer_log_path.write_text(
+        'Notes,Subject,Visit,Site\nok,1001,Week 4,A\n\nredo,1002\n'
+    )
+    rows = transfer_log.load_transfer_log(str(transfer_log_path), config)
+    assert rows == [
+        {'Subject': '1001', 'Visit': 'Week 4'},
+        {'Subject': '1002', 'Visit': None}
+    ]
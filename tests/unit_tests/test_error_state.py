@@ -0,0 +1,73 @@
+import pandas as pd
+
+import error_state
+import transfer_log
+
+KEY_COLUMNS = ['subject.label', 'flywheel_id']
+
+
+def get_error_df(rows):
+    return pd.DataFrame(rows, columns=[
+        'flywheel_id', 'transfer_log_rows', 'subject.label', 'error', 'matching_fw_ids', 'path'
+    ])
+
+
+def run_diff(path, error_dfs, resolve=True):
+    with error_state.ErrorStateStore(path, KEY_COLUMNS) as store:
+        return pd.concat(store.iter_error_diff(error_dfs, resolve=resolve), ignore_index=True)
+
+
+def test_error_diff_between_runs(tmp_path):
+    path = str(tmp_path / 'errors.sqlite')
+    first_df = run_diff(path, [
+        get_error_df([
+            [None, [2], '001', 'row 2 missing from flywheel', None, None],
+            ['abc', None, '002', 'acquisition in flywheel not present in transfer log',
+             None, 'group/project/002'],
+        ]),
+        get_error_df([[None, [5], '003', 'row 5 missing from flywheel', None, None]])
+    ])
+    assert list(first_df['status']) == ['new'] * 3
+    assert not first_df['resolved'].any()
+
+    second_df = run_diff(path, [get_error_df([
+        [None, [2], '001', 'row 2 missing from flywheel', None, None],
+        [None, [7], '004', 'row 7 missing from flywheel', None, None],
+    ])])
+    assert list(second_df['subject.label']) == ['001', '004', '002', '003']
+    assert list(second_df['status']) == ['open', 'new', 'resolved', 'resolved']
+    assert list(second_df['resolved']) == [False, False, True, True]
+    # The resolved rows are the ones last reported
+    assert second_df.loc[2, 'path'] == 'group/project/002'
+    assert second_df.loc[3, 'transfer_log_rows'] == [5]
+    # Resolved errors are not counted
+    assert transfer_log.TransferLog.count_df_errors(second_df) == 2
+
+    # A partial run keeps the errors it did not see open
+    third_df = run_diff(path, [get_error_df([
+        [None, [2], '003', 'row 2 missing from flywheel', None, None],
+    ])], resolve=False)
+    assert list(third_df['status']) == ['new']
+    fourth_df = run_diff(path, [get_error_df([
+        [None, [2], '001', 'row 2 missing from flywheel', None, None],
+    ])])
+    assert list(fourth_df['status']) == ['open', 'resolved', 'resolved']
+    assert set(fourth_df['subject.label'][1:]) == {'003', '004'}
+
+
+def test_unreconciled_subjects_are_not_tracked(tmp_path):
+    path = str(tmp_path / 'errors.sqlite')
+    not_reconciled = int(transfer_log.ErrorCode.SUBJECT_NOT_RECONCILED)
+    partial_df = get_error_df([['subject-id', None, '005', None, None, 'group/project/005']])
+    partial_df['error_code'] = not_reconciled
+    with error_state.ErrorStateStore(path, KEY_COLUMNS,
+                                     untracked_error_codes=[not_reconciled]) as store:
+        first_df = pd.concat(store.iter_error_diff([partial_df], resolve=False))
+    assert list(first_df['status']) == [None]
+    assert store.status_counts[error_state.NEW_STATUS] == 0
+
+    full_df = get_error_df([[None, [2], '001', 'row 2 missing from flywheel', None, None]])
+    full_df['error_code'] = int(transfer_log.ErrorCode.NOT_IN_FLYWHEEL)
+    second_df = run_diff(path, [full_df])
+    assert list(second_df['status']) == ['new']
+    assert not second_df['resolved'].any()
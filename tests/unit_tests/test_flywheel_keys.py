@@ -5,6 +5,7 @@ import datetime
 import urllib3
 import utils
 import json
+import os
 import numpy as np
 import pandas as pd
 
@@ -89,6 +90,31 @@ def test_get_data_list():
     assert data_list == resp_data
 
 
+def test_get_data_list_csv_transport():
+    client = MagicMock()
+    resp_body = (
+        'subject.label,acquisition.id,acquisition.deleted,acquisition.info.transfer_log.valid\n'
+        '0012,5cf7ec6bd9a631002dfddefd,,true\n'
+        'ab,5cf7ec6bd9a631002dfddefe,null,FALSE\n'
+    )
+    resp = urllib3.response.HTTPResponse(body=resp_body.encode())
+    client.read_view_data = MagicMock(return_value=resp)
+    boolean_columns = ['acquisition.deleted', 'acquisition.info.transfer_log.valid']
+    data_df = transfer_log.get_data_list(client, None, None, transport='csv',
+                                         boolean_columns=boolean_columns)
+    assert client.read_view_data.call_args[1]['format'] == 'csv'
+    assert data_df.to_dict(orient='records') == [
+        {'subject.label': '0012', 'acquisition.id': '5cf7ec6bd9a631002dfddefd',
+         'acquisition.deleted': None, 'acquisition.info.transfer_log.valid': True},
+        {'subject.label': 'ab', 'acquisition.id': '5cf7ec6bd9a631002dfddefe',
+         'acquisition.deleted': None, 'acquisition.info.transfer_log.valid': False}
+    ]
+    assert transfer_log.parse_csv_view_data(b'').empty
+    columns = transfer_log.FlywheelColumns()
+    columns.extend(data_df)
+    assert columns.get_df()['subject.label'].tolist() == ['0012', 'ab']
+
+
 def test_get_df_dtypes():
     data_list = [{"acquisition.id": "5cf7ec6bd9a631002dfddefd", "file.info.SeriesNumber": 10},
                  {"acquisition.id": "5cf7ec6bd9a631002dfddefd", "file.info.SeriesNumber": None}]
@@ -129,3 +155,109 @@ def test_format_flywheel_table():
     data_list = transfer_log.format_json_list_for_python(data_list)
     formatted_data = transfer_log.format_flywheel_table(data_list)
     assert exp_data_list == formatted_data
+
+
+def test_get_flywheel_records_resumes_from_checkpoint(tmp_path):
+    config = transfer_log.Config({
+        'query': [{'subject.label': 'Subject'}, {'session.label': 'Visit'}],
+        'join': 'session'
+    })
+    client = MagicMock()
+    subjects = [MagicMock(id='subject-{}'.format(index)) for index in range(4)]
+    client.get_project.return_value.subjects.iter.side_effect = lambda: iter(subjects)
+    fetched_ids = list()
+
+    def mock_get_data_list(fw_client, data_view, container_id, progress=None, transport=None,
+                           boolean_columns=None):
+        if container_id == 'subject-2' and not fetched_ids.count(container_id):
+            fetched_ids.append(container_id)
+            raise flywheel.ApiException(status=503)
+        fetched_ids.append(container_id)
+        return [{'session.id': container_id, 'subject.label': container_id,
+                 'session.label': 'ses', 'session.info.transfer_log.valid': None,
+                 'session.deleted': None}]
+
+    checkpoint_path = str(tmp_path / 'checkpoint.jsonl')
+    with patch('transfer_log.get_data_list', side_effect=mock_get_data_list):
+        with pytest.raises(flywheel.ApiException):
+            transfer_log.get_flywheel_records(client, config, 'project',
+                                              checkpoint_path=checkpoint_path)
+        assert fetched_ids == ['subject-0', 'subject-1', 'subject-2']
+        # Simulate a line cut short by the interruption
+        with open(checkpoint_path, 'a') as fp:
+            fp.write('{"subject_id": "subj')
+        records = transfer_log.get_flywheel_records(client, config, 'project',
+                                                    checkpoint_path=checkpoint_path)
+    assert fetched_ids[3:] == ['subject-2', 'subject-3']
+    assert [record['session.id'] for record in records] == \
+        ['subject-{}'.format(index) for index in range(4)]
+    assert not os.path.exists(checkpoint_path)
+
+
+def test_get_flywheel_records_stops_at_deadline():
+    config = transfer_log.Config({
+        'query': [{'subject.label': 'Subject'}, {'session.label': 'Visit'}],
+        'join': 'session'
+    })
+    client = MagicMock()
+    subjects = [MagicMock(id='subject-{}'.format(index)) for index in range(4)]
+    client.get_project.return_value.subjects.iter.side_effect = lambda: iter(subjects)
+    clock = [0]
+
+    def mock_get_data_list(fw_client, data_view, container_id, progress=None, transport=None,
+                           boolean_columns=None):
+        # Each subject takes 10 seconds to fetch
+        clock[0] += 10
+        return [{'session.id': container_id, 'subject.label': container_id,
+                 'session.label': 'ses', 'session.info.transfer_log.valid': None,
+                 'session.deleted': None}]
+
+    uncovered_subjects = list()
+    with patch('transfer_log.get_data_list', side_effect=mock_get_data_list), \
+            patch('transfer_log.time') as mock_time:
+        mock_time.monotonic.side_effect = lambda: clock[0]
+        records = transfer_log.get_flywheel_records(
+            client, config, 'project', deadline=15, uncovered_subjects=uncovered_subjects
+        )
+    assert [record['session.id'] for record in records] == ['subject-0', 'subject-1']
+    assert uncovered_subjects == subjects[2:]
+
+
+def test_empty_container_scan_stopped_by_deadline_is_incomplete():
+    config = transfer_log.Config({'query': [{'subject.label': 'Subject'}], 'join': 'session'})
+    client = MagicMock()
+    clock = [0]
+
+    def mock_iter_find(query):
+        # Each empty session takes 10 seconds to list
+        for index in range(3):
+            clock[0] += 10
+            yield MagicMock(id='empty-{}'.format(index))
+
+    client.sessions.iter_find.side_effect = mock_iter_find
+    test_transfer_log = transfer_log.TransferLog(client, config, None, 'project', deadline=15)
+    with patch.object(test_transfer_log, 'load_flywheel_table'), \
+            patch.object(test_transfer_log, 'get_path_dict'), \
+            patch.object(test_transfer_log, 'get_subject_dicts', return_value=[]), \
+            patch('transfer_log.time') as mock_time:
+        mock_time.monotonic.side_effect = lambda: clock[0]
+        test_transfer_log.load_flywheel_data()
+    assert test_transfer_log.empty_containers == ['empty-0']
+    assert not test_transfer_log.empty_scan_complete
+
+
+def test_get_view_filter():
+    config = transfer_log.Config({
+        'query': [{'subject.label': 'Subject'}],
+        'join': 'acquisition',
+        'filters': {'acquisition.info.type': 'dicom'}
+    })
+    assert transfer_log.get_view_filter(config) == \
+        'acquisition.deleted=null,acquisition.info.type=dicom'
+    client = MagicMock()
+    transfer_log.get_view_from_config(client, config)
+    assert client.View.call_args[1]['filter'] == transfer_log.get_view_filter(config)
+    with pytest.raises(ValueError):
+        transfer_log.Config({'query': [], 'filters': ['acquisition.info.type']})
+    with pytest.raises(ValueError):
+        transfer_log.Config({'query': [], 'filters': {'acquisition.info.type': 'a,b'}})
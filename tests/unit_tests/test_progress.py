@@ -0,0 +1,49 @@
+import concurrent.futures
+import json
+import logging
+
+import utils
+
+
+def test_progress_reporter_writes_status(tmp_path, caplog):
+    status_path = tmp_path / 'progress.json'
+    utils.ProgressReporter.configure(interval=0, status_path=str(status_path))
+    try:
+        with caplog.at_level(logging.INFO):
+            progress = utils.ProgressReporter('Flywheel fetch', total=4, unit='subjects')
+            progress.update(rows=10, bytes_received=2000000)
+            status = json.loads(status_path.read_text())['stages'][0]
+            assert status['done'] == 1
+            assert status['total'] == 4
+            assert status['bytes_received'] == 2000000
+            assert status['eta_seconds'] is not None
+            assert not status['finished']
+
+            progress.update(count=3, rows=30)
+            progress.finish()
+    finally:
+        utils.ProgressReporter.configure(interval=60, status_path=None)
+
+    status = json.loads(status_path.read_text())['stages'][0]
+    assert status['done'] == 4
+    assert status['rows'] == 40
+    assert status['finished']
+    assert status['eta_seconds'] is None
+    assert 'Flywheel fetch: 1/4 subjects, 10 rows' in caplog.text
+    assert '2.0 MB received' in caplog.text
+
+
+def test_progress_reporter_config_is_per_thread(tmp_path):
+    def run(name):
+        status_path = tmp_path / '{}.json'.format(name)
+        utils.ProgressReporter.configure(interval=0, status_path=str(status_path))
+        utils.ProgressReporter('{} fetch'.format(name)).finish()
+        return json.loads(status_path.read_text())['stages']
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        first_stages, second_stages = executor.map(run, ['first', 'second'])
+    assert [stage['stage'] for stage in first_stages] == ['first fetch']
+    assert [stage['stage'] for stage in second_stages] == ['second fetch']
+    # Stages of an earlier run in the same thread are not carried over
+    assert [stage['stage'] for stage in run('third')] == ['third fetch']
+    utils.ProgressReporter.configure()
@@ -0,0 +1,105 @@
+import gzip
+import json
+
+import pandas as pd
+import pytest
+
+import report
+import transfer_log
+
+
+def get_error_dfs():
+    return [
+        pd.DataFrame({
+            'flywheel_id': ['5cf7ec6bd9a631002dfddefd', None],
+            'transfer_log_rows': [None, [4, 5]],
+            'subject.label': ['10651', '10553'],
+            'error': ['acquisition in flywheel not present in transfer_log',
+                      'acquisition in transfer_log not present in flywheel'],
+            'matching_fw_ids': [['5cf7ec6bd9a631002dfddefd'], None],
+            'path': ['group/project/10651/Week 4/T1w', None]
+        }),
+        pd.DataFrame({
+            'flywheel_id': ['5cf7ec6bd9a631002dfddefe'],
+            'transfer_log_rows': [[5]],
+            'subject.label': ['10553'],
+            'error': ['1 more records in flywheel than in transfer_log'],
+            'matching_fw_ids': [['5cf7ec6bd9a631002dfddefe']],
+            'path': ['group/project/10553/Week 0/T1w']
+        })
+    ]
+
+
+@pytest.mark.parametrize('filename,expected', [
+    ('report.csv', ('csv', False)),
+    ('report.CSV.GZ', ('csv', True)),
+    ('report.jsonl', ('jsonl', False)),
+    ('report.jsonl.gz', ('jsonl', True)),
+    ('report.parquet', ('parquet', False)),
+    ('report.txt', ('csv', False))
+])
+def test_get_report_format(filename, expected):
+    assert report.get_report_format(filename) == expected
+
+
+def test_write_error_report_csv_gz(tmp_path):
+    output_path = str(tmp_path / 'report.csv.gz')
+    error_count = transfer_log.write_error_report(get_error_dfs(), output_path)
+    expected_df = pd.concat(get_error_dfs(), ignore_index=True)
+    assert error_count == transfer_log.TransferLog.count_df_errors(expected_df)
+    with gzip.open(output_path, 'rt') as fp:
+        written_df = pd.read_csv(fp, dtype=str)
+    assert len(written_df) == 3
+    assert list(written_df.columns) == list(expected_df.columns)
+
+
+def test_write_error_report_jsonl(tmp_path):
+    output_path = str(tmp_path / 'report.jsonl')
+    transfer_log.write_error_report(get_error_dfs(), output_path)
+    with open(output_path) as fp:
+        records = [json.loads(line) for line in fp]
+    assert len(records) == 3
+    assert records[1]['transfer_log_rows'] == [4, 5]
+    assert records[1]['flywheel_id'] is None
+
+
+def test_write_error_report_parquet(tmp_path):
+    pytest.importorskip('pyarrow')
+    output_path = str(tmp_path / 'report.parquet')
+    transfer_log.write_error_report(get_error_dfs(), output_path)
+    written_df = pd.read_parquet(output_path)
+    assert len(written_df) == 3
+    assert list(written_df['transfer_log_rows'][1]) == [4, 5]
+    assert written_df['flywheel_id'][1] is None
+
+
+def test_write_error_report_renders_error_codes(tmp_path):
+    pytest.importorskip('pyarrow')
+    error_df = transfer_log.set_error_code_dtypes(pd.DataFrame({
+        'flywheel_id': ['5cf7ec6bd9a631002dfddefe'],
+        'transfer_log_rows': [[5]],
+        'error_code': [transfer_log.ErrorCode.MORE_IN_FLYWHEEL],
+        'container_type': ['acquisition'],
+        'count_difference': [2],
+        'matching_fw_ids': [['5cf7ec6bd9a631002dfddefe']],
+        'path': ['group/project/10553/Week 0/T1w']
+    }))
+    output_path = str(tmp_path / 'report.parquet')
+    assert transfer_log.write_error_report([error_df], output_path) == 2
+    written_df = pd.read_parquet(output_path)
+    assert written_df['error'][0] == '2 more records in flywheel than in transfer_log'
+    assert written_df['error_code'].dtype == 'uint8'
+    assert written_df['count_difference'][0] == 2
+
+
+def test_write_error_report_parquet_keeps_flags(tmp_path):
+    pytest.importorskip('pyarrow')
+    error_dfs = get_error_dfs()
+    for error_df, resolved in zip(error_dfs, [False, True]):
+        error_df['status'] = 'resolved' if resolved else 'new'
+        error_df['resolved'] = resolved
+    output_path = str(tmp_path / 'report.parquet')
+    transfer_log.write_error_report(error_dfs, output_path)
+    written_df = pd.read_parquet(output_path)
+    assert written_df['resolved'].dtype == bool
+    assert list(written_df['resolved']) == [False, False, True]
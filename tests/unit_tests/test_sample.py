@@ -0,0 +1,82 @@
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+import sample
+import transfer_log
+
+DATA_ROOT = Path(__file__).parent / 'data'
+
+
+def test_allocate_sample():
+    allocation = sample.allocate_sample({'both': 900, 'flywheel': 90, 'log': 10}, 100)
+    assert allocation == {'both': 90, 'flywheel': 9, 'log': 2}
+    # Small strata are sampled entirely
+    assert sample.allocate_sample({'both': 1, 'log': 0}, 10) == {'both': 1, 'log': 0}
+
+
+def test_sample_strata_is_repeatable():
+    strata = {'both': [str(index) for index in range(100)], 'log': ['a', 'b', 'c']}
+    sampled = sample.sample_strata(strata, 10, seed=3)
+    assert len(sampled['both']) == 10
+    assert len(sampled['log']) == 2
+    assert set(sampled['both']) <= set(strata['both'])
+    shuffled = {'both': list(reversed(strata['both'])), 'log': strata['log']}
+    assert sample.sample_strata(shuffled, 10, seed=3) == sampled
+
+
+def test_estimate_error_rate():
+    estimate = sample.estimate_error_rate(
+        {'both': 100, 'log': 2},
+        {'both': [0, 0, 1, 3, 0, 0, 0, 0, 2, 0], 'log': [1, 1]}
+    )
+    assert estimate['subjects'] == 102
+    assert estimate['sampled_subjects'] == 12
+    assert estimate['error_rate'] == pytest.approx((100 * 0.3 + 2) / 102)
+    assert estimate['estimated_error_count'] == pytest.approx(100 * 0.6 + 2)
+    low, high = estimate['error_rate_ci']
+    assert 0 <= low < estimate['error_rate'] < high <= 1
+    assert estimate['strata']['log'] == {'subjects': 2, 'sampled_subjects': 2, 'error_rate': 1}
+    # A fully sampled population has no sampling error
+    exact = sample.estimate_error_rate({'log': 2}, {'log': [1, 0]})
+    assert exact['error_rate_ci'] == [0.5, 0.5]
+    assert exact['estimated_error_count_ci'] == [1, 1]
+
+
+def test_sample_subjects_drops_unsampled_rows():
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    test_transfer_log = transfer_log.TransferLog(
+        client=None, config=config, transfer_log_path=DATA_ROOT / 'test-transfer-log.xlsx',
+        project_id=None, case_insensitive=True, sample_size=3, sample_seed=1
+    )
+    test_transfer_log.load_metadata_table()
+    subjects = [MagicMock(label='10651')] + [
+        MagicMock(label='fw-{}'.format(index)) for index in range(20)
+    ]
+    sampled_subjects = test_transfer_log.sample_subjects(subjects)
+    assert test_transfer_log.sample_strata['transfer log only'] == ['10553']
+    assert len(test_transfer_log.sample_strata['flywheel only']) == 20
+    # Strata smaller than MIN_STRATUM_SAMPLE are sampled entirely
+    assert len(sampled_subjects) == 4
+    assert subjects[0] in sampled_subjects
+    assert test_transfer_log.sampled_subject_keys == set(
+        test_transfer_log.get_subject_key(subject.label) for subject in sampled_subjects
+    ) | {'10553'}
+    # Only the transfer log rows of sampled subjects are kept
+    assert set(test_transfer_log.metadata_df['subject.label']) == {'10651', '10553'}
+    assert len(test_transfer_log.metadata_table) == len(test_transfer_log.metadata_df)
+
+
+def test_empty_container_scan_is_restricted_to_subjects():
+    client = MagicMock()
+    client.sessions.iter_find.side_effect = lambda query: iter(
+        [MagicMock(id='empty-' + query.split(',')[0].split('=')[1])]
+    )
+    empty_ids = transfer_log.TransferLog.get_empty_container_ids(
+        client, 'project', 'session', subject_ids=['a', 'b']
+    )
+    assert empty_ids == ['empty-a', 'empty-b']
+    assert [call[0][0] for call in client.sessions.iter_find.call_args_list] == [
+        'parents.subject=a,files.size=null', 'parents.subject=b,files.size=null'
+    ]
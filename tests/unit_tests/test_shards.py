@@ -0,0 +1,100 @@
+from pathlib import Path
+
+import flywheel
+import pandas as pd
+import pytest
+
+import merge_shards
+import transfer_log
+import utils
+
+DATA_ROOT = Path(__file__).parent / 'data'
+
+
+def get_test_transfer_log(shard_index=0, shard_count=1):
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    test_transfer_log = transfer_log.TransferLog(
+        client=None, config=config, transfer_log_path=DATA_ROOT / 'test-transfer-log.xlsx',
+        project_id=None, case_insensitive=True, shard_index=shard_index, shard_count=shard_count
+    )
+    test_transfer_log.load_metadata_table()
+    mock_view_df = pd.read_csv(DATA_ROOT / 'test-fw-view.csv', dtype={'subject.label': 'object'})
+    # Only keep the subjects a sharded fetch would have loaded
+    subject_keys = mock_view_df['subject.label'].map(test_transfer_log.get_subject_key)
+    mock_view_df = mock_view_df[subject_keys.map(test_transfer_log.subject_in_scope)]
+    mock_view_dict_list = transfer_log.format_flywheel_table(mock_view_df.to_dict(orient='records'))
+    test_transfer_log.create_flywheel_table(mock_view_dict_list)
+    test_transfer_log.get_path_dict(flywheel.Project(group='test_group', label='test_project'))
+    test_transfer_log.match_df_records()
+    return test_transfer_log
+
+
+def test_get_subject_shard_is_stable():
+    assert utils.get_subject_shard('10651', 4) == utils.get_subject_shard('10651', 4)
+    assert {utils.get_subject_shard(str(label), 4) for label in range(100)} == {0, 1, 2, 3}
+
+
+def test_sharding_requires_subject_label():
+    config = transfer_log.Config({'query': [{'session.label': 'Label'}], 'join': 'session'})
+    with pytest.raises(ValueError):
+        transfer_log.TransferLog(None, config, None, None, shard_index=0, shard_count=2)
+
+
+def test_shard_index_must_be_below_shard_count():
+    config = transfer_log.Config({'query': [{'subject.label': 'Subject'}], 'join': 'session'})
+    for shard_index in [-1, 2]:
+        with pytest.raises(ValueError):
+            transfer_log.TransferLog(None, config, None, None,
+                                     shard_index=shard_index, shard_count=2)
+
+
+def test_merge_shard_reports_matches_unsharded_run(tmp_path):
+    full_transfer_log = get_test_transfer_log()
+    full_error_df = full_transfer_log.get_error_df()
+    full_error_count = full_transfer_log.count_df_errors(full_error_df)
+
+    report_paths = list()
+    for shard_index in range(3):
+        shard_transfer_log = get_test_transfer_log(shard_index, 3)
+        report_path = tmp_path / 'shard-{}.csv'.format(shard_index)
+        shard_transfer_log.get_error_df().to_csv(report_path, index=False)
+        report_paths.append(report_path)
+
+    merged_error_df, merged_error_count = merge_shards.merge_shard_reports(report_paths)
+    assert merged_error_count == full_error_count
+    assert len(merged_error_df) == len(full_error_df)
+    assert sorted(merged_error_df['error']) == sorted(full_error_df['error'])
+
+
+def test_merge_shard_reports_does_not_count_unreconciled_subjects(tmp_path):
+    shard_transfer_log = get_test_transfer_log(0, 2)
+    error_df = shard_transfer_log.get_error_df()
+    uncovered_df = transfer_log.render_error_messages(shard_transfer_log.get_subject_error_df(
+        [{'id': 'subject-id', 'label': 'late', 'path': 'test_group/test_project/late'}],
+        transfer_log.ErrorCode.SUBJECT_NOT_RECONCILED
+    ))
+    report_path = tmp_path / 'shard-0.csv'
+    pd.concat([error_df, uncovered_df], ignore_index=True).to_csv(report_path, index=False)
+
+    merged_error_df, merged_error_count = merge_shards.merge_shard_reports([report_path])
+    assert merged_error_count == shard_transfer_log.count_df_errors(error_df)
+    assert list(merge_shards.get_unreconciled_rows(merged_error_df)) == \
+        [False] * len(error_df) + [True]
+
+
+def test_merge_shard_reports_reads_every_report_format(tmp_path):
+    full_transfer_log = get_test_transfer_log()
+    full_error_df = full_transfer_log.get_error_df()
+
+    report_paths = list()
+    for shard_index, filename in enumerate(['shard-0.csv.gz', 'shard-1.jsonl', 'shard-2.parquet']):
+        if filename.endswith('.parquet'):
+            pytest.importorskip('pyarrow')
+        report_path = str(tmp_path / filename)
+        transfer_log.write_error_report([get_test_transfer_log(shard_index, 3).get_error_df()],
+                                        report_path)
+        report_paths.append(report_path)
+
+    merged_error_df, merged_error_count = merge_shards.merge_shard_reports(report_paths)
+    assert merged_error_count == full_transfer_log.count_df_errors(full_error_df)
+    assert sorted(merged_error_df['error']) == sorted(full_error_df['error'])
@@ -0,0 +1,73 @@
+import os
+from pathlib import Path
+
+import flywheel
+import pandas as pd
+import pytest
+
+import snapshot
+import transfer_log
+
+DATA_ROOT = Path(__file__).parent / 'data'
+
+
+def get_test_transfer_log():
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    return transfer_log.TransferLog(
+        client=None, config=config, transfer_log_path=DATA_ROOT / 'test-transfer-log.xlsx',
+        project_id=None, case_insensitive=True
+    )
+
+
+def test_snapshot_round_trip(tmp_path):
+    records = [
+        {'acquisition.id': 'a', 'subject.label': 10651, 'x': None, 'valid': True},
+        {'acquisition.id': 'b', 'subject.label': None, 'x': 1.5, 'valid': False},
+        {'acquisition.id': 'c', 'subject.label': 3, 'x': 2, 'valid': None},
+    ]
+    snapshot_path = str(tmp_path / 'snapshot.parquet')
+    snapshot.save_snapshot(snapshot_path, records, {'a': 'group/project/a'}, ['b'],
+                           project_id='project')
+    project_snapshot = snapshot.load_snapshot(snapshot_path)
+    assert project_snapshot['records'] == [
+        {'acquisition.id': 'a', 'subject.label': 10651, 'x': None, 'valid': True},
+        {'acquisition.id': 'b', 'subject.label': None, 'x': 1.5, 'valid': False},
+        {'acquisition.id': 'c', 'subject.label': 3, 'x': 2.0, 'valid': None},
+    ]
+    assert project_snapshot['resolver_path_dict'] == {'a': 'group/project/a'}
+    assert project_snapshot['empty_containers'] == ['b']
+    assert project_snapshot['project_id'] == 'project'
+
+
+def test_transfer_log_from_snapshot(tmp_path):
+    fetched_transfer_log = get_test_transfer_log()
+    fetched_transfer_log.load_metadata_table()
+    mock_view_df = pd.read_csv(DATA_ROOT / 'test-fw-view.csv', dtype={'subject.label': 'object'})
+    fetched_transfer_log.create_flywheel_table(
+        transfer_log.format_flywheel_table(mock_view_df.to_dict(orient='records'))
+    )
+    fetched_transfer_log.get_path_dict(flywheel.Project(group='test_group', label='test_project'))
+    fetched_transfer_log.empty_containers = ['869a4628bf33d1b3de842c2f']
+    fetched_transfer_log.match_df_records()
+    snapshot_path = str(tmp_path / 'snapshot.parquet')
+    fetched_transfer_log.save_snapshot(snapshot_path)
+
+    replayed_transfer_log = get_test_transfer_log()
+    replayed_transfer_log.initialize(snapshot_path)
+    pd.testing.assert_frame_equal(replayed_transfer_log.get_error_df(),
+                                  fetched_transfer_log.get_error_df())
+
+
+def test_partial_fetch_cannot_be_saved(tmp_path):
+    snapshot_path = str(tmp_path / 'snapshot.parquet')
+    sharded_transfer_log = transfer_log.TransferLog(
+        None, transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml'),
+        None, None, shard_index=0, shard_count=2
+    )
+    with pytest.raises(ValueError):
+        sharded_transfer_log.save_snapshot(snapshot_path)
+    truncated_transfer_log = get_test_transfer_log()
+    truncated_transfer_log.uncovered_subjects = [{'id': 'id', 'label': '001', 'path': None}]
+    with pytest.raises(ValueError):
+        truncated_transfer_log.save_snapshot(snapshot_path)
+    assert not os.path.exists(snapshot_path)
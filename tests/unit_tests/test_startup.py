@@ -0,0 +1,62 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+import run
+import transfer_log
+
+REPO_ROOT = Path(__file__).parents[2]
+DATA_ROOT = Path(__file__).parent / 'data'
+
+
+def test_import_does_not_load_heavy_modules():
+    code = (
+        'import sys, run, transfer_log; '
+        'print(",".join(m for m in ["pandas", "numpy", "flywheel", "xlrd"] if m in sys.modules))'
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=str(REPO_ROOT),
+                            stdout=subprocess.PIPE, check=True, universal_newlines=True)
+    assert result.stdout.strip() == ''
+
+
+def test_check_inputs_rejects_malformed_transfer_log(tmp_path):
+    transfer_log_path = tmp_path / 'transfer-log.csv'
+    transfer_log_path.write_text(
+        'Subject,Modality - Exam Date,Timepoint\n10651,MR - 2005-08-23,Week 4\n'
+    )
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps({'inputs': {
+        'template': {'location': {'path': str(DATA_ROOT / 'test-transfer-log-template.yml')}},
+        'transfer_log': {'location': {'path': str(transfer_log_path)}}
+    }}))
+    with pytest.raises(transfer_log.TransferLogException):
+        run.check_inputs(str(config_path), str(tmp_path))
+    error_report = (tmp_path / 'error-transfer-log.csv').read_text()
+    assert 'Modality - Exam Date' in error_report
+
+
+def test_check_inputs_rows_are_not_loaded_again(tmp_path):
+    transfer_log_path = tmp_path / 'transfer-log.csv'
+    transfer_log_path.write_text(
+        'Subject,Modality - Exam Date,Timepoint\n10651,"MR - May 23, 2005",Screening\n'
+    )
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps({'inputs': {
+        'template': {'location': {'path': str(DATA_ROOT / 'test-transfer-log-template.yml')}},
+        'transfer_log': {'location': {'path': str(transfer_log_path)}}
+    }}))
+    rows = run.check_inputs(str(config_path), str(tmp_path))
+    assert len(rows) == 1
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    test_transfer_log = transfer_log.TransferLog(
+        client=None, config=config, transfer_log_path=str(transfer_log_path), project_id=None,
+        transfer_log_rows=rows
+    )
+    with patch('transfer_log.load_transfer_log') as mock_load:
+        test_transfer_log.load_metadata_table()
+    mock_load.assert_not_called()
+    assert len(test_transfer_log.metadata_table) == 1
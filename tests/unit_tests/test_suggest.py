@@ -0,0 +1,78 @@
+import random
+from pathlib import Path
+
+import flywheel
+import pandas as pd
+
+import suggest
+import transfer_log
+
+DATA_ROOT = Path(__file__).parent / 'data'
+
+
+def test_get_edit_distance():
+    assert suggest.get_edit_distance('10651', '10651') == 0
+    assert suggest.get_edit_distance('10651', '10615') == 2
+    assert suggest.get_edit_distance('week 4', 'week 14') == 1
+    assert suggest.get_edit_distance('', 'abc') == 3
+    # Stops early once the distance exceeds max_distance
+    assert suggest.get_edit_distance('screening', 'week 12', max_distance=2) == 3
+
+
+def test_bk_tree_matches_brute_force():
+    rng = random.Random(0)
+    values = [''.join(rng.choice('abc') for _ in range(rng.randint(1, 6))) for _ in range(300)]
+    tree = suggest.BKTree(values)
+    for query in values[:30] + ['abcabc', 'z']:
+        expected = {
+            (suggest.get_edit_distance(query, value), value) for value in set(values)
+            if suggest.get_edit_distance(query, value) <= 2
+        }
+        assert set(tree.search(query, 2)) == expected
+
+
+def test_match_key_index_suggest():
+    index = suggest.MatchKeyIndex(
+        ['subject.label', 'session.label'],
+        [('10651', 'week 4'), ('10615', 'week 4'), ('20000', 'screening'), ('10651', None)],
+        ['a', 'b', 'c', 'd']
+    )
+    suggestions = index.suggest(('10651', 'week 14'))
+    # ('10615', 'week 4') is 3 edits away
+    assert [(distance, payload) for distance, payload, _ in suggestions] == [(1, 'a')]
+    distance, payload, differences = suggestions[0]
+    assert differences == [('session.label', 'week 14', 'week 4')]
+    assert suggest.format_differences(differences) == "session.label 'week 14' -> 'week 4'"
+    # Exact matches and distant keys are not suggested
+    assert index.suggest(('20000', 'screening')) == []
+    assert index.suggest(('99999', 'unknown')) == []
+    # Missing values are compared as empty strings
+    assert [payload for _, payload, _ in index.suggest(('10651', 'w'))] == ['d']
+
+
+def test_transfer_log_suggest_matches():
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    test_transfer_log = transfer_log.TransferLog(
+        client=None, config=config, transfer_log_path=DATA_ROOT / 'test-transfer-log.xlsx',
+        project_id=None, case_insensitive=True, suggest_matches=True
+    )
+    test_transfer_log.load_metadata_table()
+    mock_view_df = pd.read_csv(DATA_ROOT / 'test-fw-view.csv', dtype={'subject.label': 'object'})
+    test_transfer_log.create_flywheel_table(
+        transfer_log.format_flywheel_table(mock_view_df.to_dict(orient='records'))
+    )
+    test_transfer_log.get_path_dict(flywheel.Project(group='test_group', label='test_project'))
+    test_transfer_log.match_df_records()
+    error_df = test_transfer_log.get_error_df()
+
+    assert list(error_df.columns[-2:]) == ['suggested_matches', 'suggestion_differences']
+    flywheel_only = error_df[error_df['flywheel_id'] == '869a4628bf33d1b3de842c2f'].iloc[0]
+    log_only = error_df[error_df['flywheel_id'].isnull()].iloc[0]
+    # The Flywheel timestamp typo and the transfer log row point at each other
+    assert flywheel_only['suggested_matches'] == log_only['transfer_log_rows']
+    assert log_only['suggested_matches'] == ['869a4628bf33d1b3de842c2f']
+    assert log_only['suggestion_differences'] == \
+        "session.timestamp 'aug 23, 2005' -> 'aug 27, 2005'"
+    # Count mismatches matched, so they get no suggestions
+    assert error_df[error_df['transfer_log_rows'].notnull() &
+                    error_df['flywheel_id'].notnull()]['suggested_matches'].isnull().all()
@@ -1,5 +1,6 @@
 import datetime
 from pathlib import Path
+from unittest.mock import MagicMock, patch
 
 import pandas as pd
 import flywheel
@@ -82,3 +83,274 @@ def test_flywheel_row():
     test_fw_dict['session.timestamp'] = '08/01/2014'
     assert test_fw_row.spreadsheet_index == 'test_id'
     assert test_fw_row.match_dict == test_fw_dict
+
+
+def test_transfer_log_reconcile_many(tmp_path):
+    metadata_path = DATA_ROOT / 'test-transfer-log.xlsx'
+    # Each site sends the rows of its own subject
+    site_paths = list()
+    for site, subject in [('S01852', '10651'), ('S09384', '10553')]:
+        site_path = tmp_path / site / 'transfer-log.csv'
+        site_path.parent.mkdir()
+        site_df = pd.DataFrame(
+            [row for row in SITE_ROWS if row[0] == site],
+            columns=['Site', 'Subject', 'Timepoint', 'Modality - Exam Date']
+        )
+        assert set(site_df['Subject']) == {subject}
+        site_df.to_csv(site_path, index=False)
+        site_paths.append(str(site_path))
+    config_path = DATA_ROOT / 'test-transfer-log-template.yml'
+    mock_view_path = DATA_ROOT / 'test-fw-view.csv'
+    config = transfer_log.load_config_file(config_path)
+    test_transfer_log = transfer_log.TransferLog(client=None, config=config, transfer_log_path=None,
+                                                 project_id=None, case_insensitive=True)
+    mock_view_df = pd.read_csv(
+        mock_view_path, dtype={'subject.label': 'object'}
+    )
+    mock_view_dict_list = transfer_log.format_flywheel_table(mock_view_df.to_dict(orient='records'))
+    test_transfer_log.create_flywheel_table(mock_view_dict_list)
+    test_transfer_log.get_path_dict(flywheel.Project(group='test_group', label='test_project'))
+
+    single_error_df = test_transfer_log.reconcile(metadata_path)
+    combined_error_df = test_transfer_log.reconcile_many(site_paths)
+    assert list(combined_error_df.columns) == ['source_log'] + list(single_error_df.columns)
+    # The sites split the project, so its errors are reported once
+    assert len(combined_error_df) == len(single_error_df)
+    assert sorted(combined_error_df['error']) == sorted(single_error_df['error'])
+    assert test_transfer_log.count_df_errors(combined_error_df) == \
+        test_transfer_log.count_df_errors(single_error_df)
+    # Flywheel containers that no log matched belong to no log
+    flywheel_only = combined_error_df['error'] == 'acquisition in flywheel not present in transfer_log'
+    assert flywheel_only.any()
+    assert combined_error_df.loc[flywheel_only, 'source_log'].isnull().all()
+    assert set(combined_error_df.loc[~flywheel_only, 'source_log']) == {site_paths[1]}
+
+
+SITE_ROWS = [
+    ['S01852', '10651', 'Screening', 'MR - May 23, 2005'],
+    ['S01852', '10651', 'Week 0', 'MR - Jun 23, 2005'],
+    ['S01852', '10651', 'Week 12', 'MR - Aug 17, 2005'],
+    ['S01852', '10651', 'Week 16', 'MR - Sep 19, 2005'],
+    ['S09384', '10553', 'Screening', 'MR - May 16, 2005'],
+    ['S09384', '10553', 'Week 4', 'MR - Jul 07, 2005'],
+    ['S09384', '10553', 'Week 12', 'MR - Aug 23, 2005'],
+    ['S09384', '10553', 'Week 16', 'MR - Sep 20, 2005'],
+]
+
+
+def test_match_columns_share_categories():
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    test_transfer_log = transfer_log.TransferLog(
+        client=None, config=config, transfer_log_path=DATA_ROOT / 'test-transfer-log.xlsx',
+        project_id=None, case_insensitive=True
+    )
+    test_transfer_log.load_metadata_table()
+    mock_view_df = pd.read_csv(DATA_ROOT / 'test-fw-view.csv', dtype={'subject.label': 'object'})
+    test_transfer_log.create_flywheel_table(
+        transfer_log.format_flywheel_table(mock_view_df.to_dict(orient='records'))
+    )
+    test_transfer_log.get_path_dict(flywheel.Project(group='test_group', label='test_project'))
+    test_transfer_log.match_df_records()
+    for column in test_transfer_log.match_cols:
+        fw_dtype = test_transfer_log.flywheel_df[column].dtype
+        assert isinstance(fw_dtype, pd.CategoricalDtype)
+        assert fw_dtype == test_transfer_log.metadata_df[column].dtype
+    error_df = test_transfer_log.get_error_df()
+    assert (error_df[test_transfer_log.match_cols].dtypes == object).all()
+    assert len(error_df) == 5
+
+
+def test_id_codec():
+    codec = transfer_log.IdCodec()
+    codes = codec.encode_many(['5e1', '5e2', '5e1'])
+    assert codes.dtype == 'int64'
+    assert codes.tolist() == [0, 1, 0]
+    assert codec.get_known_codes(['5e2', 'unknown']).tolist() == [1]
+    assert codec.decode_many([1, 0]) == ['5e2', '5e1']
+
+
+def test_empty_container_error_uses_id_codes():
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    test_transfer_log = transfer_log.TransferLog(
+        client=None, config=config, transfer_log_path=DATA_ROOT / 'test-transfer-log.xlsx',
+        project_id=None, case_insensitive=True
+    )
+    test_transfer_log.load_metadata_table()
+    mock_view_df = pd.read_csv(DATA_ROOT / 'test-fw-view.csv', dtype={'subject.label': 'object'})
+    test_transfer_log.create_flywheel_table(
+        transfer_log.format_flywheel_table(mock_view_df.to_dict(orient='records'))
+    )
+    test_transfer_log.get_path_dict(flywheel.Project(group='test_group', label='test_project'))
+    test_transfer_log.empty_containers = ['869a4628bf33d1b3de842c2f', 'not-in-view']
+    test_transfer_log.match_df_records()
+    assert test_transfer_log.flywheel_df['tl_index'].dtype == 'int64'
+    error_df = test_transfer_log.get_error_df().set_index('flywheel_id')
+    assert error_df.loc['869a4628bf33d1b3de842c2f', 'error'] == \
+        'acquisition in flywheel contains no files'
+    assert error_df.loc['869a4628bf33d1b3de842c2f', 'matching_fw_ids'] == \
+        ['869a4628bf33d1b3de842c2f']
+    assert error_df.loc['869a4628bf33d1b3de842c2f', 'path'].startswith('test_group/test_project/')
+
+
+def test_write_validity_flags_only_writes_changes():
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    test_transfer_log = transfer_log.TransferLog(
+        client=None, config=config, transfer_log_path=DATA_ROOT / 'test-transfer-log.xlsx',
+        project_id=None, case_insensitive=True
+    )
+    test_transfer_log.load_metadata_table()
+    mock_view_df = pd.read_csv(DATA_ROOT / 'test-fw-view.csv', dtype={'subject.label': 'object'})
+    # Flags stored by a previous run
+    mock_view_df['acquisition.info.transfer_log.valid'] = None
+    mock_view_df.loc[mock_view_df['acquisition.id'] == '0c4399d2a5b211eab936acde',
+                     'acquisition.info.transfer_log.valid'] = True
+    mock_view_df.loc[mock_view_df['acquisition.id'] == '869a4628bf33d1b3de842c2f',
+                     'acquisition.info.transfer_log.valid'] = False
+    test_transfer_log.create_flywheel_table(transfer_log.format_flywheel_table(
+        mock_view_df.to_dict(orient='records'),
+        ignore_cols=['acquisition.info.transfer_log.valid']
+    ))
+    test_transfer_log.match_df_records()
+
+    updates = test_transfer_log.get_validity_updates()
+    assert '0c4399d2a5b211eab936acde' not in updates
+    assert '869a4628bf33d1b3de842c2f' not in updates
+    assert updates['3a434dd5a8f0c33c18ddc7c2'] is True
+    assert len(updates) == mock_view_df['acquisition.id'].nunique() - 2
+
+    client = MagicMock()
+    assert transfer_log.write_validity_flags(client, 'acquisition', updates, dry_run=True) == 0
+    client.modify_acquisition_info.assert_not_called()
+    assert transfer_log.write_validity_flags(client, 'acquisition', updates, rate=1000) == len(updates)
+    client.modify_acquisition_info.assert_any_call(
+        '3a434dd5a8f0c33c18ddc7c2', {'set': {'transfer_log': {'valid': True}}}
+    )
+    assert client.modify_acquisition_info.call_count == len(updates)
+
+
+def test_targeted_fetch_only_fetches_transfer_log_subjects():
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    client = MagicMock()
+    subjects = [MagicMock(id='subject-{}'.format(label), label=label)
+                for label in ['10651', '10553', '20001']]
+    client.get_project.return_value.subjects.iter.side_effect = lambda: iter(subjects)
+    test_transfer_log = transfer_log.TransferLog(
+        client=client, config=config, transfer_log_path=DATA_ROOT / 'test-transfer-log.xlsx',
+        project_id='project', case_insensitive=True, targeted_fetch=True
+    )
+    test_transfer_log.load_metadata_table()
+    unexpected_subjects = list()
+    with patch('transfer_log.get_flywheel_records', return_value=pd.DataFrame()) as mock_get_records:
+        test_transfer_log.load_flywheel_table(unexpected_subjects=unexpected_subjects)
+    assert mock_get_records.call_args[1]['subjects'] == subjects[:2]
+    assert unexpected_subjects == subjects[2:]
+
+    project = flywheel.Project(group='test_group', label='test_project')
+    subject_dicts = test_transfer_log.get_subject_dicts(project, unexpected_subjects)
+    error_df = test_transfer_log.get_subject_error_df(
+        subject_dicts, transfer_log.ErrorCode.NOT_IN_TRANSFER_LOG
+    )
+    assert list(error_df.columns) == test_transfer_log.get_report_columns()
+    assert error_df.loc[0, 'flywheel_id'] == 'subject-20001'
+    assert error_df.loc[0, 'subject.label'] == '20001'
+    assert error_df.loc[0, 'path'] == 'test_group/test_project/20001'
+    assert transfer_log.render_error_messages(error_df).loc[0, 'error'] == \
+        'subject in flywheel not present in transfer_log'
+    assert test_transfer_log.count_df_errors(error_df) == 1
+
+
+def test_create_flywheel_df_matches_flywheel_table():
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    mock_view_df = pd.read_csv(DATA_ROOT / 'test-fw-view.csv', dtype={'subject.label': 'object'})
+    rows = transfer_log.format_json_list_for_python(
+        mock_view_df.where(mock_view_df.notna(), None).to_dict(orient='records')
+    )
+    project = flywheel.Project(group='test_group', label='test_project')
+    error_dfs = list()
+    for columnar in [False, True]:
+        test_transfer_log = transfer_log.TransferLog(
+            client=None, config=config, transfer_log_path=DATA_ROOT / 'test-transfer-log.xlsx',
+            project_id=None, case_insensitive=True
+        )
+        test_transfer_log.load_metadata_table()
+        if columnar:
+            columns = transfer_log.FlywheelColumns()
+            # Rows arrive subject by subject, not always with every column
+            columns.extend(rows[:2])
+            columns.extend([
+                {key: value for key, value in row.items() if key != 'file.name'}
+                for row in rows[2:3]
+            ])
+            columns.extend(rows[3:])
+            test_transfer_log.create_flywheel_df(columns.get_df())
+            assert not test_transfer_log.flywheel_table
+        else:
+            test_transfer_log.create_flywheel_table(transfer_log.format_flywheel_table(rows))
+        test_transfer_log.get_path_dict(project)
+        test_transfer_log.match_df_records()
+        error_dfs.append(test_transfer_log.get_error_df())
+    pd.testing.assert_frame_equal(error_dfs[0], error_dfs[1])
+
+
+def test_rollup_errors_to_missing_subjects_and_sessions():
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    test_transfer_log = transfer_log.TransferLog(
+        client=None, config=config, transfer_log_path=DATA_ROOT / 'test-transfer-log.xlsx',
+        project_id=None, case_insensitive=True, rollup_errors=True
+    )
+    test_transfer_log.load_metadata_table()
+    mock_view_df = pd.read_csv(DATA_ROOT / 'test-fw-view.csv', dtype={'subject.label': 'object'})
+    # Subject 10651 is missing from Flywheel
+    mock_view_df = mock_view_df[mock_view_df['subject.label'] != '10651']
+    test_transfer_log.create_flywheel_table(
+        transfer_log.format_flywheel_table(mock_view_df.to_dict(orient='records'))
+    )
+    test_transfer_log.get_path_dict(flywheel.Project(group='test_group', label='test_project'))
+    test_transfer_log.match_df_records()
+    assert test_transfer_log.get_rollup_key_columns('session') == [
+        'subject.label', 'session.timestamp', 'session.label'
+    ]
+    error_df = transfer_log.render_error_messages(
+        pd.concat(test_transfer_log.iter_error_dfs(), ignore_index=True)
+    )
+    subject_df = error_df[error_df['error'] == 'subject in transfer_log not present in flywheel']
+    assert subject_df['subject.label'].tolist() == ['10651']
+    assert subject_df['child_count'].tolist() == [4]
+    assert len(subject_df['transfer_log_rows'].iloc[0]) == 4
+    assert subject_df[['session.label', 'file.modality']].isnull().all(axis=None)
+    session_df = error_df[error_df['error'] == 'session in flywheel not present in transfer_log']
+    assert sorted(session_df['path']) == [
+        'test_group/test_project/10553/Week 12', 'test_group/test_project/10553/Week 4'
+    ]
+    assert (session_df['child_count'] == 1).all()
+    # A rolled up subject or session is a single error
+    assert test_transfer_log.count_df_errors(error_df) == 7
+
+
+def test_error_codes_are_rendered_once_per_error():
+    config = transfer_log.load_config_file(DATA_ROOT / 'test-transfer-log-template.yml')
+    test_transfer_log = transfer_log.TransferLog(
+        client=None, config=config, transfer_log_path=DATA_ROOT / 'test-transfer-log.xlsx',
+        project_id=None, case_insensitive=True
+    )
+    test_transfer_log.load_metadata_table()
+    mock_view_df = pd.read_csv(DATA_ROOT / 'test-fw-view.csv', dtype={'subject.label': 'object'})
+    test_transfer_log.create_flywheel_table(
+        transfer_log.format_flywheel_table(mock_view_df.to_dict(orient='records'))
+    )
+    test_transfer_log.get_path_dict(flywheel.Project(group='test_group', label='test_project'))
+    test_transfer_log.match_df_records()
+    error_df = test_transfer_log.get_error_df(render=False)
+    assert 'error' not in error_df.columns
+    assert error_df['error_code'].dtype == 'uint8'
+    assert error_df['count_difference'].dtype == 'uint32'
+    more_df = error_df[error_df['error_code'] == transfer_log.ErrorCode.MORE_IN_FLYWHEEL]
+    assert more_df['count_difference'].tolist() == [1, 1]
+    rendered_df = transfer_log.render_error_messages(error_df)
+    assert list(rendered_df.columns).index('error') == list(rendered_df.columns).index('error_code') - 1
+    assert rendered_df.equals(test_transfer_log.get_error_df())
+    assert set(rendered_df['error']) == {
+        'acquisition in flywheel not present in transfer_log',
+        '1 more records in flywheel than in transfer_log',
+        'acquisition in transfer_log not present in flywheel'
+    }
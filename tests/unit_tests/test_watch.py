@@ -0,0 +1,89 @@
+import datetime
+import json
+import os
+from unittest.mock import MagicMock
+
+import urllib3
+
+import transfer_log
+import watch
+
+
+class MockContainer(object):
+    def __init__(self, container_id, label, subject_id=None, modified=None):
+        self.id = container_id
+        self.label = label
+        self.parents = MagicMock(subject=subject_id)
+        self.modified = modified
+
+
+def get_view_response(rows):
+    return urllib3.response.HTTPResponse(body=bytes(json.dumps(rows), 'utf-8'))
+
+
+def get_mock_client(sessions, subjects):
+    view_rows = {
+        subject.id: [{
+            'subject.label': subject.label, 'session.label': 'Week 0',
+            'session.id': subject.id.replace('sub', 'ses'),
+            'session.info.transfer_log.valid': None, 'session.deleted': False
+        }] for subject in subjects
+    }
+    client = MagicMock()
+    project = MagicMock(id='project', group='group', label='project')
+    project.subjects.iter.return_value = subjects
+    client.get_project.return_value = project
+    client.subjects.iter_find.side_effect = lambda query: list(subjects)
+    client.sessions.iter_find.side_effect = lambda query: list(sessions) if 'files' not in query else []
+    client.read_view_data.side_effect = lambda view, container_id, **kwargs: get_view_response(
+        view_rows[container_id]
+    )
+    return client
+
+
+def test_watcher_only_refreshes_changed_subjects(tmp_path):
+    transfer_log_path = tmp_path / 'transfer-log.csv'
+    transfer_log_path.write_text('Subject,Visit\n001,Week 0\n002,Week 0\n')
+    config = transfer_log.Config({
+        'query': [{'subject.label': 'Subject'}, {'session.label': 'Visit'}],
+        'join': 'session'
+    })
+    modified = datetime.datetime(2020, 1, 1)
+    sessions = [
+        MockContainer('ses1', 'Week 0', 'sub1', modified),
+        MockContainer('ses2', 'Week 0', 'sub2', modified)
+    ]
+    subjects = [MockContainer('sub1', '001', modified=modified),
+                MockContainer('sub2', '002', modified=modified)]
+    client = get_mock_client(sessions, subjects)
+    test_transfer_log = transfer_log.TransferLog(client, config, str(transfer_log_path), 'project')
+    output_path = str(tmp_path / 'report.csv')
+    watcher = watch.TransferLogWatcher(test_transfer_log, output_path, poll_interval=0)
+
+    assert watcher.run_once() == 0
+    assert client.read_view_data.call_count == 2
+    # Nothing changed, nothing is fetched or written
+    assert watcher.run_once() is None
+    assert client.read_view_data.call_count == 2
+
+    sessions[1].modified = modified + datetime.timedelta(days=1)
+    assert watcher.run_once() == 0
+    assert client.read_view_data.call_count == 3
+    assert client.read_view_data.call_args[0][1] == 'sub2'
+    # Only the changed subject is scanned for empty containers
+    empty_queries = [call[0][0] for call in client.sessions.iter_find.call_args_list
+                     if 'files' in call[0][0]]
+    assert empty_queries[-1] == 'parents.subject=sub2,files.size=null'
+    assert len(empty_queries) == 3
+
+    # Renaming a subject changes its rows, not its sessions
+    subjects[0].modified = modified + datetime.timedelta(days=1)
+    assert watcher.run_once() == 0
+    assert client.read_view_data.call_count == 4
+    assert client.read_view_data.call_args[0][1] == 'sub1'
+
+    # A transfer log change is reconciled against the records in memory
+    transfer_log_path.write_text('Subject,Visit\n001,Week 0\n002,Week 0\n003,Week 0\n')
+    os.utime(transfer_log_path, (0, 0))
+    assert watcher.run_once(refresh_flywheel=False) == 1
+    assert client.read_view_data.call_count == 4
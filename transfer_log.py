@@ -4,24 +4,37 @@ Flywheel project that was migrated from xnat
 """
 from abc import ABCMeta, abstractmethod
 import argparse
-import backoff
+import concurrent.futures
+import contextlib
 import csv
 import datetime
+import enum
+import io
+import itertools
 import json
 import logging
 import os
 import re
+import shutil
+import time
 
-import backoff
-from dateutil import tz
-import flywheel
-import numpy as np
-import pandas as pd
-import xlrd
 import yaml
 
+import error_state
+import report
+import sample
+import snapshot
+import suggest
 import utils
 
+# Heavy modules are imported on first use so that malformed templates and
+# transfer logs are reported without loading them
+flywheel = utils.lazy_import('flywheel')
+np = utils.lazy_import('numpy')
+pd = utils.lazy_import('pandas')
+tz = utils.lazy_import('dateutil.tz')
+xlrd = utils.lazy_import('xlrd')
+
 log = logging.getLogger()
 
 CSV_HEADERS = [
@@ -48,6 +61,34 @@ TRANSFER_LOG_ERROR_HEADERS = [
     'error'
 ]
 
+# Number of match records classified at a time when streaming the report
+ERROR_CHUNK_SIZE = 10000
+
+# Transfer logs with at least this many rows are validated in parallel
+PARALLEL_VALIDATION_ROWS = 100000
+
+# Share of the time budget kept for matching and writing the report once the
+# Flywheel fetch stops
+TIME_BUDGET_RESERVE = 0.1
+
+# The time budget counts from the start of the job, which imports this module
+# before any work is done
+JOB_START = time.monotonic()
+
+# Concurrent workers and overall rate (per second) of info.transfer_log.valid
+# updates
+VALIDITY_WORKERS = 8
+VALIDITY_UPDATES_PER_SECOND = 20
+
+# Formats DataView rows can be read in: json rows fixed up in python, or csv
+# parsed by the pandas C reader
+JSON_TRANSPORT = 'json-flat'
+CSV_TRANSPORT = 'csv'
+VIEW_TRANSPORTS = [JSON_TRANSPORT, CSV_TRANSPORT]
+CSV_TRUE_VALUES = ['true', 'True', 'TRUE']
+CSV_FALSE_VALUES = ['false', 'False', 'FALSE']
+CSV_NA_VALUES = ['', 'null', 'NULL']
+
 FLYWHEEL_CONTAINER_TYPES = [
     'group',
     'project',
@@ -56,6 +97,49 @@ FLYWHEEL_CONTAINER_TYPES = [
     'acquisition'
 ]
 
+# Containers that errors are rolled up to, highest first
+ROLLUP_CONTAINER_TYPES = [
+    'subject',
+    'session'
+]
+
+
+class ErrorCode(enum.IntEnum):
+    """Kinds of error report rows, stored in the error_code column"""
+    NOT_IN_TRANSFER_LOG = 1
+    NOT_IN_FLYWHEEL = 2
+    EMPTY_CONTAINER = 3
+    MORE_IN_FLYWHEEL = 4
+    MORE_IN_TRANSFER_LOG = 5
+    SUBJECT_NOT_RECONCILED = 6
+
+
+# Messages of the error column, formatted with the container_type and
+# count_difference of the row
+ERROR_MESSAGES = {
+    ErrorCode.NOT_IN_TRANSFER_LOG: '{container_type} in flywheel not present in transfer_log',
+    ErrorCode.NOT_IN_FLYWHEEL: '{container_type} in transfer_log not present in flywheel',
+    ErrorCode.EMPTY_CONTAINER: '{container_type} in flywheel contains no files',
+    ErrorCode.MORE_IN_FLYWHEEL: '{count_difference} more records in flywheel than in transfer_log',
+    ErrorCode.MORE_IN_TRANSFER_LOG:
+        '{count_difference} more records in transfer_log than in flywheel',
+    ErrorCode.SUBJECT_NOT_RECONCILED:
+        'subject not reconciled: the time budget ran out before it was fetched',
+}
+
+# Errors of Flywheel containers that match no transfer log row
+FLYWHEEL_ONLY_ERROR_CODES = [
+    ErrorCode.NOT_IN_TRANSFER_LOG,
+    ErrorCode.EMPTY_CONTAINER
+]
+
+# Columns that describe an error, the error column is rendered from them
+ERROR_CODE_COLUMNS = [
+    'error_code',
+    'container_type',
+    'count_difference'
+]
+
 
 class TransferLogException(Exception):
     def __init__(self, msg, errors=[]):
@@ -108,6 +192,16 @@ class Config(object):
 
         self.join = config_doc.get('join', 'session')
         self.filename = config_doc.get('filename', '*.zip')
+        # Constant field values that every Flywheel record must have
+        self.filters = config_doc.get('filters') or {}
+        if not isinstance(self.filters, dict):
+            raise ValueError('Malformed filters!')
+        # Filter conditions are joined unquoted, so these would corrupt it
+        for field, value in self.filters.items():
+            if any(char in str(field) + str(value) for char in ',='):
+                raise ValueError(
+                    'Filter {}: {} cannot contain "," or "="'.format(field, value)
+                )
         self.mappings = {}
         for value, keys in config_doc.get('mappings', {}).items():
             for key in keys:
@@ -116,9 +210,35 @@ class Config(object):
                 else:
                     self.mappings[key] = value
 
+    def get_query(self, field):
+        """Returns the Query for the Flywheel field, or None if not queried"""
+        for query in self.queries:
+            if query.field == field:
+                return query
+        return None
+
+
+def get_transfer_log_columns(config):
+    """Returns the set of transfer log columns that config reads: the query
+        values and fields, since rows are looked up by either, and file.name"""
+    columns = {'file.name'}
+    for query in config.queries:
+        if query.value:
+            columns.update([query.value, query.field])
+    return columns
+
+
+def get_column_indices(header, columns):
+    """Returns column: index pairs for the columns in header, keeping the last
+        of duplicate columns like csv.DictReader"""
+    return {
+        column: index for index, column in enumerate(header) if column in columns
+    }
+
 
 def load_transfer_log(metadata_path, config):
-    """Loads and formats the transfer log spreadsheet.
+    """Loads and formats the transfer log spreadsheet, keeping only the
+        columns used by the config (see get_transfer_log_columns).
 
     Args:
         metadata_path (str): Path to the metadata file
@@ -127,25 +247,36 @@ def load_transfer_log(metadata_path, config):
         list: list of dicts representing the transfer log rows
     """
     raw_metadata = []
+    columns = get_transfer_log_columns(config)
 
     extension = os.path.splitext(metadata_path)[1]
     if extension == '.xlsx':
         wb = xlrd.open_workbook(metadata_path)
         sh = wb.sheet_by_index(0)
-        keys = None
-        for row in sh.get_rows():
-            if keys is None:
-                keys = [cell.value for cell in row]
-            else:
-                raw_metadata.append({
-                    keys[i]: row[i].value for
-                    i in range(len(keys))
-                })
+        if sh.nrows:
+            column_indices = get_column_indices(sh.row_values(0), columns)
+            # Read the used columns whole instead of every cell of every row
+            column_values = [
+                sh.col_values(index, start_rowx=1) for index in column_indices.values()
+            ]
+            raw_metadata = [
+                dict(zip(column_indices, row_values)) for row_values in zip(*column_values)
+            ]
+            if not column_indices:
+                raw_metadata = [dict() for _ in range(sh.nrows - 1)]
     elif extension == '.csv':
         with open(metadata_path, 'r') as fp:
-            reader = csv.DictReader(fp)
+            reader = csv.reader(fp)
+            header = next(reader, None)
+            column_indices = get_column_indices(header or [], columns)
             for row in reader:
-                raw_metadata.append(row)
+                # Blank lines are skipped, as by csv.DictReader
+                if not row:
+                    continue
+                raw_metadata.append({
+                    column: row[index] if index < len(row) else None
+                    for column, index in column_indices.items()
+                })
     else:
         raise Exception('Filetype "%s" not supported', extension)
     if raw_metadata:
@@ -156,11 +287,32 @@ def load_transfer_log(metadata_path, config):
     return raw_metadata
 
 
-@backoff.on_exception(backoff.expo, flywheel.rest.ApiException,
-                      max_time=300, giveup=utils.false_if_status_gte_500)
+def get_view_filter(config):
+    """
+    Builds the DataView filter that only keeps the rows that can be matched:
+        rows of containers that are not deleted, with the constant field
+        values of the template's filters
+
+    Args:
+        config (transfer_log.Config): config option representing a template
+            file
+
+    Returns:
+        str: comma separated conditions, as used by Flywheel finders
+    """
+    conditions = ['{}.deleted=null'.format(config.join)]
+    conditions.extend(
+        '{}={}'.format(field, value) for field, value in config.filters.items()
+    )
+    return ','.join(conditions)
+
+
+@utils.retry_on_server_error
 def get_view_from_config(fw_client, config):
     """
-    Constructs and returns a DataView according to config's specification
+    Constructs and returns a DataView according to config's specification.
+        Deleted containers and rows without the template's filters values are
+        filtered out by Flywheel (see get_view_filter)
 
     Args:
         fw_client (flywheel.Client): an instance of the flywheel client
@@ -181,14 +333,15 @@ def get_view_from_config(fw_client, config):
     if 'session.timestamp' in columns:
         columns.append('session.timezone')
 
+    view_filter = get_view_filter(config)
     if container_type == 'acquisition':
         view = fw_client.View(
             columns=columns, container=container_type,
             filename=config.filename, process_files=False,
-            match='all', sort=False
+            match='all', sort=False, filter=view_filter
         )
     else:
-        view = fw_client.View(columns=columns, sort=False)
+        view = fw_client.View(columns=columns, sort=False, filter=view_filter)
 
     return view
 
@@ -336,6 +489,53 @@ class FlywheelRow(TableRow):
         return value
 
 
+class IdCodec(object):
+    """
+    Interns Flywheel container ids as dense int64 codes, so ids are compared,
+        grouped and joined as integers and decoded only for the report
+
+    Attributes:
+        codes (dict): container id: code pairs
+        ids (list): container ids, indexed by code
+    """
+
+    def __init__(self):
+        self.codes = dict()
+        self.ids = list()
+        self._id_array = np.empty(0, dtype=object)
+
+    def encode(self, container_id):
+        """Returns the code of container_id, assigning the next code if new"""
+        code = self.codes.get(container_id)
+        if code is None:
+            code = len(self.ids)
+            self.codes[container_id] = code
+            self.ids.append(container_id)
+        return code
+
+    def encode_many(self, container_ids):
+        """Returns an int64 array of the codes of container_ids"""
+        return np.fromiter(
+            (self.encode(container_id) for container_id in container_ids),
+            dtype=np.int64
+        )
+
+    def get_known_codes(self, container_ids):
+        """Returns an int64 array of the codes of the container_ids that were
+            already encoded, without interning the others"""
+        return np.fromiter(
+            (self.codes[container_id] for container_id in container_ids
+             if container_id in self.codes),
+            dtype=np.int64
+        )
+
+    def decode_many(self, codes):
+        """Returns the list of container ids for codes"""
+        if len(self._id_array) != len(self.ids):
+            self._id_array = np.array(self.ids, dtype=object)
+        return self._id_array[np.asarray(codes, dtype=np.int64)].tolist()
+
+
 class TransferLog:
     """
     Class representing a transfer log spreadsheet
@@ -349,6 +549,29 @@ class TransferLog:
             comparison
         match_containers_once (bool): if True, excludes errors for Flywheel ids
             that match transfer_log rows
+        shard_index (int): index of the shard of subjects to reconcile
+        shard_count (int): number of shards the subjects are partitioned into,
+            1 to reconcile every subject
+        suggest_matches (bool): if True, errors for records that matched
+            nothing list the nearest records on the other side
+        checkpoint_path (str): if provided, Flywheel fetches are checkpointed
+            to this file and resumed from it (see get_flywheel_records)
+        deadline (float): if provided, the time.monotonic() time after which
+            no more subjects are fetched, the report then only covers the
+            subjects fetched so far
+        sample_size (int): if provided, only a stratified random sample of
+            about sample_size subjects is reconciled (see sample_subjects)
+        sample_seed (int): seed of the subject sample, for repeatable samples
+        targeted_fetch (bool): if True, only the subjects in the transfer log
+            are fetched, the others are reported from their labels alone
+        view_transport (str): format DataView rows are read in, one of
+            VIEW_TRANSPORTS
+        rollup_errors (bool): if True, the errors of subjects and sessions
+            none of whose records matched are reported once per subject or
+            session (see split_rollup_records)
+        transfer_log_rows (list): if provided, the rows of the transfer log
+            at transfer_log_path as returned by load_transfer_log, used
+            instead of reading it again
 
     Attributes:
         client (flywheel.Client): an instance of the flywheel client
@@ -359,10 +582,13 @@ class TransferLog:
             comparison
         flywheel_table (list): list of MetadataRow objects representing the rows in the
             transfer log
+        flywheel_records (pandas.DataFrame): the formatted DataView rows when
+            flywheel_df was built from columns (see create_flywheel_df) rather
+            than from flywheel_table
         metadata_table (list): list of Flywheel records retrieved from the project per the
             config-specified query
-        matched_containers (list): list of Flywheel container ids that match
-            transfer log rows
+        matched_containers (numpy.ndarray): id codes of the Flywheel
+            containers that match transfer log rows
         empty_containers (list): list of Flywheel container ids of container
             type self.config.join that are missing files
         match_cols (list): list of fields/columns matched between flywheel and
@@ -375,11 +601,32 @@ class TransferLog:
             loaded from the transfer log
         match_df (pandas.DataFrame): dataframe resulting from merging flywheel
             and metadata record count dataframes
+        id_codec (IdCodec): the int64 codes of the Flywheel container ids in
+            flywheel_df and match_df
+        uncovered_subjects (list): id, label and path dicts of the subjects
+            that were not fetched before the deadline
+        empty_scan_complete (bool): False if the deadline stopped the empty
+            container scan, so empty containers may be missing from
+            empty_containers
+        sample_strata (dict): stratum: normalized labels of every subject in
+            the stratum, when sampling
+        sampled_strata (dict): stratum: normalized labels of the sampled
+            subjects, when sampling
+        sampled_subject_keys (set): normalized labels of the sampled subjects,
+            None when not sampling
+        sampled_subject_ids (list): Flywheel ids of the sampled subjects,
+            None when not sampling
+        unexpected_subjects (list): id, label and path dicts of the subjects
+            that were not fetched because they are not in the transfer log
 
     """
 
     def __init__(self, client, config, transfer_log_path, project_id,
-                 case_insensitive=False, match_containers_once=False):
+                 case_insensitive=False, match_containers_once=False,
+                 shard_index=0, shard_count=1, suggest_matches=False,
+                 checkpoint_path=None, deadline=None, sample_size=None, sample_seed=None,
+                 targeted_fetch=False, view_transport=JSON_TRANSPORT, rollup_errors=False,
+                 transfer_log_rows=None):
         self.client = client
         self.config = config
         self.transfer_log_path = transfer_log_path
@@ -387,10 +634,40 @@ class TransferLog:
 
         self.case_insensitive = case_insensitive
         self.match_containers_once = match_containers_once
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.suggest_matches = suggest_matches
+        self._suggestion_indexes = None
+        self.checkpoint_path = checkpoint_path
+        self.deadline = deadline
+        self.uncovered_subjects = list()
+        self.empty_scan_complete = True
+        self.sample_size = sample_size
+        self.sample_seed = sample_seed
+        self.sample_strata = dict()
+        self.sampled_strata = dict()
+        self.sampled_subject_keys = None
+        self.sampled_subject_ids = None
+        self.targeted_fetch = targeted_fetch
+        self.view_transport = view_transport
+        self.rollup_errors = rollup_errors
+        self.transfer_log_rows = transfer_log_rows
+        self.unexpected_subjects = list()
+        if not 0 <= shard_index < shard_count:
+            raise ValueError('shard_index must be between 0 and shard_count - 1')
+        if shard_count > 1 and 'subject.label' not in config.field_dict.values():
+            raise ValueError('Sharding requires a subject.label query in the template')
+        if sample_size and 'subject.label' not in config.field_dict.values():
+            raise ValueError('Sampling requires a subject.label query in the template')
+        if targeted_fetch and 'subject.label' not in config.field_dict.values():
+            raise ValueError('Targeted fetches require a subject.label query in the template')
         self.flywheel_table = list()
+        self.flywheel_records = None
         self.metadata_table = list()
-        self.matched_containers = list()
+        self.matched_containers = np.empty(0, dtype=np.int64)
         self.empty_containers = list()
+        self._empty_codes = frozenset()
+        self.id_codec = IdCodec()
         self.match_cols = [
             query.field for query in self.config.queries if query.value
         ]
@@ -404,23 +681,389 @@ class TransferLog:
         """The default error dict/template for row errors"""
         return get_template_error_dict(self.config)
 
-    def initialize(self):
-        """Parse the transfer log and retrieve the metadata from the Flywheel Project"""
+    def initialize(self, snapshot_path=None):
+        """Parse the transfer log and retrieve the metadata from the Flywheel
+        Project, or from a snapshot at snapshot_path if provided"""
         log.info('Loading transfer log records...')
         self.load_metadata_table()
-        log.info('Loading Flywheel records...')
-        self.load_flywheel_table()
+        self.load_flywheel_data(snapshot_path)
+        self.drop_uncovered_rows()
         log.info('Matching Flywheel and transfer log records...')
         self.match_df_records()
+
+    def load_flywheel_data(self, snapshot_path=None):
+        """Retrieve the records, resolver paths and empty containers from the
+        Flywheel Project, or from a snapshot at snapshot_path if provided"""
+        if snapshot_path:
+            self.load_snapshot(snapshot_path)
+            return
+        log.info('Loading Flywheel records...')
+        uncovered_subjects = list()
+        unexpected_subjects = list()
+        self.load_flywheel_table(uncovered_subjects, unexpected_subjects)
         log.info('Loading project resolver paths from Flywheel...')
         project = self.client.get_project(self.project_id)
         self.resolver_path_dict = self.get_path_dict(project)
+        self.uncovered_subjects = self.get_subject_dicts(project, uncovered_subjects)
+        self.unexpected_subjects = self.get_subject_dicts(project, unexpected_subjects)
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            log.warning('Time budget used up, not identifying empty containers')
+            self.empty_scan_complete = False
+            return
         log.info('Identifying empty containers...')
         self.empty_containers = self.get_empty_container_ids(
             self.client,
             self.project_id,
-            self.config.join
+            self.config.join,
+            deadline=self.deadline,
+            subject_ids=self.sampled_subject_ids
+        )
+        # The scan stops at the deadline. One that ends right as it passes is
+        # also treated as incomplete, which only errs on the side of partial
+        self.empty_scan_complete = (
+            self.deadline is None or time.monotonic() < self.deadline
+        )
+
+    def drop_uncovered_rows(self):
+        """Drops the transfer log rows of the subjects that were not fetched,
+        so that they are not reported as missing from Flywheel"""
+        if not self.uncovered_subjects or self.metadata_df is None:
+            return
+        if 'subject.label' not in self.match_cols:
+            log.warning('Template does not query subject.label, the partial report '
+                        'includes the transfer log rows of every subject')
+            return
+        self.drop_subject_rows(set(
+            self.get_subject_key(subject['label']) for subject in self.uncovered_subjects
+        ))
+
+    def drop_subject_rows(self, subject_keys):
+        """Drops the transfer log rows of the subjects with a subject.label
+        match value in subject_keys"""
+        if not subject_keys or self.metadata_df is None:
+            return
+        self.metadata_df = self.metadata_df[
+            ~self.metadata_df['subject.label'].isin(subject_keys)
+        ]
+        kept_rows = set(self.metadata_df['tl_index'])
+        self.metadata_table = [
+            row for row in self.metadata_table if row.index in kept_rows
+        ]
+
+    def get_sample_strata(self, subjects):
+        """
+        Groups the subjects by whether they are in Flywheel, in the transfer
+            log or both, since each group fails in its own ways
+
+        Args:
+            subjects (list): the Flywheel subjects in scope
+
+        Returns:
+            dict: stratum: sorted list of the normalized subject labels in the
+                stratum
+        """
+        flywheel_keys = set(self.get_subject_key(subject.label) for subject in subjects)
+        log_keys = set()
+        if self.metadata_df is not None:
+            log_keys = set(
+                key for key in self.metadata_df['subject.label'].dropna()
+                if self.subject_in_scope(key)
+            )
+        return {
+            'flywheel and transfer log': sorted(flywheel_keys & log_keys),
+            'flywheel only': sorted(flywheel_keys - log_keys),
+            'transfer log only': sorted(log_keys - flywheel_keys)
+        }
+
+    def sample_subjects(self, subjects):
+        """
+        Draws a stratified random sample of the subjects and drops the
+            transfer log rows of the subjects that were not sampled
+
+        Args:
+            subjects (iterable): the Flywheel subjects of the project
+
+        Returns:
+            list: the Flywheel subjects in the sample
+        """
+        subjects = [
+            subject for subject in subjects if self.flywheel_subject_in_scope(subject)
+        ]
+        self.sample_strata = self.get_sample_strata(subjects)
+        self.sampled_strata = sample.sample_strata(
+            self.sample_strata, self.sample_size, seed=self.sample_seed
+        )
+        self.sampled_subject_keys = set(
+            key for keys in self.sampled_strata.values() for key in keys
+        )
+        log.info('Sampled %s of %s subjects', len(self.sampled_subject_keys),
+                 sum(len(keys) for keys in self.sample_strata.values()))
+        if self.metadata_df is not None:
+            self.drop_subject_rows(
+                set(self.metadata_df['subject.label'].dropna()) - self.sampled_subject_keys
+            )
+        subjects = [
+            subject for subject in subjects if self.flywheel_subject_in_scope(subject)
+        ]
+        self.sampled_subject_ids = [subject.id for subject in subjects]
+        return subjects
+
+    def get_sample_estimate(self, subject_error_counts):
+        """
+        Estimates the error rate of the whole project from the sampled subjects
+
+        Args:
+            subject_error_counts (dict): normalized subject label: error count
+                pairs, subjects without errors may be left out
+
+        Returns:
+            dict: the estimates, as returned by sample.estimate_error_rate
+        """
+        return sample.estimate_error_rate(
+            {stratum: len(keys) for stratum, keys in self.sample_strata.items()},
+            {
+                stratum: [subject_error_counts.get(key, 0) for key in keys]
+                for stratum, keys in self.sampled_strata.items()
+            }
+        )
+
+    @staticmethod
+    def get_subject_dicts(project, subjects):
+        """Returns id, label and resolver path dicts for Flywheel subjects of
+        project"""
+        return [
+            {
+                'id': subject.id,
+                'label': subject.label,
+                'path': '/'.join([project.group, project.label, subject.label])
+            } for subject in subjects
+        ]
+
+    def get_subject_error_df(self, subjects, error_code):
+        """
+        Creates error report rows for whole subjects whose containers were
+            not fetched
+
+        Args:
+            subjects (list): id, label and path dicts of the subjects
+            error_code (ErrorCode): the error of each subject
+
+        Returns:
+            pandas.DataFrame: a row per subject with the columns of
+                iter_error_dfs
+        """
+        subject_error_df = pd.DataFrame(
+            [
+                {
+                    'flywheel_id': subject['id'], 'error_code': error_code,
+                    'container_type': 'subject', 'count_difference': 0, 'path': subject['path']
+                }
+                for subject in subjects
+            ],
+            columns=self.get_report_columns()
         )
+        subject_error_df = set_error_code_dtypes(subject_error_df)
+        if 'subject.label' in subject_error_df.columns:
+            subject_error_df['subject.label'] = [
+                self.get_subject_key(subject['label']) for subject in subjects
+            ]
+        return subject_error_df
+
+    def split_unexpected_subjects(self, subjects):
+        """
+        Splits Flywheel subjects by whether the transfer log has rows for them
+
+        Args:
+            subjects (iterable): the Flywheel subjects in scope
+
+        Returns:
+            tuple: the list of subjects in the transfer log and the list of
+                subjects that are not
+        """
+        log_keys = set(self.metadata_df['subject.label'].dropna())
+        expected_subjects = list()
+        unexpected_subjects = list()
+        for subject in subjects:
+            if self.get_subject_key(subject.label) in log_keys:
+                expected_subjects.append(subject)
+            else:
+                unexpected_subjects.append(subject)
+        log.info('Fetching the %s subjects in the transfer log, %s subjects are not',
+                 len(expected_subjects), len(unexpected_subjects))
+        return expected_subjects, unexpected_subjects
+
+    def save_snapshot(self, snapshot_path):
+        """
+        Saves the loaded Flywheel records, resolver paths and empty container
+            ids to a Parquet snapshot (see snapshot.save_snapshot)
+
+        Args:
+            snapshot_path (str): path of the Parquet file
+
+        Raises:
+            ValueError: if the records do not cover the whole project, since a
+                replay would report the missing subjects' rows as not in
+                Flywheel
+        """
+        if self.shard_count > 1 or self.uncovered_subjects or not self.empty_scan_complete:
+            raise ValueError('A snapshot must hold every subject, it cannot be saved '
+                             'from a sharded or partial fetch')
+        log.info('Saving Flywheel snapshot to %s...', snapshot_path)
+        snapshot.save_snapshot(
+            snapshot_path,
+            self.get_record_dicts(),
+            self.resolver_path_dict,
+            self.empty_containers,
+            project_id=self.project_id
+        )
+
+    def load_snapshot(self, snapshot_path):
+        """
+        Loads the Flywheel records, resolver paths and empty container ids from
+            a snapshot saved by save_snapshot instead of from Flywheel. Only the
+            subjects of this TransferLog's shard are kept
+
+        Args:
+            snapshot_path (str): path of the Parquet file
+        """
+        log.info('Loading Flywheel snapshot from %s...', snapshot_path)
+        project_snapshot = snapshot.load_snapshot(snapshot_path)
+        records = project_snapshot['records']
+        if self.shard_count > 1:
+            records = [
+                record for record in records
+                if self.subject_in_scope(self.get_subject_key(record.get('subject.label')))
+            ]
+        self.project_id = self.project_id or project_snapshot['project_id']
+        self.flywheel_table = list()
+        self.create_flywheel_table(records)
+        self.resolver_path_dict = project_snapshot['resolver_path_dict']
+        self.empty_containers = project_snapshot['empty_containers']
+
+    def reconcile(self, transfer_log_path):
+        """
+        Match a transfer log against the Flywheel records that are already
+            loaded, without fetching the project again
+
+        Args:
+            transfer_log_path (str): path to the transfer log spreadsheet
+
+        Returns:
+            pandas.DataFrame: the error dataframe for the transfer log
+        """
+        self.transfer_log_path = transfer_log_path
+        self.metadata_table = list()
+        log.info('Loading transfer log records from %s...', transfer_log_path)
+        self.load_metadata_table()
+        log.info('Matching Flywheel and transfer log records...')
+        self.match_df_records()
+        return self.get_error_df()
+
+    def iter_reconcile_many(self, transfer_log_paths, chunksize=ERROR_CHUNK_SIZE):
+        """
+        Match each transfer log in transfer_log_paths against the Flywheel
+            records that are already loaded
+
+        Args:
+            transfer_log_paths (list): paths to the transfer log spreadsheets
+            chunksize (int): number of match_df records per chunk
+
+        Yields:
+            pandas.DataFrame: chunks of error dataframes, with a source_log
+                column holding the path of the transfer log for each error.
+                Flywheel containers that no transfer log matched are reported
+                once, last, without a source_log
+        """
+        matched_containers = list()
+        matched_keys = set()
+        for transfer_log_path in transfer_log_paths:
+            self.transfer_log_path = transfer_log_path
+            self.metadata_table = list()
+            log.info('Loading transfer log records from %s...', transfer_log_path)
+            self.load_metadata_table()
+            log.info('Matching Flywheel and transfer log records...')
+            self.match_df_records()
+            matched_containers.append(self.matched_containers)
+            both_df = self.match_df[self.match_df['_merge'] == 'both']
+            matched_keys.update(
+                both_df[self.match_cols].astype(object).itertuples(index=False, name=None)
+            )
+            for error_df in self.iter_error_dfs(chunksize):
+                # The other sites' containers are not errors of this log
+                error_df = error_df[~error_df['error_code'].isin(FLYWHEEL_ONLY_ERROR_CODES)]
+                error_df.insert(0, 'source_log', str(transfer_log_path))
+                yield error_df
+        log.info('Matching the Flywheel records that no transfer log matched...')
+        matched_containers = np.unique(np.concatenate(matched_containers))
+        flywheel_df = self.flywheel_df
+        unmatched = np.fromiter(
+            (key not in matched_keys for key in
+             flywheel_df[self.match_cols].astype(object).itertuples(index=False, name=None)),
+            dtype=bool, count=len(flywheel_df)
+        )
+        if self.match_containers_once:
+            unmatched &= ~flywheel_df['tl_index'].isin(matched_containers).values
+        self.flywheel_df = flywheel_df[unmatched].copy()
+        self.metadata_table = list()
+        self.metadata_df = self.get_table_df(self.metadata_table, self.match_cols)
+        try:
+            self.match_df_records()
+            for error_df in self.iter_error_dfs(chunksize):
+                error_df.insert(0, 'source_log', None)
+                yield error_df
+        finally:
+            self.flywheel_df = flywheel_df
+            self.matched_containers = matched_containers
+
+    def reconcile_many(self, transfer_log_paths):
+        """
+        Match each transfer log in transfer_log_paths against the Flywheel
+            records that are already loaded
+
+        Args:
+            transfer_log_paths (list): paths to the transfer log spreadsheets
+
+        Returns:
+            pandas.DataFrame: the combined error dataframe, with a source_log
+                column holding the path of the transfer log for each error
+                (None for Flywheel containers that no transfer log matched)
+        """
+        error_df = pd.concat(
+            self.iter_reconcile_many(transfer_log_paths), ignore_index=True
+        )
+        return render_error_messages(error_df)
+
+    def subject_in_scope(self, subject_key):
+        """
+        Whether the subject with normalized label subject_key is reconciled
+            by this TransferLog
+
+        Args:
+            subject_key (str): a subject.label match value
+
+        Returns:
+            bool: False if the subject belongs to another shard or was not
+                sampled
+        """
+        if self.shard_count > 1:
+            if utils.get_subject_shard(subject_key, self.shard_count) != self.shard_index:
+                return False
+        if self.sampled_subject_keys is not None:
+            return subject_key in self.sampled_subject_keys
+        return True
+
+    def get_subject_key(self, subject_label):
+        """
+        Normalize a Flywheel subject label the same way as subject.label
+            match values
+        """
+        query = self.config.get_query('subject.label') or Query({'subject.label': True})
+        fw_row = FlywheelRow(self.config, {}, None, self.case_insensitive)
+        return fw_row.format_value(query, subject_label)
+
+    def flywheel_subject_in_scope(self, subject):
+        """Whether the Flywheel subject container should be fetched"""
+        return self.subject_in_scope(self.get_subject_key(subject.label))
 
     def load_metadata_table(self):
         """Parse the transfer log, appending rows as MetadataRows to metadata_table"""
@@ -428,36 +1071,134 @@ class TransferLog:
             exc_str = f'{self.transfer_log_path} does not exist. Cannot load transfer log.'
             raise TransferLogException(exc_str)
         else:
-            tl_dict_list = load_transfer_log(self.transfer_log_path, self.config)
+            tl_dict_list = self.transfer_log_rows
+            if tl_dict_list is None:
+                tl_dict_list = load_transfer_log(self.transfer_log_path, self.config)
+            # The rows were loaded for a single use
+            self.transfer_log_rows = None
+            progress = utils.ProgressReporter(
+                'Transfer log ingestion', total=len(tl_dict_list), unit='rows'
+            )
             for index, row_dict in enumerate(tl_dict_list):
-                self.metadata_table.append(
-                    MetadataRow(self.config, row_dict, index, self.case_insensitive)
-                )
-        self.metadata_df = self.get_table_df(self.metadata_table)
+                progress.update(rows=1)
+                metadata_row = MetadataRow(self.config, row_dict, index, self.case_insensitive)
+                if self.shard_count > 1 or self.sampled_subject_keys is not None:
+                    subject_key = metadata_row.match_dict.get('subject.label')
+                    if not self.subject_in_scope(subject_key):
+                        continue
+                self.metadata_table.append(metadata_row)
+            progress.finish()
+        self.metadata_df = self.get_table_df(self.metadata_table, self.match_cols)
+        self.drop_uncovered_rows()
         return self.metadata_table
 
-    def load_flywheel_table(self):
-        """Load records from Flywheel, appending records as FlywheelRows to flywheel_table"""
-        fw_dict_list = get_flywheel_records(self.client, self.config, self.project_id)
-        self.create_flywheel_table(fw_dict_list)
-        return self.flywheel_table
+    def load_flywheel_table(self, uncovered_subjects=None, unexpected_subjects=None):
+        """Load records from Flywheel into flywheel_df, appending the subjects not fetched before the deadline to
+        uncovered_subjects and, for targeted fetches, the subjects that are not
+        in the transfer log to unexpected_subjects"""
+        subject_filter = None
+        if self.shard_count > 1:
+            subject_filter = self.flywheel_subject_in_scope
+        subjects = None
+        if self.sample_size or self.targeted_fetch:
+            # Listing the subjects only returns their labels, not their records
+            subjects = self.client.get_project(self.project_id).subjects.iter()
+            if self.sample_size:
+                subjects = self.sample_subjects(subjects)
+            else:
+                subjects = [
+                    subject for subject in subjects if self.flywheel_subject_in_scope(subject)
+                ]
+        if self.targeted_fetch:
+            subjects, unexpected = self.split_unexpected_subjects(subjects)
+            if unexpected_subjects is not None:
+                unexpected_subjects.extend(unexpected)
+        records_df = get_flywheel_records(
+            self.client, self.config, self.project_id, subject_filter=subject_filter,
+            checkpoint_path=self.checkpoint_path, deadline=self.deadline,
+            transport=self.view_transport,
+            uncovered_subjects=uncovered_subjects, subjects=subjects, columnar=True
+        )
+        self.create_flywheel_df(records_df)
+        return self.flywheel_df
+
+    def create_flywheel_df(self, records_df):
+        """
+        Builds flywheel_df straight from the columns of formatted DataView
+            rows, without creating a FlywheelRow and match_dict per record.
+            Each distinct value of a column is formatted once
+
+        Args:
+            records_df (pandas.DataFrame): object columns of DataView rows, as
+                returned by get_flywheel_records with columnar=True
+
+        Returns:
+            pandas.DataFrame: flywheel_df
+        """
+        self.flywheel_table = list()
+        self.flywheel_records = records_df
+        if records_df.empty:
+            self.flywheel_df = pd.DataFrame(columns=self.match_cols + ['tl_index'])
+            self.flywheel_df['tl_index'] = np.empty(0, dtype=np.int64)
+            return self.flywheel_df
+        # Formats values the same way as FlywheelRow.match_dict
+        fw_row = FlywheelRow(self.config, {}, None, self.case_insensitive)
+        columns = dict()
+        for query in self.config.queries:
+            if not query.value:
+                continue
+            values = self.get_record_values(query.field)
+            if query.value in records_df.columns:
+                values = [
+                    value or fallback
+                    for value, fallback in zip(values, records_df[query.value].tolist())
+                ]
+            formatted = dict()
+            for value in set(values):
+                formatted[value] = fw_row.format_value(query, value)
+            columns[query.field] = [formatted[value] for value in values]
+        columns['tl_index'] = self.id_codec.encode_many(
+            self.get_record_values('{}.id'.format(self.config.join))
+        )
+        if 'file.name' in records_df.columns and 'file.name' not in columns:
+            columns['file.name'] = records_df['file.name'].tolist()
+        self.flywheel_df = pd.DataFrame(columns)
+        return self.flywheel_df
+
+    def get_record_values(self, column):
+        """Returns the values of column for each Flywheel record, None where
+        the column is missing"""
+        if self.flywheel_records is not None:
+            if column in self.flywheel_records.columns:
+                return self.flywheel_records[column].tolist()
+            return [None] * len(self.flywheel_records)
+        return [row.row_dict.get(column) for row in self.flywheel_table]
+
+    def get_record_dicts(self):
+        """Returns the formatted DataView row of each Flywheel record"""
+        if self.flywheel_records is not None:
+            return self.flywheel_records.to_dict(orient='records')
+        return [row.row_dict for row in self.flywheel_table]
 
     def create_flywheel_table(self, fw_dict_list):
         """Load the dict_list as FlywheelRows"""
+        self.flywheel_records = None
         for row_dict in fw_dict_list:
             index = row_dict['{}.id'.format(self.config.join)]
             fw_row = FlywheelRow(self.config, row_dict, index, self.case_insensitive)
 
             self.flywheel_table.append(fw_row)
-        self.flywheel_df = self.get_table_df(self.flywheel_table)
+        self.flywheel_df = self.get_table_df(self.flywheel_table, self.match_cols)
+        self.flywheel_df['tl_index'] = self.id_codec.encode_many(self.flywheel_df['tl_index'])
         return self.flywheel_table
 
     @staticmethod
-    def get_table_df(table):
+    def get_table_df(table, match_cols=None):
         """
         Assemble a DataFrame from TableRow match_dict values
         Args:
             table (list): list TableRow objects
+            match_cols (list): columns of the DataFrame if table is empty
 
         Returns:
             pandas.DataFrame
@@ -473,6 +1214,9 @@ class TransferLog:
                 copy_dict['file.name'] = row.row_dict.get('file.name')
             dict_list.append(copy_dict)
         df = pd.DataFrame(dict_list)
+        # A shard or a transfer log may have no rows at all
+        if df.empty and match_cols:
+            df = pd.DataFrame(columns=match_cols + ['tl_index'])
 
         return df
 
@@ -510,19 +1254,63 @@ class TransferLog:
         """
         project_path = '/'.join([project.group, project.label])
         path_dict = dict()
-        for row in self.flywheel_table:
-            rel_path = self.get_rel_path(row.row_dict)
+        id_str = f'{self.config.join}.id'
+        label_columns = ['subject.label', 'session.label', 'acquisition.label']
+        for container_id, *labels in zip(
+            self.get_record_values(id_str),
+            *[self.get_record_values(column) for column in label_columns]
+        ):
+            rel_path = self.get_rel_path(dict(zip(label_columns, labels)))
             res_path = '/'.join([project_path, rel_path])
-            id_str = f'{self.config.join}.id'
-            container_id = row.row_dict.get(id_str)
             path_dict[container_id] = res_path
         self.resolver_path_dict = path_dict
         return path_dict
 
+    def get_validity_updates(self):
+        """
+        Finds the Flywheel containers whose info.transfer_log.valid flag
+            differs from the latest match: True for containers that match a
+            transfer log row, False for the others
+
+        Returns:
+            dict: container id: valid pairs for the flags to write
+        """
+        valid_key = '{}.info.transfer_log.valid'.format(self.config.join)
+        matched_ids = set(self.id_codec.decode_many(self.matched_containers))
+        checked_ids = set()
+        updates = dict()
+        for container_id, stored_valid in zip(
+            self.get_record_values('{}.id'.format(self.config.join)),
+            self.get_record_values(valid_key)
+        ):
+            if container_id in checked_ids:
+                continue
+            checked_ids.add(container_id)
+            valid = container_id in matched_ids
+            # The stored flag may be missing, NaN or a numpy bool
+            if stored_valid not in (True, False) or bool(stored_valid) != valid:
+                updates[container_id] = valid
+        return updates
+
+    def set_match_categories(self):
+        """
+        Converts the match columns of flywheel_df and metadata_df to
+            categoricals that share one category dictionary per column, so
+            records are grouped and merged on integer codes
+        """
+        for column in self.match_cols:
+            categories = pd.unique(pd.concat([
+                self.flywheel_df[column].astype(object),
+                self.metadata_df[column].astype(object)
+            ], ignore_index=True).dropna())
+            dtype = pd.CategoricalDtype(categories)
+            for df in [self.flywheel_df, self.metadata_df]:
+                df[column] = df[column].astype(object).astype(dtype)
+
     def get_record_df(self, df):
 
         # Squash dataframe into one row per set of match column values
-        df = df.groupby(self.match_cols)['tl_index'].apply(list).reset_index()
+        df = df.groupby(self.match_cols, observed=True)['tl_index'].agg(list).reset_index()
         # ids cannot be duplicated in the list if we're only matching once
         if self.match_containers_once:
             df['tl_index'] = df['tl_index'].apply(lambda x: list(set(x)))
@@ -531,7 +1319,8 @@ class TransferLog:
         return df
 
     @staticmethod
-    def get_empty_container_ids(fw_client, project_id, container_type):
+    def get_empty_container_ids(fw_client, project_id, container_type, deadline=None,
+                                subject_ids=None):
         """
         Retrieves a list of empty containers of container_type in the Flywheel
             project with id project_id
@@ -539,24 +1328,38 @@ class TransferLog:
             fw_client (flywheel.Client): an instance of the flywheel client
             project_id (str): id belonging to a Flywheel project
             container_type (str): 'session', 'subject', or 'acquisition'
+            deadline (float): if provided, the time.monotonic() time after
+                which the scan stops with the containers found so far
+            subject_ids (list): if provided, only the containers of these
+                subjects are scanned, with a query per subject, rather than
+                the whole project
 
         Returns:
             list: list of container ids that do not have files
         """
         container_list = list()
-        query = f'parents.project={project_id},files.size=null'
-        if container_type == 'acquisition':
-            container_list = [
-                res for res in fw_client.acquisitions.iter_find(query)
-            ]
-        elif container_type == 'session':
-            container_list = [
-                res for res in fw_client.sessions.iter_find(query)
-            ]
-        elif container_type == 'subject':
-            container_list = [
-                res for res in fw_client.subjects.iter_find(query)
+        queries = [f'parents.project={project_id},files.size=null']
+        if subject_ids is not None:
+            subject_field = '_id' if container_type == 'subject' else 'parents.subject'
+            queries = [
+                f'{subject_field}={subject_id},files.size=null' for subject_id in subject_ids
             ]
+        if container_type in ['acquisition', 'session', 'subject']:
+            finder = getattr(fw_client, '{}s'.format(container_type))
+            progress = utils.ProgressReporter(
+                'Empty container scan', unit='{}s'.format(container_type)
+            )
+            results = itertools.chain.from_iterable(
+                finder.iter_find(query) for query in queries
+            )
+            for res in results:
+                if deadline is not None and time.monotonic() >= deadline:
+                    log.warning('Time budget used up, the empty container scan '
+                                'stopped after %s containers', len(container_list))
+                    break
+                container_list.append(res)
+                progress.update(rows=1)
+            progress.finish()
         else:
             log.error(
                 'Unexpected container type %s - cannot find empty containers',
@@ -568,73 +1371,198 @@ class TransferLog:
             id_list = list()
         return id_list
 
-    def get_match_row_error(self, row):
+    def get_match_error_codes(self, match_df):
         """
-        Creates an error message for a row in self.match_df
+        Classifies the records of a match dataframe
         Args:
-            row (pandas.Series): a row from self.match_df
+            match_df (pandas.DataFrame): records of self.match_df
         Returns:
-            str: the error message
+            tuple: numpy arrays of the error code of each record (0 for
+                records without errors) and of the difference between its
+                Flywheel and transfer log record counts
         """
-        error_msg = None
-        container_type = self.config.join
-        empty_id_list = self.empty_containers
-        missing_str = '{} in {} not present in {}'
-        unequal_str = '{} more records in {} than in {}'
+        merge = match_df['_merge'].values
+        count_differences = (
+            match_df['records_flywheel'].values - match_df['records_metadata'].values
+        )
+        error_codes = np.zeros(len(match_df), dtype=np.uint8)
         # Records in flywheel, not in transfer log
-        if row['_merge'] == 'left_only':
-            error_msg = missing_str.format(
-                container_type, 'flywheel', 'transfer_log'
-            )
-            # Address empty containers specifically
-            if empty_id_list and isinstance(row['tl_index_flywheel'], list):
-                if list(set(empty_id_list) & set(row['tl_index_flywheel'])):
-                    error_msg = f'{container_type} in flywheel contains no files'
-
+        flywheel_only = merge == 'left_only'
+        error_codes[flywheel_only] = ErrorCode.NOT_IN_TRANSFER_LOG
+        # Address empty containers specifically
+        if self._empty_codes:
+            empty = flywheel_only & match_df['tl_index_flywheel'].map(
+                lambda codes: isinstance(codes, list) and not self._empty_codes.isdisjoint(codes)
+            ).values.astype(bool)
+            error_codes[empty] = ErrorCode.EMPTY_CONTAINER
         # Records in transfer log, but not in flywheel
-        elif row['_merge'] == 'right_only':
-            error_msg = missing_str.format(
-                container_type, 'transfer_log', 'flywheel'
-            )
-        # Records that match at least once between flywheel and transfer_log
-        elif row['_merge'] == 'both':
-            diff = int(row['records_flywheel'] - row['records_metadata'])
-            # More records in flywheel
-            if diff > 0:
-
-                error_msg = unequal_str.format(
-                    str(diff), 'flywheel', 'transfer_log'
-                )
+        error_codes[merge == 'right_only'] = ErrorCode.NOT_IN_FLYWHEEL
+        # Records that match, but not as many times on both sides
+        both = merge == 'both'
+        error_codes[both & (count_differences > 0)] = ErrorCode.MORE_IN_FLYWHEEL
+        error_codes[both & (count_differences < 0)] = ErrorCode.MORE_IN_TRANSFER_LOG
+        count_differences = np.where(both, np.abs(count_differences), 0).astype(np.uint32)
+        return error_codes, count_differences
+
+    def iter_error_dfs(self, chunksize=ERROR_CHUNK_SIZE):
+        """
+        Classifies self.match_df chunksize records at a time, so the error
+            rows can be written out as they are produced
 
-            # More records in transfer_log
-            elif diff < 0:
-                error_msg = unequal_str.format(
-                    str(abs(diff)), 'transfer_log', 'flywheel'
-                )
-            # No error - flywheel and transfer_log have equal counts
-            else:
-                error_msg = None
-        # This won't happen via pd.merge, but let's complete the logic
+        Args:
+            chunksize (int): number of match_df records per chunk
+
+        Yields:
+            pandas.DataFrame: the error dataframe for each chunk, at least one.
+                The error column is not rendered (see render_error_messages)
+        """
+        progress = utils.ProgressReporter(
+            'Error classification', total=len(self.match_df), unit='match records'
+        )
+        remaining_df = self.match_df
+        if self.rollup_errors:
+            rollup_df, remaining_df = self.split_rollup_records(self.match_df)
+            if not rollup_df.empty:
+                progress.update(count=rollup_df['child_count'].sum(), rows=len(rollup_df))
+                yield rollup_df
+        for start in range(0, max(len(remaining_df), 1), chunksize):
+            match_df = remaining_df.iloc[start:start + chunksize]
+            error_df = self.get_error_df(match_df, render=False)
+            progress.update(count=len(match_df), rows=len(error_df))
+            yield error_df
+        progress.finish()
+
+    def get_rollup_key_columns(self, container_type):
+        """
+        Gets the match columns that identify the containers of container_type
+
+        Args:
+            container_type (str): 'subject' or 'session'
+
+        Returns:
+            list: the match columns of container_type and its parents, None if
+                there are none or if they identify single records, in which
+                case there is nothing to roll up
+        """
+        if self.config.join in FLYWHEEL_CONTAINER_TYPES:
+            join_depth = FLYWHEEL_CONTAINER_TYPES.index(self.config.join)
         else:
-            error_msg = 'merge value not recognized: {}'.format(row['_merge'])
-        return error_msg
+            join_depth = len(FLYWHEEL_CONTAINER_TYPES)
+        depth = FLYWHEEL_CONTAINER_TYPES.index(container_type)
+        if depth >= join_depth:
+            return None
+        key_cols = [
+            column for column in self.match_cols
+            if column.split('.')[0] in FLYWHEEL_CONTAINER_TYPES[:depth + 1]
+        ]
+        if not any(column.startswith(container_type + '.') for column in key_cols):
+            return None
+        if len(key_cols) == len(self.match_cols):
+            return None
+        return key_cols
+
+    def get_parent_path(self, container_id, container_type):
+        """Returns the resolver path of the container_type parent of the
+            Flywheel container with id container_id"""
+        path = self.resolver_path_dict.get(container_id)
+        if not path:
+            return None
+        # group/project/subject/session/...
+        depth = FLYWHEEL_CONTAINER_TYPES.index(container_type) + 1
+        return '/'.join(path.split('/')[:depth])
+
+    def split_rollup_records(self, match_df):
+        """
+        Finds the subjects, then the sessions, none of whose match records
+            matched the other side: every record is only in the transfer log,
+            or every record is only in Flywheel. Each of them is reported with
+            a single error instead of an error per record. Empty containers
+            and, with match_containers_once, containers that matched other
+            rows keep their own errors
 
-    def get_error_df(self):
+        Args:
+            match_df (pandas.DataFrame): records of self.match_df
+
+        Returns:
+            tuple: the error dataframe of the rolled up subjects and sessions,
+                with the columns of get_error_df, and the records of match_df
+                that were not rolled up
+        """
+        excluded_codes = set(self._empty_codes)
+        if self.match_containers_once:
+            excluded_codes.update(self.matched_containers.tolist())
+        rollup_rows = list()
+        for container_type in ROLLUP_CONTAINER_TYPES:
+            key_cols = self.get_rollup_key_columns(container_type)
+            if not key_cols or match_df.empty:
+                continue
+            sides = match_df['_merge'].astype(object)
+            if excluded_codes:
+                excluded = (sides == 'left_only') & match_df['tl_index_flywheel'].map(
+                    lambda codes: isinstance(codes, list) and not excluded_codes.isdisjoint(codes)
+                )
+                sides = sides.where(~excluded, 'excluded')
+            grouped_sides = sides.groupby(
+                [match_df[column] for column in key_cols], observed=True, sort=False
+            )
+            # Records with a missing key value are not in any group
+            rolled_up = (
+                (grouped_sides.transform('nunique') == 1)
+                & sides.isin(['left_only', 'right_only'])
+            )
+            if not rolled_up.any():
+                continue
+            for key, group_df in match_df[rolled_up].groupby(key_cols, observed=True, sort=False):
+                if not isinstance(key, tuple):
+                    key = (key,)
+                row = dict(zip(key_cols, key))
+                row['container_type'] = container_type
+                row['count_difference'] = 0
+                row['child_count'] = len(group_df)
+                if group_df['_merge'].iloc[0] == 'right_only':
+                    row['transfer_log_rows'] = sorted(
+                        itertools.chain.from_iterable(group_df['tl_index_metadata'])
+                    )
+                    row['error_code'] = ErrorCode.NOT_IN_FLYWHEEL
+                else:
+                    fw_ids = self.id_codec.decode_many(
+                        list(itertools.chain.from_iterable(group_df['tl_index_flywheel']))
+                    )
+                    row['matching_fw_ids'] = fw_ids
+                    row['path'] = self.get_parent_path(fw_ids[0], container_type)
+                    row['error_code'] = ErrorCode.NOT_IN_TRANSFER_LOG
+                rollup_rows.append(row)
+            match_df = match_df[~rolled_up]
+        rollup_df = pd.DataFrame(rollup_rows, columns=self.get_report_columns())
+        return set_error_code_dtypes(rollup_df), match_df
+
+    def get_error_df(self, match_df=None, render=True):
         """
         Creates a dataframe describing errors/inconsistencies between the
             Transfer Log and the Flywheel project
+        Args:
+            match_df (pandas.DataFrame): records of self.match_df to
+                classify, defaults to all of them
+            render (bool): if False, the error column is left out and errors
+                are only described by the ERROR_CODE_COLUMNS
         Returns:
             pandas.DataFrame
         """
-        # Copy so we don't transform match_df
-        error_df = self.match_df.copy()
-        # Get the error messages
-        error_df['error'] = error_df.apply(
-            self.get_match_row_error,
-            axis='columns'
-        )
-        # Drop rows without errors
-        error_df = error_df[error_df['error'].notnull()]
+        if match_df is None:
+            match_df = self.match_df
+        error_codes, count_differences = self.get_match_error_codes(match_df)
+        # Drop rows without errors, copying so we don't transform match_df
+        has_error = error_codes > 0
+        error_df = match_df[has_error].copy()
+        error_df['error_code'] = error_codes[has_error]
+        error_df['container_type'] = self.config.join
+        error_df['count_difference'] = count_differences[has_error]
+        # Report the match values rather than categories
+        for column in self.match_cols:
+            error_df[column] = error_df[column].astype(object)
+
+        if self.suggest_matches:
+            error_df = self.add_suggestions(error_df)
 
         # Copy tl_index_flywheel in preparation for transform to row per id
         error_df['matching_fw_ids'] = error_df['tl_index_flywheel'].copy()
@@ -650,6 +1578,17 @@ class TransferLog:
                 )) & (error_df['_merge'] != 'both'))
             ].reset_index(drop=True)
 
+        # Decode the Flywheel id codes for the report
+        flywheel_codes = error_df['tl_index_flywheel']
+        has_flywheel_id = flywheel_codes.notnull()
+        error_df['tl_index_flywheel'] = flywheel_codes.astype(object)
+        error_df.loc[has_flywheel_id, 'tl_index_flywheel'] = self.id_codec.decode_many(
+            flywheel_codes[has_flywheel_id]
+        )
+        error_df['matching_fw_ids'] = error_df['matching_fw_ids'].map(
+            lambda codes: self.id_codec.decode_many(codes) if isinstance(codes, list) else codes
+        )
+
         # Get the resolver paths for flywheel IDs
         error_df['path'] = error_df['tl_index_flywheel'].map(
             self.resolver_path_dict
@@ -664,13 +1603,130 @@ class TransferLog:
             axis='columns'
         )
         # Set columns and column order
+        error_df = set_error_code_dtypes(error_df.reindex(columns=self.get_report_columns()))
+        if render:
+            error_df = render_error_messages(error_df)
+        return error_df
+
+    def get_report_columns(self):
+        """Returns the columns of the error report, in order"""
         column_list = self.match_cols.copy()
         column_list = ['flywheel_id', 'transfer_log_rows'] + column_list
-        column_list = column_list + ['error', 'matching_fw_ids', 'path']
-        error_df = error_df[column_list]
+        column_list = column_list + ERROR_CODE_COLUMNS + ['matching_fw_ids', 'path']
+        if self.suggest_matches:
+            column_list = column_list + ['suggested_matches', 'suggestion_differences']
+        if self.rollup_errors:
+            column_list = column_list + ['child_count']
+        return column_list
+
+    def get_suggestion_indexes(self):
+        """
+        Builds (once per match_df) the indexes of Flywheel and transfer log
+            match keys used to suggest near misses
+
+        Returns:
+            tuple: the suggest.MatchKeyIndex of Flywheel keys, with lists of
+                container ids as payloads, and of transfer log keys, with
+                lists of rows as payloads
+        """
+        if self._suggestion_indexes is None:
+            indexes = list()
+            for side in ['flywheel', 'metadata']:
+                side_df = self.match_df[self.match_df['records_{}'.format(side)] > 0]
+                payloads = side_df['tl_index_{}'.format(side)]
+                if side == 'flywheel':
+                    payloads = payloads.map(self.id_codec.decode_many)
+                indexes.append(suggest.MatchKeyIndex(
+                    self.match_cols,
+                    side_df[self.match_cols].itertuples(index=False, name=None),
+                    payloads
+                ))
+            self._suggestion_indexes = tuple(indexes)
+        return self._suggestion_indexes
 
+    def add_suggestions(self, error_df):
+        """
+        Adds the nearest records on the other side to errors for records that
+            matched nothing
+
+        Args:
+            error_df (pandas.DataFrame): classified match_df rows
+
+        Returns:
+            pandas.DataFrame: error_df with suggested_matches (Flywheel ids or
+                transfer log rows) and suggestion_differences columns
+        """
+        flywheel_index, metadata_index = self.get_suggestion_indexes()
+        suggested_matches = list()
+        suggestion_differences = list()
+        for row in error_df[self.match_cols + ['_merge']].itertuples(index=False, name=None):
+            key, merge = row[:-1], row[-1]
+            if merge == 'right_only':
+                suggestions = flywheel_index.suggest(key)
+            elif merge == 'left_only':
+                suggestions = metadata_index.suggest(key)
+            else:
+                suggestions = list()
+            suggested_matches.append([
+                match for _, payload, _ in suggestions for match in payload
+            ] or None)
+            suggestion_differences.append(' | '.join(
+                suggest.format_differences(differences)
+                for _, _, differences in suggestions
+            ) or None)
+        error_df = error_df.assign(
+            suggested_matches=suggested_matches,
+            suggestion_differences=suggestion_differences
+        )
         return error_df
 
+    @staticmethod
+    def get_df_error_ids(df):
+        """
+        Gets the unique flywheel container IDs and Transfer Log row indices
+            of an error_df generated by get_error_df
+
+        Args:
+            df (pandas.DataFrame): a dataframe generated by
+                the get_error_df or reconcile_many methods
+
+        Returns:
+            tuple: set of flywheel container IDs and set of (source_log, row)
+                Transfer Log row indices. Rows of resolved errors are skipped,
+                and a rolled up subject or session is a single id: the tuple
+                of its Flywheel ids or its (source_log, rows) tuple
+        """
+        # Merged shard reports are read back from csv, with string flags
+        if 'resolved' in df.columns:
+            df = df[~df['resolved'].isin([True, 'True'])]
+        tl_index_set = set()
+        fw_index_set = set()
+        # Row numbers are only unique within a single transfer log
+        if 'source_log' in df.columns:
+            source_logs = df['source_log'].values
+        else:
+            source_logs = [None] * len(df)
+        if 'child_count' in df.columns:
+            rolled_up = df['child_count'].notnull().values
+            matching_fw_ids = df['matching_fw_ids'].values
+        else:
+            rolled_up = matching_fw_ids = [None] * len(df)
+        for source_log, val, fw_ids, is_rolled_up in zip(
+                source_logs, df['transfer_log_rows'].values, matching_fw_ids, rolled_up):
+            if not is_rolled_up:
+                if isinstance(val, list):
+                    tl_index_set.update((source_log, row) for row in val)
+            elif isinstance(val, list):
+                tl_index_set.add((source_log, tuple(val)))
+            elif isinstance(fw_ids, list):
+                fw_index_set.add(tuple(fw_ids))
+
+        fw_index_set.update(
+            fw_id for fw_id in df['flywheel_id'].unique()
+            if isinstance(fw_id, str)
+        )
+        return fw_index_set, tl_index_set
+
     @staticmethod
     def count_df_errors(df):
         """
@@ -679,26 +1735,18 @@ class TransferLog:
 
         Args:
             df (pandas.DataFrame): a dataframe generated by
-                the get_error_df method
+                the get_error_df or reconcile_many methods
 
         Returns:
             int: the count of unique flywheel container IDs and Transfer Log
                 row indices
         """
-        tl_index_list = list()
-        for val in df['transfer_log_rows'].values:
-            if isinstance(val, list):
-                tl_index_list.extend(val)
-
-        tl_index_list = list(set(tl_index_list))
-        fw_index_list = [
-            fw_id for fw_id in df['flywheel_id'].unique()
-            if isinstance(fw_id, str)
-        ]
-        err_count = len(fw_index_list) + len(tl_index_list)
+        fw_index_set, tl_index_set = TransferLog.get_df_error_ids(df)
+        err_count = len(fw_index_set) + len(tl_index_set)
         return err_count
 
     def match_df_records(self):
+        self.set_match_categories()
         # Collapse on match field values, add count for records
         fw_record_df = self.get_record_df(self.flywheel_df)
         meta_record_df = self.get_record_df(self.metadata_df)
@@ -708,16 +1756,21 @@ class TransferLog:
             how='outer', on=self.match_cols,
             indicator=True, suffixes=('_flywheel', '_metadata')
         )
+        self._suggestion_indexes = None
         # replace NA with 0 for record counts
         self.match_df['records_metadata'].fillna(0, inplace=True)
         self.match_df['records_flywheel'].fillna(0, inplace=True)
 
         # select rows where transfer log and flywheel match
         both_df = self.match_df[self.match_df['_merge'] == 'both']
-        # Get list of container IDs with transfer log matches
-        self.matched_containers = list(set([
-            x for array in both_df['tl_index_flywheel'] for x in array
-        ]))
+        # Get the id codes of containers with transfer log matches
+        self.matched_containers = np.unique(np.fromiter(
+            (x for array in both_df['tl_index_flywheel'] for x in array),
+            dtype=np.int64
+        ))
+        self._empty_codes = frozenset(
+            self.id_codec.get_known_codes(self.empty_containers).tolist()
+        )
         return self.match_df
 
 
@@ -830,32 +1883,73 @@ def get_df_dtypes(data_list, ignore_cols=None):
     return df_dtypes
 
 
-@backoff.on_exception(backoff.expo, flywheel.rest.ApiException,
-                      max_time=300, giveup=utils.false_if_status_gte_500)
-def get_data_list(fw_client, data_view, container_id):
+@utils.retry_on_server_error
+def get_data_list(fw_client, data_view, container_id, progress=None,
+                  transport=JSON_TRANSPORT, boolean_columns=None):
     """
-    Returns view rows for a container from flywheel as a list of dicts
+    Returns view rows for a container from flywheel as a list of dicts, or
+        as a DataFrame for the csv transport
     Args:
         fw_client (flywheel.Client): an instance of the flywheel client
         data_view (flywheel.DataView): the data view for which to retrieve data
         container_id (str): flywheel container id
+        progress (utils.ProgressReporter): if provided, the size of the
+            response is added to its bytes received
+        transport (str): format to read the rows in, one of VIEW_TRANSPORTS
+        boolean_columns (list): columns parsed as booleans by the csv
+            transport, such as those of get_view_ignore_cols
 
     Returns:
-        list: list of dicts representing view rows
+        list|pandas.DataFrame: list of dicts representing view rows, or the
+            DataFrame of parse_csv_view_data for the csv transport
     """
     log.debug('Loading data view for %s', container_id)
 
     data_view_response = fw_client.read_view_data(
-        data_view, container_id, decode=False, format='json-flat'
+        data_view, container_id, decode=False, format=transport
     )
 
-    response_json = json.loads(data_view_response.data.decode())
+    response_data = data_view_response.data
+    if progress:
+        progress.update(count=0, bytes_received=len(response_data))
     data_view_response.close()
+    if transport == CSV_TRANSPORT:
+        return parse_csv_view_data(response_data, boolean_columns)
+    response_json = json.loads(response_data.decode())
     response_json = format_json_list_for_python(response_json)
 
     return response_json
 
 
+def parse_csv_view_data(data, boolean_columns=None):
+    """
+    Parses csv DataView rows with the pandas C reader straight into a
+        DataFrame, with the same values as format_json_list_for_python
+
+    Every value is kept as text, so labels such as 0012 keep their leading
+    zeros, except in boolean_columns, where true and false become True and
+    False. null (or empty) values become None.
+
+    Args:
+        data (bytes): the csv response body
+        boolean_columns (list): columns of booleans
+
+    Returns:
+        pandas.DataFrame: a column of object dtype per DataView column
+    """
+    if not data.strip():
+        return pd.DataFrame()
+    boolean_columns = set(boolean_columns or [])
+    # Columns without a dtype would have their types inferred
+    header = next(csv.reader([data.split(b'\n', 1)[0].decode('utf-8')]))
+    df = pd.read_csv(
+        io.BytesIO(data), dtype={column: str for column in header if column not in boolean_columns},
+        true_values=CSV_TRUE_VALUES, false_values=CSV_FALSE_VALUES,
+        keep_default_na=False, na_values=CSV_NA_VALUES, encoding='utf-8'
+    )
+    return df.astype(object).where(df.notna(), None)
+
+
 def format_json_list_for_python(json_list):
     """
     Given an input list of flat dicts, returns dictionary with str values of
@@ -902,7 +1996,164 @@ def format_flywheel_table(row_dict_list, ignore_cols=None):
     return flywheel_table
 
 
-def get_flywheel_records(fw_client, config, project_id):
+class FlywheelColumns(object):
+    """
+    Column buffers DataView rows are appended to subject by subject, so the
+        Flywheel table is assembled once as a DataFrame of python values
+        instead of through intermediate lists of dicts and DataFrames
+
+    Attributes:
+        columns (dict): column: list of values, None where a row lacks the
+            column
+        row_count (int): number of rows appended
+    """
+
+    def __init__(self):
+        self.columns = dict()
+        self.row_count = 0
+
+    def extend(self, rows):
+        """Appends the values of rows, a list of dicts or a DataFrame from
+        parse_csv_view_data, to the column buffers"""
+        if isinstance(rows, pd.DataFrame):
+            row_count = len(rows)
+            row_columns = {column: rows[column].tolist() for column in rows.columns}
+        else:
+            row_count = len(rows)
+            keys = dict()
+            for row in rows:
+                keys.update(dict.fromkeys(row))
+            row_columns = {key: [row.get(key) for row in rows] for key in keys}
+        if not row_count:
+            return
+        for key, values in row_columns.items():
+            if key not in self.columns:
+                self.columns[key] = [None] * self.row_count
+            self.columns[key].extend(values)
+        for key, values in self.columns.items():
+            if key not in row_columns:
+                values.extend([None] * row_count)
+        self.row_count += row_count
+
+    def get_df(self):
+        """
+        Assembles the buffers into a DataFrame with the session timestamps
+            converted as by format_flywheel_table
+
+        Returns:
+            pandas.DataFrame: a column of object dtype per DataView column,
+                which keeps ints, bools and None as they were received
+        """
+        columns = self.columns
+        if 'session.timestamp' in columns:
+            timezones = columns.get('session.timezone') or [None] * self.row_count
+            converted = dict()
+            timestamps = list()
+            for timestamp, timezone in zip(columns['session.timestamp'], timezones):
+                if (timestamp, timezone) not in converted:
+                    converted[(timestamp, timezone)] = convert_timezones(
+                        {'session.timestamp': timestamp, 'session.timezone': timezone}
+                    )
+                timestamps.append(converted[(timestamp, timezone)])
+            columns = dict(columns, **{'session.timestamp': timestamps})
+        return pd.DataFrame({
+            column: pd.Series(values, dtype=object) for column, values in columns.items()
+        }, index=pd.RangeIndex(self.row_count))
+
+
+def get_view_ignore_cols(config):
+    """
+    Returns the bookkeeping columns of the view from get_view_from_config,
+        which are excluded when formatting dtypes
+    """
+    container_type = config.join
+    valid_key = '{}.info.transfer_log.valid'.format(container_type)
+    deleted_key = '{}.deleted'.format(container_type)
+    return [valid_key, deleted_key]
+
+
+class FetchCheckpoint(object):
+    """
+    Appends the DataView rows of each fetched subject to a JSON Lines file, so
+        that an interrupted fetch resumes after the last completed subject
+
+    Args:
+        path (str): path of the checkpoint file
+        key (dict): describes the fetch, a checkpoint written for another key
+            (another project or template) is discarded
+
+    Attributes:
+        path (str): path of the checkpoint file
+        key (dict): describes the fetch
+        subject_rows (dict): subject id: rows fetched by a previous attempt
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.subject_rows = dict()
+        self._file = None
+
+    def open(self):
+        """Loads the subjects of a previous attempt and rewrites the file
+            without any line cut short by the interruption"""
+        lines = list()
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as fp:
+                for line in fp:
+                    try:
+                        lines.append(json.loads(line))
+                    except ValueError:
+                        break
+        if lines and lines[0] == {'key': self.key}:
+            self.subject_rows = {
+                line['subject_id']: line['rows'] for line in lines[1:]
+            }
+            log.info('Resuming Flywheel fetch after %s subjects from %s',
+                     len(self.subject_rows), self.path)
+        self._file = open(self.path, 'w')
+        self._write({'key': self.key})
+        for subject_id, rows in self.subject_rows.items():
+            self._write({'subject_id': subject_id, 'rows': rows})
+
+    def _write(self, line):
+        self._file.write(json.dumps(line) + '\n')
+        self._file.flush()
+
+    def add(self, subject_id, rows):
+        """Persists the rows of a fetched subject, a list of dicts or a
+        DataFrame from parse_csv_view_data"""
+        if isinstance(rows, pd.DataFrame):
+            rows = rows.to_dict(orient='records')
+        self.subject_rows[subject_id] = rows
+        self._write({'subject_id': subject_id, 'rows': rows})
+
+    def close(self):
+        """Closes the checkpoint file, keeping it to resume the fetch"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Deletes the checkpoint once the fetch is complete"""
+        self.close()
+        os.remove(self.path)
+
+
+def get_checkpoint_key(config, project_id):
+    """Describes a Flywheel fetch by its project and DataView"""
+    return {
+        'project_id': project_id,
+        'join': config.join,
+        'filename': config.filename,
+        'filters': config.filters,
+        'fields': [query.field for query in config.queries]
+    }
+
+
+def get_flywheel_records(fw_client, config, project_id, subject_filter=None,
+                         checkpoint_path=None, deadline=None, uncovered_subjects=None,
+                         subjects=None, transport=JSON_TRANSPORT, columnar=False):
     """
     Load records for a Flywheel project with id project_id according to config
     Args:
@@ -910,23 +2161,75 @@ def get_flywheel_records(fw_client, config, project_id):
         config (transfer_log.Config): config object representing template file
             input
         project_id (str): flywheel container id
+        subject_filter (callable): if provided, only subjects for which
+            subject_filter(subject) is True are loaded
+        checkpoint_path (str): if provided, the rows of each subject are
+            saved to this file as they are fetched, and subjects saved by an
+            interrupted run are not fetched again. The file is deleted once
+            every subject is fetched
+        deadline (float): if provided, the time.monotonic() time after which
+            no more subjects are fetched
+        uncovered_subjects (list): the subjects that were not fetched before
+            the deadline are appended to this list
+        subjects (iterable): the subjects to fetch, defaults to every subject
+            of the project
+        transport (str): format to read the DataView rows in, one of
+            VIEW_TRANSPORTS
+        columnar (bool): if True, the rows are appended to FlywheelColumns as
+            they are fetched and returned as a DataFrame
 
     Returns:
-        list: a formatted list of dicts retrieved from flywheel for a dataview
+        list: a formatted list of dicts retrieved from flywheel for a dataview,
+            or a pandas.DataFrame of the rows if columnar
             constructed according to config
     """
-    container_type = config.join
-    valid_key = '{}.info.transfer_log.valid'.format(container_type)
-    deleted_key = '{}.deleted'.format(container_type)
-    ignore_cols = [valid_key, deleted_key]
+    ignore_cols = get_view_ignore_cols(config)
     view = get_view_from_config(fw_client, config)
-    data_list = list()
-    project = fw_client.get_project(project_id)
-    for subject in project.subjects.iter():
-        tmp_list = get_data_list(
-            fw_client=fw_client, data_view=view, container_id=subject.id
-        )
-        data_list.extend(tmp_list)
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = FetchCheckpoint(checkpoint_path, get_checkpoint_key(config, project_id))
+        checkpoint.open()
+    data_list = FlywheelColumns() if columnar else list()
+    if subjects is None:
+        subjects = fw_client.get_project(project_id).subjects.iter()
+    subjects = [
+        subject for subject in subjects
+        if not subject_filter or subject_filter(subject)
+    ]
+    progress = utils.ProgressReporter('Flywheel fetch', total=len(subjects), unit='subjects')
+    fetch_complete = True
+    try:
+        for index, subject in enumerate(subjects):
+            if deadline is not None and time.monotonic() >= deadline:
+                log.warning('Time budget used up, %s subjects were not fetched',
+                            len(subjects) - index)
+                if uncovered_subjects is not None:
+                    uncovered_subjects.extend(subjects[index:])
+                fetch_complete = False
+                break
+            if checkpoint and subject.id in checkpoint.subject_rows:
+                tmp_list = checkpoint.subject_rows[subject.id]
+            else:
+                tmp_list = get_data_list(
+                    fw_client=fw_client, data_view=view, container_id=subject.id,
+                    progress=progress, transport=transport, boolean_columns=ignore_cols
+                )
+                if checkpoint:
+                    checkpoint.add(subject.id, tmp_list)
+            # Only the columnar buffers take the csv transport's DataFrame as is
+            if not columnar and isinstance(tmp_list, pd.DataFrame):
+                tmp_list = tmp_list.to_dict(orient='records')
+            data_list.extend(tmp_list)
+            progress.update(rows=len(tmp_list))
+        progress.finish()
+        # Keep the checkpoint of a fetch stopped by the deadline to resume it
+        if checkpoint and fetch_complete:
+            checkpoint.remove()
+    finally:
+        if checkpoint:
+            checkpoint.close()
+    if columnar:
+        return data_list.get_df()
     flywheel_table = format_flywheel_table(data_list, ignore_cols=ignore_cols)
     return flywheel_table
 
@@ -952,13 +2255,95 @@ def convert_timezones(row):
         return row['session.timestamp']
 
 
-def check_config_and_log_match(config, raw_metadata):
+def get_timeformat_errors(values, timeformat):
+    """
+    Finds the values that cannot be parsed with timeformat. Each distinct
+        value is only parsed once
+
+    Args:
+        values (list): str values, None values are skipped
+        timeformat (str): a datetime.strptime format
+
+    Returns:
+        list: indices of the values that do not match timeformat
+    """
+    parsed = dict()
+    invalid_indices = list()
+    for index, value in enumerate(values):
+        if value is None:
+            continue
+        if value not in parsed:
+            try:
+                datetime.datetime.strptime(value, timeformat)
+                parsed[value] = True
+            except Exception:
+                parsed[value] = False
+        if not parsed[value]:
+            invalid_indices.append(index)
+    return invalid_indices
+
+
+def validate_transfer_log_rows(config, rows, row_offset=0):
+    """
+    Validates transfer log rows against the queries of config, one column at
+        a time with compiled patterns
+
+    Args:
+        config (Config): The loaded in template file
+        rows (list): A list of rows, which are represented as dicts, with all
+            the columns expected by config
+        row_offset (int): index of rows[0] in the transfer log
+
+    Returns:
+        list: List of malformed transfer log errors, ordered by row then query
+    """
+    keyed_errors = list()
+    for query_index, query in enumerate(config.queries):
+        if query.value is False:
+            continue
+        raw_values = [row[query.value] for row in rows]
+        if query.validate:
+            pattern = re.compile(query.validate)
+            # Distinct values are only searched once
+            matches = dict()
+            values = list()
+            for index, raw_value in enumerate(raw_values):
+                str_value = str(raw_value)
+                if str_value not in matches:
+                    match = pattern.search(str_value)
+                    matches[str_value] = match.group(0).strip() if match else None
+                value = matches[str_value]
+                if value is None:
+                    keyed_errors.append(((index, query_index, 0), {
+                        'row': row_offset + index + 2,
+                        'column': query.value,
+                        'error': 'Value {} does not match {}'.format(raw_value,
+                                                                     query.validate)
+                    }))
+                values.append(value)
+        else:
+            values = [str(raw_value) for raw_value in raw_values]
+        if query.timeformat:
+            for index in get_timeformat_errors(values, query.timeformat):
+                keyed_errors.append(((index, query_index, 1), {
+                    'row': row_offset + index + 2,
+                    'column': query.value,
+                    'error': 'Timeformat {} does not match {}'.format(values[index],
+                                                                      query.timeformat)
+                }))
+    keyed_errors.sort(key=lambda keyed_error: keyed_error[0])
+    return [error for _, error in keyed_errors]
+
+
+def check_config_and_log_match(config, raw_metadata, workers=None):
     """Ensures that all the columns expected by the config are present in the
         transfer_log unless query value is False
 
     Args:
         config (Config): The loaded in template file
         raw_metadata (list): A list of rows, which are represented as dicts
+        workers (int): number of processes used to validate logs with more
+            than PARALLEL_VALIDATION_ROWS rows, defaults to the cpu count
 
     Returns:
         list: List of malformed transfer log errors
@@ -973,39 +2358,195 @@ def check_config_and_log_match(config, raw_metadata):
             })
 
     if not error_list:
-        for index, row in enumerate(raw_metadata):
-            for query in config.queries:
-                value = None
-                if query.validate:
-                    match = re.search(query.validate, str(row[query.value]))
-                    if not match:
-                        error_list.append({
-                            'row': index + 2,
-                            'column': query.value,
-                            'error': 'Value {} does not match {}'.format(row[query.value],
-                                                                         query.validate)
-                        })
-                    try:
-                        value = match.group(0).strip()
-                    except AttributeError:
-                        pass
-                elif query.value is not False:
-                    value = str(row[query.value])
-                if query.timeformat and value is not None:
-                    try:
-                        datetime.datetime.strptime(str(value), query.timeformat)
-                    except Exception:
-                        error_list.append({
-                            'row': index + 2,
-                            'column': query.value,
-                            'error': 'Timeformat {} does not match {}'.format(value,
-                                                                              query.timeformat)
-                        })
+        workers = workers or os.cpu_count() or 1
+        if len(raw_metadata) < PARALLEL_VALIDATION_ROWS or workers < 2:
+            error_list = validate_transfer_log_rows(config, raw_metadata)
+        else:
+            chunksize = -(-len(raw_metadata) // workers)
+            offsets = list(range(0, len(raw_metadata), chunksize))
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                chunk_errors = executor.map(
+                    validate_transfer_log_rows,
+                    [config] * len(offsets),
+                    [raw_metadata[offset:offset + chunksize] for offset in offsets],
+                    offsets
+                )
+                for errors in chunk_errors:
+                    error_list.extend(errors)
 
     return error_list
 
 
-def main(gear_context, log_level, project_path, dry_run=False):
+def validate_transfer_log(config, transfer_log_path, case_insensitive=False):
+    """
+    Checks a transfer log without contacting Flywheel: loads it, validates it
+        against the template, normalizes the value of every query column and
+        finds rows that repeat the match key of an earlier row
+
+    Args:
+        config (Config): the config object
+        transfer_log_path (str): path to the transfer log
+        case_insensitive (bool): if True, values are normalized to lower-case
+
+    Returns:
+        list: error dicts with the keys in TRANSFER_LOG_ERROR_HEADERS and a
+            severity: 'error' for values that cannot be normalized, 'warning'
+            for duplicate keys, which several files may share on purpose
+
+    Raises:
+        TransferLogException: if columns are missing or values do not match
+            the template
+    """
+    queries = [query for query in config.queries if query.value]
+    key_rows = dict()
+    errors = list()
+    for index, row_dict in enumerate(load_transfer_log(transfer_log_path, config)):
+        metadata_row = MetadataRow(config, row_dict, index, case_insensitive)
+        row = metadata_row.spreadsheet_index
+        key = list()
+        for query in queries:
+            value = row_dict.get(query.field) or row_dict.get(query.value)
+            try:
+                key.append(metadata_row.format_value(query, value))
+            except (AttributeError, TypeError, ValueError) as exc:
+                errors.append({
+                    'row': row,
+                    'column': query.value,
+                    'error': 'Cannot normalize value {!r}: {}'.format(value, exc),
+                    'severity': 'error'
+                })
+                key = None
+                break
+        if key is None:
+            continue
+        first_row = key_rows.setdefault(tuple(key), row)
+        if first_row != row:
+            errors.append({
+                'row': row,
+                'column': ', '.join(query.value for query in queries),
+                'error': 'Duplicate key of row {}'.format(first_row),
+                'severity': 'warning'
+            })
+    return errors
+
+
+def get_validation_df(config, transfer_log_paths, case_insensitive=False):
+    """
+    Validates transfer logs offline with validate_transfer_log
+
+    Args:
+        config (Config): the config object
+        transfer_log_paths (list): paths to the transfer logs
+        case_insensitive (bool): if True, values are normalized to lower-case
+
+    Returns:
+        pandas.DataFrame: a row per error, with a source_log column first if
+            there are several transfer logs and a severity column last
+    """
+    columns = TRANSFER_LOG_ERROR_HEADERS + ['severity']
+    if len(transfer_log_paths) > 1:
+        columns = ['source_log'] + columns
+    errors = list()
+    for transfer_log_path in transfer_log_paths:
+        log.info('Validating %s...', transfer_log_path)
+        source_log = str(transfer_log_path)
+        for error in validate_transfer_log(config, transfer_log_path, case_insensitive):
+            error['source_log'] = source_log
+            errors.append(error)
+    return pd.DataFrame(errors, columns=columns)
+
+
+def set_error_code_dtypes(error_df):
+    """Stores the ERROR_CODE_COLUMNS of error_df as small integers and a
+        category"""
+    return error_df.astype({
+        'error_code': np.uint8,
+        'container_type': 'category',
+        'count_difference': np.uint32
+    })
+
+
+def render_error_messages(error_df):
+    """
+    Renders the human readable error column of an error dataframe from its
+        ERROR_CODE_COLUMNS, once per distinct error rather than per row
+
+    Args:
+        error_df (pandas.DataFrame): error dataframe, as yielded by
+            TransferLog.iter_error_dfs
+
+    Returns:
+        pandas.DataFrame: error_df with an error column before error_code,
+            error_df itself if it has an error column or no error codes
+    """
+    if 'error' in error_df.columns or 'error_code' not in error_df.columns:
+        return error_df
+    error_keys = list(zip(
+        error_df['error_code'], error_df['container_type'], error_df['count_difference']
+    ))
+    messages = {
+        error_key: ERROR_MESSAGES[ErrorCode(error_key[0])].format(
+            container_type=error_key[1], count_difference=error_key[2]
+        )
+        for error_key in set(error_keys)
+    }
+    error_df = error_df.copy()
+    error_df.insert(
+        error_df.columns.get_loc('error_code'), 'error', [messages[key] for key in error_keys]
+    )
+    return error_df
+
+
+def write_error_report(error_dfs, output_path):
+    """
+    Streams error dataframe chunks to a report file, counting the errors as
+        they are written
+
+    Args:
+        error_dfs (iterable): error dataframes, as yielded by
+            TransferLog.iter_error_dfs or TransferLog.iter_reconcile_many
+        output_path (str): path of the report, its extension selects the format
+
+    Returns:
+        int: the count of unique flywheel container IDs and Transfer Log
+            row indices
+    """
+    fw_index_set = set()
+    tl_index_set = set()
+    with report.open_report_writer(output_path) as writer:
+        for error_df in error_dfs:
+            writer.write(render_error_messages(error_df))
+            chunk_fw_index_set, chunk_tl_index_set = TransferLog.get_df_error_ids(error_df)
+            fw_index_set.update(chunk_fw_index_set)
+            tl_index_set.update(chunk_tl_index_set)
+    return len(fw_index_set) + len(tl_index_set)
+
+
+def iter_subject_error_ids(error_dfs, subject_error_ids):
+    """
+    Passes error dataframe chunks through, collecting the unique Flywheel
+        container IDs and Transfer Log row indices of each subject's errors
+
+    Args:
+        error_dfs (iterable): error dataframes, as yielded by
+            TransferLog.iter_error_dfs
+        subject_error_ids (dict): updated with subject.label match value: set
+            of error ids pairs
+
+    Yields:
+        pandas.DataFrame: the chunks of error_dfs
+    """
+    for error_df in error_dfs:
+        for subject_key, subject_df in error_df.groupby('subject.label', sort=False):
+            fw_index_set, tl_index_set = TransferLog.get_df_error_ids(subject_df)
+            subject_error_ids.setdefault(subject_key, set()).update(fw_index_set, tl_index_set)
+        yield error_df
+
+
+def main(gear_context, log_level, project_path, dry_run=False, output_path=None,
+         validate_only=False, write_validity=False, save_snapshot=None,
+         from_snapshot=None, uncovered_subjects=None, sample_estimate=None,
+         error_state_path=None, transfer_log_rows=None, incomplete_scans=None):
     """Query flywheel for a set of containers base on a tabular file and a
         yaml template on how to use the csv file
 
@@ -1013,8 +2554,44 @@ def main(gear_context, log_level, project_path, dry_run=False):
             gear_context (GearContext): the flywheel gear context object
             log_level (str|int): A logging level (DEBUG, INFO) or int (10, 50)
             project_path (str): The resolver path to the project
-            dry_run (bool): whether to update info.transfer_log.valid on containers that are valid
+            dry_run (bool): if True, info.transfer_log.valid is not written even
+                when write_validity is set
+            output_path (str): if provided, the error report is streamed to
+                this path as it is classified and no error_df is returned
+            validate_only (bool): if True, only validate the transfer log
+                offline (see get_validation_df), without contacting Flywheel.
+                Also read from the validate_only option of gear_context
+            write_validity (bool): if True, write info.transfer_log.valid on
+                the containers whose flag changed. Also read from the
+                write_validity option of gear_context
+            save_snapshot (str): if provided, save the Flywheel records to a
+                Parquet snapshot at this path
+            from_snapshot (str): if provided, load the Flywheel records from
+                the snapshot at this path instead of from Flywheel
+            uncovered_subjects (list): if provided, the subjects that were not
+                fetched within the time_budget option (seconds) are appended
+                to this list. Their rows mark the report as partial and are
+                not counted as errors
+            sample_estimate (dict): if provided and the sample_size option is
+                set, updated with the error rate estimates of the project (see
+                sample.estimate_error_rate)
+            error_state_path (str): if provided, the sqlite database of the
+                errors of previous runs, created if missing. The report gets
+                a status column (new, open or resolved), the errors that were
+                fixed since the last run are appended with resolved set, and
+                the database is updated with this run. Also read from the
+                error_state option of gear_context
+            transfer_log_rows (list): if provided, the rows of the single
+                transfer log, already loaded and validated by
+                load_transfer_log, so it is not read again
+            incomplete_scans (list): if provided, the names of the Flywheel
+                scans that the time_budget option stopped early are appended
+                to this list. They mark the report as partial
 
+        Returns:
+            tuple: the error dataframe (None if output_path is provided) and
+                the error count, which is the count of rows with errors when
+                validating only
         """
     if isinstance(gear_context, dict):
         client = gear_context.get('client')
@@ -1022,6 +2599,21 @@ def main(gear_context, log_level, project_path, dry_run=False):
         metadata = gear_context.get('transfer_log')
         case_insensitive = gear_context.get('case_insensitive')
         match_containers_once = gear_context.get('match_containers_once')
+        shard_index = gear_context.get('shard_index') or 0
+        shard_count = gear_context.get('shard_count') or 1
+        suggest_matches = gear_context.get('suggest_matches')
+        validate_only = validate_only or gear_context.get('validate_only')
+        write_validity = write_validity or gear_context.get('write_validity')
+        checkpoint_path = gear_context.get('checkpoint')
+        progress_interval = gear_context.get('progress_interval')
+        status_path = gear_context.get('status_file')
+        time_budget = gear_context.get('time_budget')
+        sample_size = gear_context.get('sample_size')
+        sample_seed = gear_context.get('sample_seed')
+        targeted_fetch = gear_context.get('targeted_fetch')
+        view_transport = gear_context.get('view_transport') or JSON_TRANSPORT
+        error_state_path = error_state_path or gear_context.get('error_state')
+        rollup_errors = gear_context.get('rollup_errors')
     else:
         # Extract values from gear_context
         client = gear_context.client
@@ -1029,23 +2621,213 @@ def main(gear_context, log_level, project_path, dry_run=False):
         metadata = gear_context.get_input_path('transfer_log')
         case_insensitive = gear_context.config.get('case_insensitive')
         match_containers_once = gear_context.config.get('match_containers_once')
+        shard_index = gear_context.config.get('shard_index') or 0
+        shard_count = gear_context.config.get('shard_count') or 1
+        suggest_matches = gear_context.config.get('suggest_matches')
+        validate_only = validate_only or gear_context.config.get('validate_only')
+        write_validity = write_validity or gear_context.config.get('write_validity')
+        checkpoint_path = None
+        progress_interval = gear_context.config.get('progress_interval')
+        status_path = os.path.join(gear_context.output_dir, 'transfer-log-progress.json')
+        time_budget = gear_context.config.get('time_budget')
+        sample_size = gear_context.config.get('sample_size')
+        sample_seed = gear_context.config.get('sample_seed')
+        targeted_fetch = gear_context.config.get('targeted_fetch')
+        view_transport = gear_context.config.get('view_transport') or JSON_TRANSPORT
+        rollup_errors = gear_context.config.get('rollup_errors')
+        # The updated error state is an output, to be the input of the next run
+        error_state_input = gear_context.get_input_path('error_state')
+        error_state_path = None
+        if error_state_input or gear_context.config.get('track_errors'):
+            error_state_path = os.path.join(gear_context.output_dir,
+                                            'transfer-log-error-state.sqlite')
+        if error_state_input:
+            shutil.copyfile(error_state_input, error_state_path)
+    # Part of the budget is kept for matching and writing the report
+    deadline = None
+    if time_budget:
+        deadline = JOB_START + time_budget * (1 - TIME_BUDGET_RESERVE)
 
     # Load in the config yaml input
     config = load_config_file(config_path)
 
     # set logging level
     log.setLevel(log_level)
+    utils.ProgressReporter.configure(interval=progress_interval, status_path=status_path)
+
+    # Several transfer logs can be reconciled against a single project fetch
+    if isinstance(metadata, (list, tuple)):
+        transfer_log_paths = list(metadata)
+    else:
+        transfer_log_paths = [metadata]
+
+    if validate_only:
+        validation_df = get_validation_df(config, transfer_log_paths, case_insensitive)
+        # Duplicate keys are listed for review but are not counted
+        is_warning = validation_df['severity'] == 'warning'
+        if is_warning.any():
+            log.info('%s rows repeat the match key of an earlier row', is_warning.sum())
+        error_count = len(validation_df[~is_warning].drop_duplicates(
+            subset=[column for column in ['source_log', 'row'] if column in validation_df]
+        ))
+        if output_path:
+            log.info('Writing validation report to %s', output_path)
+            with report.open_report_writer(output_path) as writer:
+                writer.write(validation_df)
+            return None, error_count
+        return validation_df, error_count
+
+    if sample_size and (len(transfer_log_paths) > 1 or from_snapshot):
+        raise ValueError('Sampling requires a single transfer log and a Flywheel fetch')
+    if targeted_fetch and (len(transfer_log_paths) > 1 or from_snapshot):
+        raise ValueError('Targeted fetches require a single transfer log and a Flywheel fetch')
+    if save_snapshot and (sample_size or targeted_fetch or shard_count > 1):
+        raise ValueError('A snapshot must hold every subject, it cannot be saved '
+                         'from a sampled, targeted or sharded fetch')
 
     log.debug('Project path is {}'.format(project_path))
-    project = client.lookup(project_path)
-    transfer_log = TransferLog(client, config, metadata, project.id, case_insensitive,
-                               match_containers_once)
-    transfer_log.initialize()
-    error_df = transfer_log.get_error_df()
-    error_count = transfer_log.count_df_errors(error_df)
+    # A snapshot holds the project id, so no lookup is needed
+    project_id = None if from_snapshot else client.lookup(project_path).id
+    transfer_log = TransferLog(client, config, transfer_log_paths[0], project_id,
+                               case_insensitive, match_containers_once,
+                               shard_index=shard_index, shard_count=shard_count,
+                               suggest_matches=suggest_matches,
+                               checkpoint_path=checkpoint_path, deadline=deadline,
+                               sample_size=sample_size, sample_seed=sample_seed,
+                               targeted_fetch=targeted_fetch, view_transport=view_transport,
+                               rollup_errors=rollup_errors,
+                               transfer_log_rows=transfer_log_rows)
+    if len(transfer_log_paths) > 1:
+        transfer_log.load_flywheel_data(from_snapshot)
+        error_dfs = transfer_log.iter_reconcile_many(transfer_log_paths)
+    else:
+        transfer_log.initialize(from_snapshot)
+        error_dfs = transfer_log.iter_error_dfs()
+    if save_snapshot:
+        # Whether the time budget cut the fetch short is only known now, and
+        # the partial report is still worth writing
+        if transfer_log.uncovered_subjects or not transfer_log.empty_scan_complete:
+            log.warning('Not saving the snapshot, the time budget ran out before '
+                        'the whole project was fetched')
+        else:
+            transfer_log.save_snapshot(save_snapshot)
+    if transfer_log.uncovered_subjects:
+        log.warning('Writing a partial report, %s subjects were not reconciled',
+                    len(transfer_log.uncovered_subjects))
+        uncovered_df = transfer_log.get_subject_error_df(
+            transfer_log.uncovered_subjects, ErrorCode.SUBJECT_NOT_RECONCILED
+        )
+        if len(transfer_log_paths) > 1:
+            uncovered_df.insert(0, 'source_log', None)
+        error_dfs = itertools.chain(error_dfs, [uncovered_df])
+        if uncovered_subjects is not None:
+            uncovered_subjects.extend(transfer_log.uncovered_subjects)
+    if not transfer_log.empty_scan_complete:
+        log.warning('Writing a partial report, the empty container scan did not finish: '
+                    'empty containers it missed are reported as not present in the transfer log')
+        if incomplete_scans is not None:
+            incomplete_scans.append('empty container scan')
+    if transfer_log.unexpected_subjects:
+        error_dfs = itertools.chain(error_dfs, [transfer_log.get_subject_error_df(
+            transfer_log.unexpected_subjects, ErrorCode.NOT_IN_TRANSFER_LOG
+        )])
+    subject_error_ids = dict()
+    if sample_size:
+        error_dfs = iter_subject_error_ids(error_dfs, subject_error_ids)
+
+    with contextlib.ExitStack() as exit_stack:
+        if error_state_path:
+            key_columns = transfer_log.match_cols + ['flywheel_id']
+            if len(transfer_log_paths) > 1:
+                key_columns = ['source_log'] + key_columns
+            error_state_store = exit_stack.enter_context(
+                error_state.ErrorStateStore(
+                    error_state_path, key_columns,
+                    untracked_error_codes=[ErrorCode.SUBJECT_NOT_RECONCILED]
+                )
+            )
+            # A run that skipped part of the project cannot tell a fixed error
+            # from one it did not check
+            full_run = not (shard_count > 1 or sample_size or targeted_fetch
+                            or transfer_log.uncovered_subjects
+                            or not transfer_log.empty_scan_complete)
+            error_dfs = error_state_store.iter_error_diff(error_dfs, resolve=full_run)
+        if output_path:
+            log.info('Writing error report to %s', output_path)
+            error_count = write_error_report(error_dfs, output_path)
+            error_df = None
+        else:
+            error_df = render_error_messages(pd.concat(error_dfs, ignore_index=True))
+            error_count = transfer_log.count_df_errors(error_df)
+    # Subjects that were not reconciled are not errors
+    error_count -= len(transfer_log.uncovered_subjects)
+    if sample_size:
+        estimate = transfer_log.get_sample_estimate({
+            subject_key: len(error_ids) for subject_key, error_ids in subject_error_ids.items()
+        })
+        log.info('Estimated from %s of %s subjects: %.1f%% of subjects with errors '
+                 '(95%% CI %.1f%%-%.1f%%), %.0f errors (95%% CI %.0f-%.0f)',
+                 estimate['sampled_subjects'], estimate['subjects'],
+                 100 * estimate['error_rate'], 100 * estimate['error_rate_ci'][0],
+                 100 * estimate['error_rate_ci'][1], estimate['estimated_error_count'],
+                 *estimate['estimated_error_count_ci'])
+        if sample_estimate is not None:
+            sample_estimate.update(estimate)
+
+    if write_validity:
+        # A container's validity is only defined against a single transfer log
+        if len(transfer_log_paths) > 1:
+            log.warning('Not writing info.transfer_log.valid for multiple transfer logs')
+        elif from_snapshot:
+            log.warning('Not writing info.transfer_log.valid from a snapshot')
+        else:
+            write_validity_flags(client, config.join, transfer_log.get_validity_updates(),
+                                 dry_run=dry_run)
     return error_df, error_count
 
 
+@utils.retry_on_server_error
+def set_container_validity(fw_client, container_type, container_id, valid):
+    """Sets info.transfer_log.valid on a Flywheel container"""
+    modify_info = getattr(fw_client, 'modify_{}_info'.format(container_type))
+    modify_info(container_id, {'set': {'transfer_log': {'valid': valid}}})
+
+
+def write_validity_flags(fw_client, container_type, updates, dry_run=False,
+                         workers=VALIDITY_WORKERS, rate=VALIDITY_UPDATES_PER_SECOND):
+    """
+    Writes info.transfer_log.valid flags concurrently, under a rate limit
+
+    Args:
+        fw_client (flywheel.Client): an instance of the flywheel client
+        container_type (str): 'subject', 'session', or 'acquisition'
+        updates (dict): container id: valid pairs, as returned by
+            TransferLog.get_validity_updates
+        dry_run (bool): if True, only log the number of flags to write
+        workers (int): number of concurrent updates
+        rate (float): maximum number of updates per second
+
+    Returns:
+        int: the number of flags written
+    """
+    valid_count = sum(1 for valid in updates.values() if valid)
+    log.info('%s info.transfer_log.valid on %s containers (%s valid, %s invalid)',
+             'Would update' if dry_run else 'Updating', len(updates),
+             valid_count, len(updates) - valid_count)
+    if dry_run or not updates:
+        return 0
+    rate_limiter = utils.RateLimiter(rate)
+
+    def set_validity(item):
+        rate_limiter.wait()
+        set_container_validity(fw_client, container_type, *item)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(set_validity, updates.items()):
+            pass
+    return len(updates)
+
+
 def create_output_file(errors, filename, validate_transfer_log=False, headers=None):
     """Outputs the errors into a csv file
 
@@ -1067,7 +2849,8 @@ def create_output_file(errors, filename, validate_transfer_log=False, headers=No
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('path', help='Resolver path of the project')
-    parser.add_argument('metadata', help='tabular file containing metadata')
+    parser.add_argument('metadata', nargs='+',
+                        help='tabular file(s) containing metadata')
     parser.add_argument('config', help='YAML file to map the xnat metadata')
     parser.add_argument('--case_insensitive', action='store_true')
     parser.add_argument('--verbose', '-v', action='store_true')
@@ -1077,12 +2860,51 @@ if __name__ == '__main__':
                         help='Will not update validity of transfer log')
     parser.add_argument('--match-once', action='store_true',
                         help='Do not log errors for multiple container files matching fw row')
+    parser.add_argument('--shard-index', type=int, default=0,
+                        help='Index of the shard of subjects to reconcile on this node')
+    parser.add_argument('--shard-count', type=int, default=1,
+                        help='Number of shards to partition the subjects into')
+    parser.add_argument('--suggest', action='store_true',
+                        help='List the nearest records for records that match nothing')
+    parser.add_argument('--progress-interval', type=float,
+                        help='Seconds between progress reports (default 60)')
+    parser.add_argument('--status-file',
+                        help='Json file rewritten with the progress of every stage')
+    parser.add_argument('--checkpoint',
+                        help='Checkpoint the Flywheel fetch to this file and resume from it')
+    parser.add_argument('--save-snapshot',
+                        help='Save the fetched Flywheel records to this Parquet file')
+    parser.add_argument('--from-snapshot',
+                        help='Load the Flywheel records from this Parquet file instead of Flywheel')
+    parser.add_argument('--write-validity', action='store_true',
+                        help='Write info.transfer_log.valid on containers whose validity changed')
+    parser.add_argument('--validate-only', action='store_true',
+                        help='Only validate the transfer log, without contacting Flywheel')
+    parser.add_argument('--per-log', action='store_true',
+                        help='Write one output file per transfer log instead of a combined one')
+    parser.add_argument('--time-budget', type=float,
+                        help='Seconds after which a partial report is written')
+    parser.add_argument('--sample-size', type=int,
+                        help='Only reconcile a stratified random sample of this many subjects')
+    parser.add_argument('--sample-seed', type=int,
+                        help='Seed of the subject sample, for repeatable samples')
+    parser.add_argument('--targeted-fetch', action='store_true',
+                        help='Only fetch the subjects in the transfer log')
+    parser.add_argument('--transport', choices=VIEW_TRANSPORTS, default=JSON_TRANSPORT,
+                        help='Format to read DataView rows in, csv is faster for wide views')
+    parser.add_argument('--rollup', action='store_true',
+                        help='Report unmatched subjects and sessions once instead of per record')
+    parser.add_argument('--error-state',
+                        help='sqlite database of previous errors, to report new, open '
+                             'and resolved errors')
     args = parser.parse_args()
     # Path may be fw://<group_id>/<project_label>
     path = args.path.split('//')[-1]
 
     # Create client
-    if args.api_key:
+    if args.validate_only or args.from_snapshot:
+        fw = None
+    elif args.api_key:
         fw = flywheel.Client(args.api_key)
     else:
         fw = flywheel.Client()
@@ -1099,15 +2921,52 @@ if __name__ == '__main__':
                              'case_insensitive': args.case_insensitive,
                              'template': args.config,
                              'transfer_log': args.metadata,
-                             'match_containers_once': args.match_once}
+                             'match_containers_once': args.match_once,
+                             'shard_index': args.shard_index,
+                             'shard_count': args.shard_count,
+                             'suggest_matches': args.suggest,
+                             'validate_only': args.validate_only,
+                             'write_validity': args.write_validity,
+                             'checkpoint': args.checkpoint,
+                             'progress_interval': args.progress_interval,
+                             'status_file': args.status_file,
+                             'time_budget': args.time_budget,
+                             'sample_size': args.sample_size,
+                             'sample_seed': args.sample_seed,
+                             'targeted_fetch': args.targeted_fetch,
+                             'view_transport': args.transport,
+                             'error_state': args.error_state,
+                             'rollup_errors': args.rollup}
+        # Stream the report unless it has to be split per transfer log
+        split_output = args.per_log and len(args.metadata) > 1 and not args.validate_only
+        stream_output = args.output and not split_output
         tl_error_df, tl_error_count = main(gear_context_dict,
                                            script_log_level,
                                            path,
-                                           dry_run=args.dry_run)
-        if args.output:
-            tl_error_df.to_csv(args.output, index=False)
-        else:
+                                           dry_run=args.dry_run,
+                                           save_snapshot=args.save_snapshot,
+                                           from_snapshot=args.from_snapshot,
+                                           output_path=args.output if stream_output else None)
+        if not args.output:
             print(tl_error_df)
+        elif split_output:
+            output_root, output_ext = report.split_report_extension(args.output)
+            log_outputs = list()
+            for source_log in args.metadata + [None]:
+                if source_log is None:
+                    log_error_df = tl_error_df[tl_error_df['source_log'].isnull()]
+                    source_name = 'flywheel'
+                else:
+                    log_error_df = tl_error_df[tl_error_df['source_log'] == source_log]
+                    source_name = os.path.splitext(os.path.basename(source_log))[0]
+                log_output = '{}-{}{}'.format(output_root, source_name, output_ext)
+                # Transfer logs of different directories may share a name
+                if log_output in log_outputs:
+                    log_output = '{}-{}-{}{}'.format(
+                        output_root, source_name, len(log_outputs), output_ext
+                    )
+                log_outputs.append(log_output)
+                write_error_report([log_error_df.drop(columns='source_log')], log_output)
     except TransferLogException as e:
         create_output_file(e.errors, 'error-transfer-log.csv',
                            validate_transfer_log=True)
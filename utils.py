@@ -1,5 +1,54 @@
+import datetime
+import functools
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import types
+import zlib
+
 import backoff
-import flywheel
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands in for a module that is only imported when one of its attributes
+        is first accessed, so heavy dependencies are not paid for by runs
+        that exit before using them
+
+    Args:
+        name (str): the absolute name of the module
+    """
+
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+        self._lock = threading.Lock()
+        self._module = None
+
+    def _load(self):
+        # Worker threads may touch the module for the first time together
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name):
+    """Returns the module called name if it is already imported, otherwise a
+        LazyModule that imports it on first use"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+flywheel = lazy_import('flywheel')
 
 
 def get_resolver_path(client, container):
@@ -40,6 +89,221 @@ def set_resolver_paths(error_containers, client):
         error_container['path'] = get_resolver_path(client, container)
 
 
+def configure_connection_pool(fw_client, pool_size):
+    """
+    Resizes the HTTP connection pool of fw_client so that pool_size threads
+        can share the client without discarding connections
+
+    Args:
+        fw_client (flywheel.Client): an instance of the Flywheel client
+        pool_size (int): the number of connections to keep per host
+    """
+    import requests
+
+    api_client = getattr(fw_client, 'api_client', None)
+    rest_client = getattr(api_client, 'rest_client', None)
+    session = getattr(rest_client, 'session', None)
+    if not isinstance(session, requests.Session):
+        return
+    for prefix in ['https://', 'http://']:
+        max_retries = session.get_adapter(prefix).max_retries
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            max_retries=max_retries
+        )
+        session.mount(prefix, adapter)
+
+
+class RateLimiter(object):
+    """
+    Spaces calls to wait() so that at most rate of them return per second,
+        across every thread sharing the limiter
+
+    Args:
+        rate (float): the maximum number of calls per second
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        """Blocks until the caller may make its call"""
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class ProgressReporter(object):
+    """
+    Logs the progress of a pipeline stage at most every interval seconds:
+        items done out of total, rows and bytes per second and an ETA. Each
+        report also rewrites the json status file, if one is configured, with
+        the latest status of every stage
+
+    Args:
+        stage (str): name of the stage, e.g. 'flywheel fetch'
+        total (int): number of items to process, None if unknown
+        unit (str): name of the items counted, e.g. 'subjects'
+        interval (float): seconds between reports, defaults to the interval
+            set by configure in the current thread
+        logger (logging.Logger): logger to report to, defaults to the root
+            logger
+
+    Attributes:
+        done (int): number of items processed
+        rows (int): number of rows received or processed
+        bytes_received (int): number of bytes received
+    """
+    default_interval = 60
+    # Each run configures the reporters of its own thread, so the runs of a
+    # batch keep their own interval, status file and stages
+    _run_config = threading.local()
+    _status_lock = threading.Lock()
+
+    def __init__(self, stage, total=None, unit='items', interval=None, logger=None):
+        self.stage = stage
+        self.total = total
+        self.unit = unit
+        run_config = self.get_run_config()
+        self.interval = run_config['interval'] if interval is None else interval
+        self.status_path = run_config['status_path']
+        self._statuses = run_config['statuses']
+        self.logger = logger or logging.getLogger()
+        self.done = 0
+        self.rows = 0
+        self.bytes_received = 0
+        self.start_time = time.monotonic()
+        self._last_report = self.start_time
+        self.report(finished=False)
+
+    @classmethod
+    def configure(cls, interval=None, status_path=None):
+        """Sets the report interval and the status file path of the reporters
+            created by the current thread, and starts a new list of stages"""
+        cls._run_config.config = {
+            'interval': cls.default_interval if interval is None else interval,
+            'status_path': status_path,
+            'statuses': dict()
+        }
+
+    @classmethod
+    def get_run_config(cls):
+        """Returns the configuration set by configure in the current thread"""
+        if not hasattr(cls._run_config, 'config'):
+            cls.configure()
+        return cls._run_config.config
+
+    def update(self, count=1, rows=0, bytes_received=0):
+        """Records progress and reports it if interval seconds have passed"""
+        self.done += count
+        self.rows += rows
+        self.bytes_received += bytes_received
+        if time.monotonic() - self._last_report >= self.interval:
+            self.report(finished=False)
+
+    def finish(self):
+        """Reports the final counts of the stage"""
+        self.report(finished=True)
+
+    def get_status(self, finished=False):
+        """Returns the progress of the stage as a json serializable dict"""
+        elapsed = time.monotonic() - self.start_time
+        eta = None
+        if self.total and self.done and not finished:
+            eta = elapsed / self.done * (self.total - self.done)
+        return {
+            'stage': self.stage,
+            'unit': self.unit,
+            'done': self.done,
+            'total': self.total,
+            'rows': self.rows,
+            'bytes_received': self.bytes_received,
+            'elapsed_seconds': round(elapsed, 1),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else None,
+            'eta_seconds': None if eta is None else round(eta, 1),
+            'finished': finished
+        }
+
+    def report(self, finished=False):
+        """Logs the status of the stage and writes the status file"""
+        self._last_report = time.monotonic()
+        status = self.get_status(finished)
+        message = '%s: %s%s %s, %s rows (%s rows/s)'
+        args = [
+            self.stage, status['done'],
+            '' if self.total is None else '/{}'.format(self.total),
+            self.unit, status['rows'], status['rows_per_second']
+        ]
+        if self.bytes_received:
+            message += ', %.1f MB received'
+            args.append(self.bytes_received / 1e6)
+        if status['eta_seconds'] is not None:
+            message += ', ETA %s'
+            args.append(datetime.timedelta(seconds=int(status['eta_seconds'])))
+        if finished:
+            message += ', done in %.1fs'
+            args.append(status['elapsed_seconds'])
+        self.logger.info(message, *args)
+        if self.status_path:
+            self.write_status(status)
+
+    def write_status(self, status):
+        with self._status_lock:
+            self._statuses[status['stage']] = status
+            status_doc = {
+                'updated': datetime.datetime.utcnow().isoformat(),
+                'stages': list(self._statuses.values())
+            }
+            # Replace the file at once so readers never see a partial write
+            tmp_path = '{}.tmp'.format(self.status_path)
+            with open(tmp_path, 'w') as fp:
+                json.dump(status_doc, fp, indent=2)
+            os.replace(tmp_path, self.status_path)
+
+
+def get_subject_shard(subject_label, shard_count):
+    """
+    Assigns a subject label to one of shard_count shards. The assignment only
+        depends on the label, so it is the same on every node and every run
+
+    Args:
+        subject_label (str): a normalized subject label
+        shard_count (int): the total number of shards
+
+    Returns:
+        int: the shard index in range(shard_count)
+    """
+    label_bytes = str(subject_label or '').encode('utf-8')
+    return zlib.crc32(label_bytes) % shard_count
+
+
+def get_analysis_label(error_count, timestamp=None, partial=False, sampled=False):
+    """
+    Formats the label set on the analysis after a successful run
+
+    Args:
+        error_count (int): the number of errors in the report
+        timestamp (datetime.datetime): time of the run, defaults to utcnow
+        partial (bool): if True, the report only covers part of the project
+        sampled (bool): if True, the report only covers a sample of subjects
+
+    Returns:
+        str: the analysis label
+    """
+    timestamp = timestamp or datetime.datetime.utcnow()
+    label = 'TRANSFER_ERROR_COUNT_{}_AT_{}'.format(error_count, timestamp)
+    if sampled:
+        label = 'SAMPLED_' + label
+    if partial:
+        label = 'PARTIAL_' + label
+    return label
+
+
 def false_if_status_gte_500(exception):
     """
     A giveup function to be passed as giveup parameer to  backoff.on_exception
@@ -56,8 +320,35 @@ def false_if_status_gte_500(exception):
     return True
 
 
-@backoff.on_exception(backoff.expo, flywheel.rest.ApiException,
-                      max_time=300, giveup=false_if_status_gte_500)
+def retry_on_server_error(func):
+    """
+    Decorates func to back off exponentially, for up to 5 minutes, while the
+        Flywheel API responds with a status >= 500
+
+    The backoff decorator is only built on the first call, so decorating a
+    function does not import the Flywheel SDK.
+
+    Args:
+        func (function): a function that calls the Flywheel API
+
+    Returns:
+        function: the retrying function
+    """
+    retrying_func = list()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not retrying_func:
+            retrying_func.append(backoff.on_exception(
+                backoff.expo, flywheel.rest.ApiException,
+                max_time=300, giveup=false_if_status_gte_500
+            )(func))
+        return retrying_func[0](*args, **kwargs)
+
+    return wrapper
+
+
+@retry_on_server_error
 def get_resolver_path_for_id(container_id, fw_client):
     if container_id:
         try:
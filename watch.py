@@ -0,0 +1,291 @@
+#!/usr/bin/python3
+"""Keeps a project's Flywheel records in memory and re-runs the transfer log
+report whenever the transfer log changes on disk or a poll interval elapses
+"""
+import argparse
+import logging
+import os
+import time
+
+import flywheel
+
+import transfer_log as tl
+
+log = logging.getLogger('grp-5_transfer_log_report')
+
+
+# Container types whose fields a DataView row of each join carries, and which
+# are therefore versioned
+VERSIONED_CONTAINER_TYPES = ['subject', 'session', 'acquisition']
+
+
+def get_container_versions(fw_client, project_id, container_type):
+    """
+    Summarizes the containers of container_type of each subject in a project
+        from a single listing
+
+    Args:
+        fw_client (flywheel.Client): an instance of the flywheel client
+        project_id (str): id belonging to a Flywheel project
+        container_type (str): 'subject', 'session', or 'acquisition'
+
+    Returns:
+        dict: subject id: (container count, latest modified timestamp) pairs
+    """
+    finder = getattr(fw_client, '{}s'.format(container_type))
+    versions = dict()
+    for container in finder.iter_find('parents.project={}'.format(project_id)):
+        if container_type == 'subject':
+            subject_id = container.id
+        else:
+            subject_id = container.parents.subject
+        count, modified = versions.get(subject_id, (0, None))
+        if modified is None or (container.modified and container.modified > modified):
+            modified = container.modified
+        versions[subject_id] = (count + 1, modified)
+    return versions
+
+
+def get_subject_versions(fw_client, project_id, container_type):
+    """
+    Summarizes the state of each subject in a project: the containers of
+        container_type and of its parents down from the subject, since their
+        labels and timestamps are match columns too
+
+    Args:
+        fw_client (flywheel.Client): an instance of the flywheel client
+        project_id (str): id belonging to a Flywheel project
+        container_type (str): 'subject', 'session', or 'acquisition'
+
+    Returns:
+        dict: subject id: tuple of a (container count, latest modified
+            timestamp) pair per container type
+    """
+    container_types = VERSIONED_CONTAINER_TYPES[
+        :VERSIONED_CONTAINER_TYPES.index(container_type) + 1
+    ]
+    type_versions = [
+        get_container_versions(fw_client, project_id, versioned_type)
+        for versioned_type in container_types
+    ]
+    subject_ids = set().union(*type_versions)
+    return {
+        subject_id: tuple(versions.get(subject_id, (0, None)) for versions in type_versions)
+        for subject_id in subject_ids
+    }
+
+
+class TransferLogWatcher(object):
+    """
+    Re-runs the transfer log report against a warm in-memory copy of the
+        project, only fetching the subjects that changed in Flywheel
+
+    Args:
+        transfer_log (transfer_log.TransferLog): the TransferLog to keep loaded
+        output_path (str): path of the error report written after each run
+        poll_interval (float): seconds between checks for Flywheel changes
+
+    Attributes:
+        transfer_log (transfer_log.TransferLog): the TransferLog kept loaded
+        output_path (str): path of the error report written after each run
+        poll_interval (float): seconds between checks for Flywheel changes
+        subject_records (dict): subject id: raw dataview rows for the subject
+        subject_versions (dict): subject id: version as returned by
+            get_subject_versions when subject_records were fetched
+        subject_empty_containers (dict): subject id: ids of its containers
+            without files, scanned with subject_records
+        transfer_log_mtime (float): modification time of the transfer log
+            when it was last loaded
+    """
+
+    def __init__(self, transfer_log, output_path, poll_interval=300):
+        self.transfer_log = transfer_log
+        self.output_path = output_path
+        self.poll_interval = poll_interval
+        self.subject_records = dict()
+        self.subject_versions = dict()
+        self.subject_empty_containers = dict()
+        self.transfer_log_mtime = None
+        self._view = None
+        self._project = None
+
+    @property
+    def client(self):
+        return self.transfer_log.client
+
+    @property
+    def config(self):
+        return self.transfer_log.config
+
+    def get_transfer_log_mtime(self):
+        try:
+            return os.path.getmtime(self.transfer_log.transfer_log_path)
+        except OSError:
+            return None
+
+    def refresh_flywheel(self):
+        """
+        Fetches the dataview rows of subjects that were added or changed since
+            the last refresh and drops removed subjects
+
+        Returns:
+            bool: True if any subject was added, changed or removed
+        """
+        if self._project is None:
+            self._project = self.client.get_project(self.transfer_log.project_id)
+            self._view = tl.get_view_from_config(self.client, self.config)
+        subject_ids = set(
+            subject.id for subject in self._project.subjects.iter()
+            if self.transfer_log.flywheel_subject_in_scope(subject)
+        )
+        versions = get_subject_versions(
+            self.client, self.transfer_log.project_id, self.config.join
+        )
+        versions = {
+            subject_id: versions.get(subject_id) for subject_id in subject_ids
+        }
+        changed_ids = [
+            subject_id for subject_id, version in versions.items()
+            if subject_id not in self.subject_versions or
+            self.subject_versions[subject_id] != version
+        ]
+        removed_ids = set(self.subject_versions) - subject_ids
+        if not changed_ids and not removed_ids:
+            return False
+
+        log.info('Refreshing %s changed and %s removed subjects',
+                 len(changed_ids), len(removed_ids))
+        for subject_id in changed_ids:
+            self.subject_records[subject_id] = tl.get_data_list(
+                fw_client=self.client, data_view=self._view, container_id=subject_id,
+                transport=self.transfer_log.view_transport,
+                boolean_columns=tl.get_view_ignore_cols(self.config)
+            )
+            self.subject_empty_containers[subject_id] = self.transfer_log.get_empty_container_ids(
+                self.client, self.transfer_log.project_id, self.config.join,
+                subject_ids=[subject_id]
+            )
+            self.subject_versions[subject_id] = versions[subject_id]
+        for subject_id in removed_ids:
+            self.subject_records.pop(subject_id, None)
+            self.subject_empty_containers.pop(subject_id, None)
+            self.subject_versions.pop(subject_id, None)
+
+        # Rebuild the table from the rows held in memory
+        columns = tl.FlywheelColumns()
+        for rows in self.subject_records.values():
+            columns.extend(rows)
+        self.transfer_log.create_flywheel_df(columns.get_df())
+        self.transfer_log.get_path_dict(self._project)
+        self.transfer_log.empty_containers = [
+            container_id for container_ids in self.subject_empty_containers.values()
+            for container_id in container_ids
+        ]
+        return True
+
+    def reload_transfer_log(self):
+        """Loads the transfer log again if it changed on disk
+
+        Returns:
+            bool: True if the transfer log was reloaded
+        """
+        mtime = self.get_transfer_log_mtime()
+        if mtime is None or mtime == self.transfer_log_mtime:
+            return False
+        self.transfer_log_mtime = mtime
+        log.info('Loading transfer log records...')
+        self.transfer_log.metadata_table = list()
+        self.transfer_log.load_metadata_table()
+        return True
+
+    def run_once(self, refresh_flywheel=True):
+        """
+        Reloads whatever changed and re-runs the reconciliation
+
+        Args:
+            refresh_flywheel (bool): whether to check Flywheel for changes
+
+        Returns:
+            int: the error count, or None if nothing changed or the transfer
+                log is malformed
+        """
+        try:
+            log_changed = self.reload_transfer_log()
+        except tl.TransferLogException as exc:
+            error_path = os.path.join(
+                os.path.dirname(os.path.abspath(self.output_path)),
+                'error-transfer-log.csv'
+            )
+            tl.create_output_file(exc.errors, error_path, validate_transfer_log=True)
+            log.error('%s, see %s', exc, error_path)
+            return None
+        flywheel_changed = refresh_flywheel and self.refresh_flywheel()
+        if self.transfer_log.metadata_df is None:
+            return None
+        if not log_changed and not flywheel_changed:
+            return None
+
+        log.info('Matching Flywheel and transfer log records...')
+        self.transfer_log.match_df_records()
+        error_count = tl.write_error_report(
+            self.transfer_log.iter_error_dfs(), self.output_path
+        )
+        log.info('Wrote error report with %s errors to %s', error_count, self.output_path)
+        return error_count
+
+    def run(self, max_runs=None, check_interval=1):
+        """
+        Re-runs the reconciliation as soon as the transfer log changes and
+            every poll_interval seconds for Flywheel changes
+
+        Args:
+            max_runs (int): stop after this many checks, None to run until
+                interrupted
+            check_interval (float): seconds between checks of the transfer
+                log modification time
+        """
+        runs = 0
+        while max_runs is None or runs < max_runs:
+            self.run_once()
+            runs += 1
+            last_poll = time.monotonic()
+            while time.monotonic() - last_poll < self.poll_interval:
+                if self.get_transfer_log_mtime() != self.transfer_log_mtime:
+                    self.run_once(refresh_flywheel=False)
+                time.sleep(check_interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='Resolver path of the project')
+    parser.add_argument('metadata', help='tabular file containing metadata')
+    parser.add_argument('config', help='YAML file to map the xnat metadata')
+    parser.add_argument('--output', '-o', default='transfer-log-error-report.csv',
+                        help='Output file, rewritten after each run')
+    parser.add_argument('--poll-interval', type=float, default=300,
+                        help='Seconds between checks for changes in Flywheel')
+    parser.add_argument('--case_insensitive', action='store_true')
+    parser.add_argument('--match-once', action='store_true',
+                        help='Do not log errors for multiple container files matching fw row')
+    parser.add_argument('--verbose', '-v', action='store_true')
+    parser.add_argument('--api-key', help='Use if not logged in via cli')
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    log.setLevel('DEBUG' if args.verbose else 'INFO')
+    if args.api_key:
+        fw = flywheel.Client(args.api_key)
+    else:
+        fw = flywheel.Client()
+
+    project = fw.lookup(args.path.split('//')[-1])
+    watched_transfer_log = tl.TransferLog(
+        fw, tl.load_config_file(args.config), args.metadata, project.id,
+        case_insensitive=args.case_insensitive, match_containers_once=args.match_once
+    )
+    watcher = TransferLogWatcher(watched_transfer_log, args.output,
+                                 poll_interval=args.poll_interval)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        log.info('Stopped watching %s', args.metadata)